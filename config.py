@@ -1,12 +1,37 @@
 import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
 
 PDF_DIRECTORY = os.getenv("PDF_DIRECTORY", "default_pdf_dir")
 PDF_DIRECTORY='data/pdfs'
 MARKDOWN_DIRECTORY = os.getenv("MARKDOWN_DIRECTORY", "default_markdown_dir")
-API_KEY = os.environ["OPENAI_API_KEY"]
 DATA_PATH = "data" # adds mtg_rules.txt to db
 JSON_DIRECTORY = "data/jsons"
 CHROMA_PATH = "chroma"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma") # "chroma" or "numpy"
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", "numpy_index")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache")
+STORE_CHUNK_TEXT = os.getenv("STORE_CHUNK_TEXT", "1") != "0" # "0" keeps only embeddings and source offsets in the store
+TOP_K = 4 # chunks retrieved per query
+RELEVANCE_THRESHOLD = 0.7 # minimum relevance of the best chunk
+KEYWORD_TOKENS = 800 # token budget for keyword definitions matched in the question
+MIN_TOP_K = 2 # chunks still retrieved when a question only asks what its keywords mean
+EXPANSION_HOPS = 1 # cross-reference hops added to retrieved rules, 0 disables
+EXPANSION_TOKENS = 500 # token budget for cross-referenced rules
+CONTEXT_TOKENS = 2000 # token budget for the packed context
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache")
+ANSWER_CACHE_THRESHOLD = 0.95 # cosine similarity at which a cached answer is reused
+ANSWER_CACHE_TTL = 7 * 24 * 3600 # seconds before a cached answer expires
+ANSWER_CACHE_MAX_ENTRIES = 1000 # least recently used answers are dropped beyond this
+SOURCE_TIMEOUTS = {"rag": 60, "google": 45, "reddit": 45} # seconds each source gets in run_queries
+SOURCE_POLICY = os.getenv("SOURCE_POLICY", "always") # "always", "never" or "on_low_confidence"
+ROUTING_THRESHOLD = 0.8 # rules confidence at which the web sources are skipped
+WEB_SEARCH_MODE = os.getenv("WEB_SEARCH_MODE", "direct") # "direct" (one search + one LLM call) or "agent"
+REDDIT_SUBREDDITS = "mtgrules+magicTCG" # searched by the direct Reddit mode
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "4")) # questions answered at once by src/server.py
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "32")) # questions queued or running before the server answers 503
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8")) # questions answered at once in batch mode
 MARKDOWN_DIRECTORY='data/markdowns'
 PROMPT_TEMPLATE = """
         Answer the question based on the following context:
@@ -15,4 +40,50 @@ PROMPT_TEMPLATE = """
         ---
 
         Answer the question based on the above context: {query}
-    """
\ No newline at end of file
+    """
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Credentials, read from the environment (and .env) on first use rather than at import.
+    """
+    openai_api_key: Optional[str] = None
+    google_cse_id: Optional[str] = None
+    google_api_key: Optional[str] = None
+    reddit_client_id: Optional[str] = None
+    reddit_client_secret: Optional[str] = None
+    reddit_user_agent: Optional[str] = None
+
+    @classmethod
+    def from_env(cls):
+        try:
+            from dotenv import load_dotenv
+            load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+        except ImportError:
+            pass
+        return cls(
+            openai_api_key=os.environ.get("OPENAI_API_KEY"),
+            google_cse_id=os.environ.get("GOOGLE_CSE_ID"),
+            google_api_key=os.environ.get("GOOGLE_API_KEY"),
+            reddit_client_id=os.environ.get("REDDIT_CLIENT_ID"),
+            reddit_client_secret=os.environ.get("REDDIT_CLIENT_SECRET"),
+            reddit_user_agent=os.environ.get("REDDIT_USER_AGENT"),
+        )
+
+    def require(self, name):
+        value = getattr(self, name)
+        if not value:
+            raise RuntimeError(f"{name.upper()} is not set; add it to the environment or .env.")
+        return value
+
+
+@lru_cache(maxsize=None)
+def get_settings():
+    return Settings.from_env()
+
+
+def __getattr__(name):
+    # API_KEY is resolved on first access so importing config never needs credentials
+    if name == "API_KEY":
+        return get_settings().require("openai_api_key")
+    raise AttributeError(f"module 'config' has no attribute '{name}'")
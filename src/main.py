@@ -1,75 +1,419 @@
 import os
 import sys
-from dotenv import load_dotenv
+import time
+import queue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # Add paths for utilities and source files
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from query_database_rag import query_rag_db
-from query_google import query_google
-from query_reddit import query_reddit
-from create_database_rag import create_database
+# Only light modules are imported here; each source imports its LangChain
+# stack when it first runs, so --help and cached answers start fast
+from source_router import ROUTING_POLICIES, route_sources
+from http_clients import close_clients
+from batch_queries import read_questions, run_batch
+from tracing import propagate, span, start_span
+from config import (
+    BATCH_CONCURRENCY, DATA_PATH, EMBEDDING_CACHE_PATH, JSON_DIRECTORY, ROUTING_THRESHOLD, SOURCE_POLICY,
+    SOURCE_TIMEOUTS, STORE_CHUNK_TEXT, VECTOR_BACKEND, get_settings,
+)
 
-# Define API keys and environment variables
-dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-load_dotenv(dotenv_path)
+RESULT_NAMES = {"rag": "RAG_DB_Result", "google": "Google_Search_Result", "reddit": "Reddit_Search_Result"}
+# Sources run on their own threads; a timed-out source finishes in the background.
+# Callers answering several questions at once pass an executor with
+# len(RESULT_NAMES) workers per concurrent question (see source_executor).
+_source_executor = ThreadPoolExecutor(max_workers=2 * len(RESULT_NAMES))
+# Moving average of each source's latency, used to report the time saved by routing
+_source_seconds = {}
 
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-GOOGLE_CSE_ID = os.environ.get("GOOGLE_CSE_ID")
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-REDDIT_CLIENT_ID = os.environ.get("REDDIT_CLIENT_ID")
-REDDIT_CLIENT_SECRET = os.environ.get("REDDIT_CLIENT_SECRET")
-REDDIT_USER_AGENT = os.environ.get("REDDIT_USER_AGENT")
+def source_executor(concurrency):
+    """
+    Return an executor sized so that concurrency questions can run all their
+    sources at once, without a source waiting (and eating into its deadline)
+    behind another question's.
+    """
+    return ThreadPoolExecutor(max_workers=len(RESULT_NAMES) * concurrency)
+
+def timed(run):
+    """
+    Call run() and return (result, seconds taken).
+    """
+    started = time.perf_counter()
+    result = run()
+    return result, time.perf_counter() - started
+
+def source_runners(query_text, rag_details=None):
+    """
+    Return {source name: function answering query_text from that source}.
+    rag_details is passed on to the RAG query (see JudgeRetriever.query).
+    """
+    settings = get_settings()
+
+    def run_rag():
+        from query_database_rag import query_rag_db
+        return query_rag_db(query_text=query_text, details=rag_details)
+
+    def run_google():
+        from query_google import query_google
+        return query_google(
+            openai_api_key=settings.openai_api_key,
+            google_cse_id=settings.google_cse_id,
+            google_api_key=settings.google_api_key,
+            query_text=query_text
+        )
+
+    def run_reddit():
+        from query_reddit import query_reddit
+        return query_reddit(
+            openai_api_key=settings.openai_api_key,
+            reddit_client_id=settings.reddit_client_id,
+            reddit_client_secret=settings.reddit_client_secret,
+            reddit_user_agent=settings.reddit_user_agent,
+            query_text=query_text
+        )
+
+    return {"rag": run_rag, "google": run_google, "reddit": run_reddit}
+
+def run_source(name, run):
+    """
+    timed(run) inside a span for the source.
+    """
+    with span("source", source=name):
+        return timed(run)
+
+def record_seconds(name, seconds):
+    _source_seconds[name] = 0.8 * _source_seconds.get(name, seconds) + 0.2 * seconds
+
+def query_sources(query_text, timeouts=SOURCE_TIMEOUTS, names=tuple(RESULT_NAMES), executor=None, details=None):
+    """
+    Query the RAG DB, Google Search and Reddit Search (or the given names) concurrently.
+    Each source has its own deadline in seconds, counted from the start of
+    the call. A source that times out or raises is reported in statuses
+    instead of failing the others. Sources run on executor (default: a
+    small shared one).
+    details, when given, is filled in with "seconds" per finished source and
+    "sources", the (doc, score) pairs the RAG answer's context used.
+    Returns (results, statuses), both keyed by source name.
+    """
+    executor = executor or _source_executor
+    rag_details = {}
+    sources = source_runners(query_text, rag_details=rag_details)
+    print(f"\nQuerying {', '.join(names)} concurrently...\n")
+    started = time.monotonic()
+    futures = {name: executor.submit(propagate(run_source), name, sources[name]) for name in names}
+
+    results, statuses, source_seconds = {}, {}, {}
+    # Earliest deadline first, so a source still queued is cancelled before it starts
+    for name, future in sorted(futures.items(), key=lambda item: timeouts[item[0]]):
+        remaining = started + timeouts[name] - time.monotonic()
+        try:
+            results[name], seconds = future.result(timeout=max(remaining, 0))
+            statuses[name] = "ok"
+            source_seconds[name] = round(seconds, 4)
+            record_seconds(name, seconds)
+            print(f"{name} finished in {seconds:.1f}s.")
+        except FuturesTimeoutError:
+            future.cancel()
+            statuses[name] = f"timed out after {timeouts[name]}s"
+            print(f"{name} {statuses[name]}.")
+        except Exception as e:
+            statuses[name] = f"failed: {e}"
+            print(f"{name} {statuses[name]}")
+    print(f"\nAll sources done in {time.monotonic() - started:.1f}s.\n")
+    statuses = {name: statuses[name] for name in names}
+    if details is not None:
+        # A timed-out RAG answer may still be filling rag_details in the background
+        details.update(seconds=source_seconds, sources=list(rag_details.get("sources", [])) if statuses.get("rag") == "ok" else [])
+    return results, statuses
+
+def plan_sources(query_text, policy=SOURCE_POLICY, query_embedding=None, retrieved=None):
+    """
+    Embed the question, check the combined answer cache and route it.
+    Rule lookups ("what does 702.19c say") are neither embedded nor cached.
+    query_embedding and retrieved may come from embed_queries/retrieve_batch;
+    the RAG source then answers from retrieved instead of searching again.
+    Returns (retriever, query_embedding, cached answer or None, sources to query, skipped sources, reason).
+    """
+    from query_database_rag import get_retriever
+    retriever = get_retriever()
+    if retriever.is_rule_lookup(query_text):
+        query_embedding = None
+    else:
+        if query_embedding is None:
+            query_embedding = retriever.embed_query(query_text)
+        cached = retriever.cached_answer(query_text, query_embedding, namespace="combined")
+        if cached is not None:
+            return retriever, query_embedding, cached, (), [], "cached"
+
+    # Route: skip the web agents when the rules corpus already covers the question.
+    # The RAG answer reuses this retrieval (JudgeRetriever.take_retrieval).
+    confidence = None
+    if policy == "on_low_confidence":
+        confidence = retriever.retrieval_confidence(query_text, query_embedding, retrieved)
+    elif retrieved is not None:
+        retriever.keep_retrieval(query_text, retrieved)
+    names, reason = route_sources(query_text, policy=policy, confidence=confidence, threshold=ROUTING_THRESHOLD)
+    skipped = [name for name in RESULT_NAMES if name not in names]
+    if skipped:
+        web_seconds = max((_source_seconds[name] for name in skipped if name in _source_seconds), default=None)
+        saved = "" if web_seconds is None else f", saving ~{max(0.0, web_seconds - _source_seconds.get('rag', 0.0)):.1f}s"
+        print(f"\nRouting: skipping {', '.join(skipped)} ({reason}){saved}.\n")
+    else:
+        print(f"\nRouting: querying all sources ({reason}).\n")
+    return retriever, query_embedding, None, names, skipped, reason
+
+def failed_sources(statuses):
+    """
+    Return the statuses of sources that timed out or failed; skipped ones do not count.
+    """
+    return {name: status for name, status in statuses.items() if status != "ok" and not status.startswith("skipped")}
+
+def combine_results(results, statuses):
+    """
+    Join the per-source answers into one text, noting any source that did not answer.
+    """
+    combined_results_dict = {
+        RESULT_NAMES[name]: results[name] if statuses[name] == "ok" else f"[{statuses[name]}]"
+        for name in RESULT_NAMES
+    }
+
+    # Return combined results as paragraph:
+
+    return "\n\n".join([f"**{key}**:\n{value}" for key, value in combined_results_dict.items()])
 
-def run_queries(query_text, refresh_db=False):
+def refresh_database():
     """
-    Run queries on RAG DB, Google Search, and Reddit Search.
+    Bring the RAG store up to date with the configured data paths, then
+    close the process-wide retriever so the next query opens the new store.
+    """
+    from create_database_rag import create_database
+    from query_database_rag import get_retriever, resolve_store_path
+
+    create_database(
+        DATA_PATH,
+        JSON_DIRECTORY,
+        resolve_store_path(backend=VECTOR_BACKEND),
+        get_settings().require("openai_api_key"),
+        embedding_cache_path=EMBEDDING_CACHE_PATH,
+        backend=VECTOR_BACKEND,
+        store_text=STORE_CHUNK_TEXT)
+    get_retriever().close()
+
+def run_queries(query_text, refresh_db=False, policy=SOURCE_POLICY, executor=None, query_embedding=None, retrieved=None, details=None):
+    """
+    Run queries on RAG DB, Google Search, and Reddit Search concurrently.
     Optionally refresh the RAG DB before querying.
+    policy decides when the web sources run (see route_sources); with
+    "on_low_confidence" they are skipped when rules retrieval is confident.
+    Combined results are cached by query embedding, so a rephrased repeat
+    question returns without running any source. Sources run on executor;
+    query_embedding and retrieved are passed to plan_sources.
+    details, when given, is filled in with "cached", each source's "statuses"
+    and the "seconds" and "sources" from query_sources.
     """
 
     # Optionally refresh the RAG database
     if refresh_db:
         print("\nRefreshing the RAG database...\n")
-        create_database()
-
-    # Query RAG database
-    print("\nQuerying the RAG database...\n")
-    result_rag = query_rag_db(query_text=query_text)
-
-    # Query Google Search
-    print("\nQuerying Google Search...\n")
-    result_google = query_google(
-        openai_api_key=OPENAI_API_KEY, 
-        google_cse_id=GOOGLE_CSE_ID, 
-        google_api_key=GOOGLE_API_KEY, 
-        query_text=query_text
-    )
-
-    # Query Reddit Search
-    print("\nQuerying Reddit Search...\n")
-    result_reddit = query_reddit(
-        openai_api_key=OPENAI_API_KEY,
-        reddit_client_id=REDDIT_CLIENT_ID,
-        reddit_client_secret=REDDIT_CLIENT_SECRET,
-        reddit_user_agent=REDDIT_USER_AGENT,
-        query_text=query_text
-    )
-
-    # Combine results from all sources
-    combined_results_dict = {
-        "RAG_DB_Result": result_rag,
-        "Google_Search_Result": result_google,
-        "Reddit_Search_Result": result_reddit,
-    }
+        refresh_database()
 
-    # Return combined results as paragraph:
+    with span("run_queries", policy=policy):
+        retriever, query_embedding, cached, names, skipped, reason = plan_sources(
+            query_text, policy, query_embedding=query_embedding, retrieved=retrieved)
+        if cached is not None:
+            if details is not None:
+                details.update(cached=True, statuses={}, seconds={}, sources=[])
+            return cached
 
-    combined_results = "\n\n".join([f"**{key}**:\n{value}" for key, value in combined_results_dict.items()])
+        source_details = {}
+        results, statuses = query_sources(query_text, names=names, executor=executor, details=source_details)
+        statuses.update({name: f"skipped: {reason}" for name in skipped})
+        if details is not None:
+            details.update(cached=False, statuses=dict(statuses), **source_details)
+
+        combined_results = combine_results(results, statuses)
+        if not failed_sources(statuses):
+            retriever.remember_answer(query_text, query_embedding, combined_results, namespace="combined")
 
-    
     return combined_results
 
+def run_batch_queries(input_path, output_path, policy=SOURCE_POLICY, concurrency=BATCH_CONCURRENCY):
+    """
+    Run run_queries over every question in input_path (JSONL or one question
+    per line), concurrency questions at a time, appending the combined
+    answers to output_path as JSONL, with each source's status and seconds
+    and the RAG sources and scores. All questions are embedded in one
+    batched call and retrieved in one vector search pass first; routing and
+    the RAG answers reuse that retrieval.
+    A question where a source timed out or failed is written as an error,
+    so rerunning with the same output_path retries it along with any
+    questions an interrupted batch never reached.
+    """
+    from query_database_rag import describe_sources, get_retriever
+    retriever = get_retriever()
+
+    def prepare(questions):
+        return retriever.prepare_batch([question["query_text"] for question in questions])
+
+    with source_executor(concurrency) as executor:
+        def answer(question, item):
+            details = {}
+            combined_results = run_queries(question["query_text"], policy=policy, executor=executor, details=details, **item)
+            record = {
+                "answer": combined_results,
+                "cached": details["cached"],
+                "statuses": details["statuses"],
+                "sources": describe_sources(details["sources"]),
+                "timings": {f"{name}_seconds": seconds for name, seconds in details["seconds"].items()},
+            }
+            failed = failed_sources(details["statuses"])
+            if failed:
+                record["error"] = "; ".join(f"{name} {status}" for name, status in failed.items())
+            return record
+
+        return run_batch(read_questions(input_path), answer, output_path, concurrency=concurrency, prepare=prepare)
+
+def stream_queries(query_text, policy=SOURCE_POLICY, timeouts=SOURCE_TIMEOUTS, executor=None):
+    """
+    Streaming run_queries: a generator of events as they happen.
+    {"source": "rag", "type": "token", "text": ...} for each piece of the RAG answer;
+    {"source": name, "type": "result", "status": ..., "text": ...} when a source
+    finishes, fails or passes its deadline (source "cache" for a cached answer);
+    and last {"type": "done", "ttft": ..., "seconds": ...}, where ttft is the
+    time to the first text shown to the user.
+    """
+    executor = executor or _source_executor
+    trace = start_span("stream_queries", policy=policy)
+    try:
+        started = time.monotonic()
+        retriever, query_embedding, cached, names, skipped, reason = propagate(plan_sources, trace)(query_text, policy)
+        if cached is not None:
+            ttft = time.monotonic() - started
+            yield {"source": "cache", "type": "result", "status": "ok", "text": cached}
+            print(f"\nFirst token after {ttft:.2f}s (cached).\n")
+            trace.set(ttft=ttft, cached=True)
+            yield {"type": "done", "ttft": ttft, "seconds": ttft}
+            return
+
+        # Every source reports into one queue: RAG per token, web sources once
+        events = queue.Queue()
+
+        def run_rag():
+            rag_started = time.perf_counter()
+            try:
+                for piece in retriever.stream(query_text):
+                    events.put(("rag", "token", piece))
+            except Exception as e:
+                events.put(("rag", f"failed: {e}", None))
+                return
+            record_seconds("rag", time.perf_counter() - rag_started)
+            events.put(("rag", "ok", None))
+
+        runners = source_runners(query_text)
+        print(f"\nStreaming {', '.join(names)}...\n")
+        for name in names:
+            if name == "rag":
+                executor.submit(propagate(run_source, trace), "rag", run_rag)
+            else:
+                future = executor.submit(propagate(run_source, trace), name, runners[name])
+                future.add_done_callback(lambda future, name=name: events.put((name, "done", future)))
+
+        results, statuses = {}, {name: f"skipped: {reason}" for name in skipped}
+        rag_parts = []
+        pending = set(names)
+        ttft = None
+        while pending:
+            remaining = min(started + timeouts[name] for name in pending) - time.monotonic()
+            try:
+                name, kind, value = events.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                for name in [name for name in pending if started + timeouts[name] <= time.monotonic()]:
+                    pending.discard(name)
+                    statuses[name] = f"timed out after {timeouts[name]}s"
+                    print(f"{name} {statuses[name]}.")
+                    yield {"source": name, "type": "result", "status": statuses[name], "text": ""}
+                continue
+            if name not in pending:
+                # Arrived after its deadline
+                continue
+            if kind == "token":
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                rag_parts.append(value)
+                yield {"source": "rag", "type": "token", "text": value}
+                continue
+
+            pending.discard(name)
+            if name == "rag":
+                statuses[name] = kind
+                if kind == "ok":
+                    results[name] = "".join(rag_parts)
+            else:
+                try:
+                    results[name], seconds = value.result()
+                    statuses[name] = "ok"
+                    record_seconds(name, seconds)
+                except Exception as e:
+                    statuses[name] = f"failed: {e}"
+            if ttft is None and results.get(name):
+                ttft = time.monotonic() - started
+            yield {"source": name, "type": "result", "status": statuses[name], "text": results.get(name, "")}
+
+        seconds = time.monotonic() - started
+        if ttft is not None:
+            print(f"\nFirst token after {ttft:.2f}s, all sources done after {seconds:.2f}s.\n")
+        if not failed_sources(statuses):
+            retriever.remember_answer(query_text, query_embedding, combine_results(results, statuses), namespace="combined")
+        trace.set(ttft=ttft)
+        yield {"type": "done", "ttft": ttft, "seconds": seconds}
+    finally:
+        trace.end()
+
+def iterate_async(make_iterator, submit=None):
+    """
+    Run a blocking iterator on a worker thread and return an async iterator over its items.
+    submit(fn) schedules fn on a thread (default: the event loop's executor);
+    it is called right away, so errors such as a full queue raise here.
+    Must be called from a running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    finished = object()
+
+    def produce():
+        try:
+            for item in make_iterator():
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(items.put_nowait, finished)
+
+    if submit is None:
+        loop.run_in_executor(None, produce)
+    else:
+        submit(produce)
+
+    async def consume():
+        while True:
+            item = await items.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    return consume()
+
+def astream_queries(query_text, policy=SOURCE_POLICY, submit=None, executor=None):
+    """
+    Async iterator over the events of stream_queries.
+    """
+    return iterate_async(lambda: stream_queries(query_text, policy=policy, executor=executor), submit=submit)
+
 if __name__ == "__main__":
     import argparse
 
@@ -91,9 +435,20 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Query multiple sources with a string or file.")
     parser.add_argument("--query_text", type=str, help="The text query to be used.")
     parser.add_argument("--file_path", type=str, help="Path to the file containing the query.")
+    parser.add_argument("--policy", choices=ROUTING_POLICIES, default=SOURCE_POLICY, help="When to query the web sources.")
+    parser.add_argument("--stream", action='store_true', help="Print the RAG answer as it is generated and each web result as soon as it arrives.")
+    parser.add_argument("--batch_file", type=str, help="JSONL or text file of questions, one per line, answered in batch mode.")
+    parser.add_argument("--output", type=str, help="JSONL file batch answers are appended to (default: <batch_file>.answers.jsonl).")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Questions in flight in batch mode.")
 
     args = parser.parse_args()
 
+    if args.batch_file:
+        output = args.output or os.path.splitext(args.batch_file)[0] + ".answers.jsonl"
+        run_batch_queries(args.batch_file, output, policy=args.policy, concurrency=args.concurrency)
+        close_clients()
+        sys.exit(0)
+
     # Determine the query text
     if args.query_text:
         query_text = args.query_text
@@ -103,11 +458,23 @@ if __name__ == "__main__":
     else:
         query_text = input("Please enter your query: ")
 
-    # Run all queries and combine results
-    results = run_queries(query_text=query_text, refresh_db=False)
+    if args.stream:
+        # Print each source as it answers; the RAG answer token by token
+        for event in stream_queries(query_text=query_text, policy=args.policy):
+            if event["type"] == "token":
+                print(event["text"], end="", flush=True)
+            elif event["type"] == "result" and event["source"] == "rag":
+                print(f"\n[rag: {event['status']}]\n" if event["status"] != "ok" else "\n", flush=True)
+            elif event["type"] == "result":
+                label = RESULT_NAMES.get(event["source"], "Cached_Result")
+                print(f"\n**{label}** ({event['status']}):\n{event['text']}\n", flush=True)
+    else:
+        # Run all queries and combine results
+        results = run_queries(query_text=query_text, refresh_db=False, policy=args.policy)
 
-    # Print combined results
-    print("\nCombined Results:\n", results)
+        # Print combined results
+        print("\nCombined Results:\n", results)
+    close_clients()
 
 # python src/main.py
 
@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+# Add paths for utilities and source files
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from main import RESULT_NAMES, astream_queries, query_sources, run_queries, source_executor
+from source_router import ROUTING_POLICIES
+from config import SERVER_QUEUE_SIZE, SERVER_WORKERS, SOURCE_POLICY, get_settings
+
+
+class QueueFull(Exception):
+    pass
+
+
+class CoalescingPool:
+    """
+    Bounded worker pool for blocking question handlers.
+
+    At most max_pending requests are queued or running; beyond that submit()
+    raises QueueFull so the server can shed load instead of queueing without
+    bound. A request identical to one already in flight (same key) shares its
+    future instead of running again.
+    """
+
+    def __init__(self, max_workers=SERVER_WORKERS, max_pending=SERVER_QUEUE_SIZE):
+        self.max_pending = max_pending
+        self.pending = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        """
+        Return a concurrent.futures.Future for fn(*args), shared by identical keys.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull()
+            self.pending += 1
+            future = self._executor.submit(fn, *args)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._finish(key))
+        return future
+
+    def _finish(self, key):
+        with self._lock:
+            self.pending -= 1
+            self._in_flight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class QueryRequest(BaseModel):
+    query_text: str
+    policy: Optional[str] = None
+
+
+def normalize(query_text):
+    """
+    Key for coalescing: identical questions up to case and whitespace.
+    """
+    return " ".join(query_text.lower().split())
+
+
+def warm_up():
+    """
+    Open the index, caches and clients once, before the first request.
+    Web sources are only warmed when their credentials are configured.
+    """
+    from query_database_rag import get_retriever
+
+    settings = get_settings()
+    get_retriever().warm_up()
+    if settings.google_cse_id and settings.google_api_key:
+        from query_google import get_google_source
+        get_google_source(settings.openai_api_key, settings.google_cse_id, settings.google_api_key).warm_up()
+    if settings.reddit_client_id and settings.reddit_client_secret:
+        from query_reddit import get_reddit_source
+        get_reddit_source(
+            settings.openai_api_key, settings.reddit_client_id,
+            settings.reddit_client_secret, settings.reddit_user_agent).warm_up()
+
+
+pool = CoalescingPool()
+# Every question the pool runs fans out to up to len(RESULT_NAMES) sources at once
+sources = source_executor(SERVER_WORKERS)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    yield
+    pool.shutdown()
+    sources.shutdown(wait=False, cancel_futures=True)
+    from http_clients import close_clients
+    close_clients()
+
+
+app = FastAPI(title="MTG Judge", lifespan=lifespan)
+
+
+async def run_pooled(key, fn):
+    """
+    Run fn() on the worker pool, sharing the result with identical in-flight requests.
+    """
+    try:
+        future = pool.submit(key, fn)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Too many questions in progress, retry shortly.", headers={"Retry-After": "1"})
+    return await asyncio.wrap_future(future)
+
+
+def check_policy(policy):
+    if policy not in ROUTING_POLICIES:
+        raise HTTPException(status_code=422, detail=f"policy must be one of {', '.join(ROUTING_POLICIES)}")
+
+
+@app.post("/query")
+async def query(request: QueryRequest):
+    """
+    Answer from every source selected by the routing policy (see run_queries).
+    """
+    policy = request.policy or SOURCE_POLICY
+    check_policy(policy)
+    key = ("query", policy, normalize(request.query_text))
+    answer = await run_pooled(key, lambda: run_queries(request.query_text, policy=policy, executor=sources))
+    return {"answer": answer}
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """
+    Server-sent events: each RAG answer token, then each source's result as
+    soon as it completes (see stream_queries), ending with a "done" event.
+    Streams are not coalesced but count against the pool's queue.
+    """
+    policy = request.policy or SOURCE_POLICY
+    check_policy(policy)
+    try:
+        # Unique key: every stream gets its own producer
+        events = astream_queries(
+            request.query_text, policy=policy, executor=sources,
+            submit=lambda fn: pool.submit(("stream", object()), fn))
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Too many questions in progress, retry shortly.", headers={"Retry-After": "1"})
+
+    async def sse():
+        try:
+            async for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.post("/sources/{name}")
+async def query_source(name: str, request: QueryRequest):
+    """
+    Answer from a single source: rag, google or reddit.
+    """
+    if name not in RESULT_NAMES:
+        raise HTTPException(status_code=404, detail=f"Unknown source: {name}")
+    key = ("source", name, normalize(request.query_text))
+    results, statuses = await run_pooled(key, lambda: query_sources(request.query_text, names=(name,), executor=sources))
+    return {"source": name, "status": statuses[name], "answer": results.get(name)}
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "pool": pool.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Per-stage latency histograms and counters in Prometheus text format.
+    Empty unless tracing is enabled (TRACING=1, TRACE_PATH or METRICS_PATH).
+    """
+    from tracing import metrics_text
+    return PlainTextResponse(metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the judge over HTTP with warm indexes and clients.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to bind.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+
+    args = parser.parse_args()
+
+    # A single process keeps one warm copy of the index and caches
+    uvicorn.run(app, host=args.host, port=args.port, workers=1)
+
+# python src/server.py --port 8000
+# curl -X POST localhost:8000/query -H 'Content-Type: application/json' -d '{"query_text": "Does deathtouch with trample need to assign 1 damage?"}'
+# curl -N -X POST localhost:8000/query/stream -H 'Content-Type: application/json' -d '{"query_text": "Does deathtouch with trample need to assign 1 damage?"}'
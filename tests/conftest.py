@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+for path in (ROOT, os.path.join(ROOT, "utils"), os.path.join(ROOT, "src")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+# A few rules of each kind, with cross-references that form a cycle
+SAMPLE_RULES = """Magic: The Gathering Comprehensive Rules
+
+Contents
+
+1. Game Concepts
+100. General
+7. Additional Rules
+702. Keyword Abilities
+Glossary
+Credits
+
+1. Game Concepts
+
+100. General
+
+100.1. These Magic rules apply to any Magic game with two or more players.
+
+100.1a A two-player game is a game that begins with only two players.
+Example: a game of Magic between two friends.
+
+100.1b. A multiplayer game is a game that begins with more than two players. See rule 702.19e.
+
+100.2 To play, each player needs their own deck. See rule 702.
+
+7. Additional Rules
+
+702. Keyword Abilities
+
+702.2. Deathtouch
+
+702.2a Deathtouch is a static ability. See rule 702.19e.
+
+702.19. Trample
+
+702.19a Trample is a static ability that modifies the rules for assigning an
+attacking creature's combat damage.
+
+702.19e If there are no creatures blocking it, all its damage is assigned to the player. See rule 702.2a.
+
+Glossary
+
+Deathtouch
+A keyword ability that causes damage dealt by an object to be especially effective.
+See rule 702.2, "Deathtouch."
+
+Trample
+A keyword ability that lets a creature deal excess combat damage. See rule 702.19, "Trample."
+
+Credits
+
+Magic: The Gathering Original Game Design: Richard Garfield
+"""
+
+
+@pytest.fixture(scope="session")
+def sample_rules():
+    return SAMPLE_RULES
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import query_database_rag
+from answer_cache import SemanticAnswerCache, corpus_version
+from query_database_rag import JudgeRetriever
+from rules_index import RulesIndex
+
+RULES_PATH = os.path.join(os.path.dirname(__file__), os.path.pardir, "data", "mtg_rules.txt")
+
+
+def test_anchors_keep_near_identical_questions_apart(tmp_path):
+    cache = SemanticAnswerCache(str(tmp_path))
+    cache.store("what does 702.19b say", [1.0, 0.0], "answer about b", anchors="702.19b")
+    assert cache.lookup([1.0, 0.0], anchors="702.19c") is None
+    assert cache.lookup([1.0, 0.01], anchors="702.19b") == "answer about b"
+    cache.close()
+
+
+def test_cache_without_anchors_column_is_upgraded(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "answers.sqlite"))
+    conn.execute(
+        "CREATE TABLE answers (id INTEGER PRIMARY KEY, namespace TEXT NOT NULL, corpus_version TEXT NOT NULL, "
+        "query TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+    cache = SemanticAnswerCache(str(tmp_path))
+    cache.store("q", [1.0, 0.0], "a", anchors="trample")
+    assert cache.lookup([1.0, 0.0], anchors="trample") == "a"
+    cache.close()
+
+
+def test_corpus_version_follows_manifest_changes(tmp_path):
+    assert corpus_version(str(tmp_path)) == ""
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text('{"sources": {}}')
+    first = corpus_version(str(tmp_path))
+    assert first and corpus_version(str(tmp_path)) == first
+    manifest.write_text('{"sources": {"a": {}}}')
+    os.utime(manifest, ns=(time.time_ns() + 10**9,) * 2)
+    assert corpus_version(str(tmp_path)) not in ("", first)
+
+
+@pytest.fixture
+def retriever(tmp_path, monkeypatch):
+    with open(RULES_PATH, encoding="utf-8") as file:
+        RulesIndex.build(file.read(), "mtg_rules.txt").save(str(tmp_path / "store"))
+    monkeypatch.setattr(query_database_rag, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings"))
+    monkeypatch.setattr(query_database_rag, "ANSWER_CACHE_PATH", str(tmp_path / "answers"))
+    retriever = JudgeRetriever(chroma_path=str(tmp_path / "store"), openai_api_key="test-key", backend="numpy")
+    yield retriever
+    retriever.close()
+
+
+def test_rule_lookup_needs_no_embedding_or_store(retriever):
+    assert retriever.is_rule_lookup("what does 702.19c say")
+    assert retriever.retrieval_confidence("what does 702.19c say") == 1.0
+    # Neither the embeddings client nor the vector store were created
+    assert retriever.embedding_function._embeddings is None
+    assert retriever.db is None
+    assert not retriever.is_rule_lookup("can trample assign damage to a planeswalker")
+
+
+def test_cache_anchors_name_cited_rules_and_keywords(retriever):
+    retriever.open_caches()
+    assert retriever.cache_anchors("how does 702.19b work with deathtouch") == "702.19b|deathtouch"
+    assert retriever.cache_anchors("how does 702.19c work with deathtouch") == "702.19c|deathtouch"
+    assert retriever.cache_anchors("who wins ties") == ""
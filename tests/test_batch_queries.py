@@ -0,0 +1,129 @@
+import json
+
+import pytest
+
+from batch_queries import completed_ids, read_questions, run_batch
+
+
+def test_run_batch_skips_completed_and_retries_failed(tmp_path):
+    output_path = str(tmp_path / "answers.jsonl")
+    with open(output_path, "w") as file:
+        file.write(json.dumps({"id": "a", "answer": "done"}) + "\n")
+        file.write(json.dumps({"id": "b", "error": "timed out"}) + "\n")
+        # Cut short by an interrupted run
+        file.write('{"id": "c", "ans')
+
+    questions = [{"id": qid, "query_text": f"question {qid}"} for qid in ("a", "b", "c")]
+    prepared, answered = [], []
+
+    def prepare(pending):
+        prepared.extend(question["id"] for question in pending)
+        return [question["id"].upper() for question in pending]
+
+    def answer(question, item):
+        answered.append((question["id"], item))
+        return {"answer": f"answer {item}"}
+
+    stats = run_batch(questions, answer, output_path, concurrency=2, prepare=prepare)
+
+    assert prepared == ["b", "c"]
+    assert sorted(answered) == [("b", "B"), ("c", "C")]
+    assert (stats["answered"], stats["failed"], stats["skipped"]) == (2, 0, 1)
+    assert completed_ids(output_path) == {"a", "b", "c"}
+    with open(output_path) as file:
+        lines = file.read().splitlines()
+    assert sorted(json.loads(line)["id"] for line in lines[-2:]) == ["b", "c"]
+
+
+def test_read_questions_skips_malformed_lines(tmp_path, capsys):
+    input_path = tmp_path / "questions.jsonl"
+    input_path.write_text(
+        '{"id": 1, "query_text": "what is trample"}\n'
+        '{"id": 2, "query_text": "broken\n'
+        "\n"
+        "what is deathtouch\n"
+    )
+    questions = read_questions(str(input_path))
+    assert [question["query_text"] for question in questions] == ["what is trample", "what is deathtouch"]
+    assert "line 2" in capsys.readouterr().out
+
+
+class FakeDocument:
+    def __init__(self, source):
+        self.metadata = {"source": source, "chunk_id": source, "rule": "702.19"}
+
+
+@pytest.fixture
+def batch_main(monkeypatch):
+    import main
+    import query_database_rag
+
+    class FakeRetriever:
+        def prepare_batch(self, query_texts):
+            return [
+                {"query_embedding": [float(index)], "retrieved": [(query_text, 1.0)]}
+                for index, query_text in enumerate(query_texts)
+            ]
+
+    calls = []
+    statuses = {}
+
+    def fake_run_queries(query_text, policy=None, executor=None, query_embedding=None, retrieved=None, details=None):
+        calls.append((query_text, executor, query_embedding, retrieved))
+        status = statuses.get(query_text, "ok")
+        details.update(
+            cached=False,
+            statuses={"rag": "ok", "google": status, "reddit": "skipped: confident"},
+            seconds={"rag": 1.5},
+            sources=[(FakeDocument("mtg_rules.txt"), 0.91)],
+        )
+        return f"answer to {query_text}"
+
+    monkeypatch.setattr(query_database_rag, "get_retriever", lambda: FakeRetriever())
+    monkeypatch.setattr(main, "run_queries", fake_run_queries)
+    return main, calls, statuses
+
+
+def test_run_batch_queries_reuses_batch_retrieval(tmp_path, batch_main):
+    main, calls, _statuses = batch_main
+    shared_executor = main._source_executor
+
+    input_path = tmp_path / "questions.txt"
+    input_path.write_text("what is trample\nwhat is deathtouch\n")
+    output_path = tmp_path / "answers.jsonl"
+    stats = main.run_batch_queries(str(input_path), str(output_path), concurrency=2)
+
+    assert stats["answered"] == 2
+    assert main._source_executor is shared_executor
+    executors = {executor for _, executor, _, _ in calls}
+    assert len(executors) == 1 and shared_executor not in executors
+    for query_text, _, query_embedding, retrieved in calls:
+        assert retrieved == [(query_text, 1.0)]
+        assert query_embedding is not None
+
+    record = json.loads(output_path.read_text().splitlines()[0])
+    assert record["statuses"]["reddit"] == "skipped: confident"
+    assert record["sources"] == [{"source": "mtg_rules.txt", "chunk_id": "mtg_rules.txt", "rule": "702.19", "score": 0.91}]
+    assert record["timings"]["rag_seconds"] == 1.5
+    assert "answer_seconds" in record["timings"]
+    assert "error" not in record
+
+
+def test_run_batch_queries_retries_questions_with_a_failed_source(tmp_path, batch_main):
+    main, calls, statuses = batch_main
+    input_path = tmp_path / "questions.txt"
+    input_path.write_text("what is trample\nwhat is deathtouch\n")
+    output_path = tmp_path / "answers.jsonl"
+
+    statuses["what is deathtouch"] = "timed out after 45s"
+    stats = main.run_batch_queries(str(input_path), str(output_path), concurrency=2)
+    assert (stats["answered"], stats["failed"]) == (1, 1)
+    failed = [json.loads(line) for line in output_path.read_text().splitlines() if "error" in line]
+    assert failed[0]["error"] == "google timed out after 45s"
+    assert failed[0]["answer"] == "answer to what is deathtouch"
+
+    statuses.clear()
+    del calls[:]
+    stats = main.run_batch_queries(str(input_path), str(output_path), concurrency=2)
+    assert [query_text for query_text, *_ in calls] == ["what is deathtouch"]
+    assert (stats["answered"], stats["skipped"]) == (1, 1)
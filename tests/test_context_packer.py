@@ -0,0 +1,39 @@
+import os
+
+from context_packer import make_span, pack_context
+from embedding_pipeline import estimate_tokens
+from rules_index import RulesIndex
+
+RULES_PATH = os.path.join(os.path.dirname(__file__), os.path.pardir, "data", "mtg_rules.txt")
+
+
+def test_over_budget_cited_rule_is_cut_to_fit():
+    with open(RULES_PATH, encoding="utf-8") as file:
+        rules_index = RulesIndex.build(file.read(), "mtg_rules.txt")
+    cited = rules_index.unit_spans("608.2")
+    expanded = rules_index.unit_spans("601.2") + rules_index.unit_spans("205.3")
+    max_tokens = sum(estimate_tokens(span["text"]) for span in cited) // 2
+
+    context_text, stats = pack_context(cited + expanded, max_tokens=max_tokens)
+
+    assert context_text.startswith("608.2.")
+    assert "608.2a" in context_text
+    assert stats["spans_truncated"] == 1
+    assert stats["tokens"] <= max_tokens
+    # Cut at a line boundary: every kept line is a whole line of the rule
+    rule_lines = set("\n".join(span["text"] for span in cited).split("\n"))
+    assert all(line in rule_lines for line in context_text.split("\n") if line)
+
+
+def test_first_span_with_one_long_line_is_cut_at_a_word():
+    span = make_span("word " * 400, source="faq.txt", start=0)
+    context_text, stats = pack_context([span, make_span("other text", source="b.txt", start=0)], max_tokens=50)
+    assert context_text.startswith("word word")
+    assert stats["tokens"] <= 50
+
+
+def test_spans_that_fit_are_not_truncated():
+    spans = [make_span("608.2. Short rule.", rule="608.2"), make_span("601.2. Another.", rule="601.2")]
+    context_text, stats = pack_context(spans, max_tokens=2000)
+    assert stats["spans_truncated"] == 0
+    assert context_text.index("601.2") < context_text.index("608.2")
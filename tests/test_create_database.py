@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain.schema import Document
+
+from create_database_rag import iter_documents, sync_sources
+from embedding_pipeline import embed_and_store
+
+
+class FakeCollection:
+    def __init__(self):
+        self.deleted = []
+        self.updated = []
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+
+    def update(self, ids, metadatas):
+        self.updated.extend(ids)
+
+
+def counts():
+    return {"documents": 0, "new": 0, "deleted": 0, "retained": 0}
+
+
+def test_json_files_are_their_own_sources(tmp_path):
+    json_directory = tmp_path / "jsons"
+    json_directory.mkdir()
+    for name, content in (("a.json", "first"), ("b.json", "second")):
+        (json_directory / name).write_text(json.dumps(
+            {"content": content, "metadata": {"source": "https://example.com/thread"}}))
+
+    documents = list(iter_documents(str(tmp_path), str(json_directory)))
+
+    assert sorted(document.metadata["source"] for document in documents) == [
+        str(json_directory / "a.json"), str(json_directory / "b.json")]
+    assert {document.metadata["origin"] for document in documents} == {"https://example.com/thread"}
+
+
+def test_sync_sources_rejects_interleaved_sources():
+    documents = [
+        Document("first part of a", metadata={"source": "a.json"}),
+        Document("only part of b", metadata={"source": "b.json"}),
+        Document("second part of a", metadata={"source": "a.json"}),
+    ]
+    with pytest.raises(ValueError):
+        list(sync_sources(documents, FakeCollection(), {}, {}, counts()))
+
+
+def test_sync_sources_resync_embeds_nothing():
+    documents = [
+        Document("first part of a", metadata={"source": "a.txt"}),
+        Document("second part of a", metadata={"source": "a.txt"}),
+        Document("only part of b", metadata={"source": "b.txt"}),
+    ]
+    collection = FakeCollection()
+    new_sources, first_counts = {}, counts()
+    first = list(sync_sources(documents, collection, {}, new_sources, first_counts))
+    assert set(new_sources) == {"a.txt", "b.txt"}
+    assert first_counts["documents"] == 3
+    assert len({chunk_id for chunk_id, _ in first}) == len(first)
+
+    old_sources, new_sources = new_sources, {}
+    assert list(sync_sources(documents, collection, old_sources, new_sources, counts())) == []
+    assert new_sources == old_sources
+    assert collection.deleted == []
+
+
+def test_embedding_starts_before_documents_are_exhausted():
+    total = 20
+    read = []
+
+    def documents():
+        for index in range(total):
+            read.append(index)
+            yield Document(f"rule text number {index} " * 20, metadata={"source": f"{index}.txt"})
+
+    class FakeEmbeddings:
+        def embed_documents(self, texts):
+            return [[1.0, 0.0] for _ in texts]
+
+    read_at_first_write = []
+
+    def write_batch(ids, chunks, vectors):
+        if not read_at_first_write:
+            read_at_first_write.append(len(read))
+
+    items = sync_sources(documents(), FakeCollection(), {}, {}, counts())
+    embed_and_store(items, FakeEmbeddings(), write_batch, max_workers=1, max_batch_tokens=1)
+
+    assert len(read) == total
+    assert read_at_first_write[0] < total
@@ -0,0 +1,108 @@
+import hashlib
+import multiprocessing
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+MODEL = "test-model"
+
+
+def vector_for(text, dim=4):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [byte / 255 for byte in digest[:dim]]
+
+
+def test_vectors_survive_reopen(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many(MODEL, ["trample", "ward"], [vector_for("trample"), vector_for("ward")])
+    cache.close()
+
+    cache = EmbeddingCache(str(tmp_path))
+    results = cache.get_many(MODEL, ["ward", "trample", "flying"])
+    assert results[0] == pytest.approx(vector_for("ward"))
+    assert results[1] == pytest.approx(vector_for("trample"))
+    assert results[2] is None
+    assert cache.get_many("other-model", ["ward"]) == [None]
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many(MODEL, ["a"], [vector_for("a")])
+    cache.put_many(MODEL, ["b"], [vector_for("b")])
+    cache.get_many(MODEL, ["a"])
+    cache.put_many(MODEL, ["c"], [vector_for("c")])
+
+    a, b, c = cache.get_many(MODEL, ["a", "b", "c"])
+    assert b is None
+    assert a == pytest.approx(vector_for("a"))
+    assert c == pytest.approx(vector_for("c"))
+    # The evicted slot was reused, the file did not grow
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * 4 * 4
+    cache.close()
+
+
+def test_crash_while_writing_vectors_never_maps_a_key_to_another_vector(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many(MODEL, ["a", "b"], [vector_for("a"), vector_for("b")])
+    cache.get_many(MODEL, ["b"])
+
+    real_open = open
+
+    def failing_open(path, mode="r", *args, **kwargs):
+        if mode == "r+b":
+            raise OSError("disk went away")
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(embedding_cache, "open", failing_open, raising=False)
+    with pytest.raises(OSError):
+        cache.put_many(MODEL, ["c"], [vector_for("c")])
+    monkeypatch.undo()
+    cache.close()
+
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    a, b, c = cache.get_many(MODEL, ["a", "b", "c"])
+    assert a is None and c is None
+    assert b == pytest.approx(vector_for("b"))
+    # The unmapped slot is reused rather than growing the file past max_entries
+    cache.put_many(MODEL, ["d"], [vector_for("d")])
+    assert cache.get_many(MODEL, ["d"])[0] == pytest.approx(vector_for("d"))
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * 4 * 4
+    cache.close()
+
+
+def fill_cache(path, prefix, max_entries):
+    cache = EmbeddingCache(path, max_entries=max_entries)
+    for start in range(0, 200, 10):
+        texts = [f"{prefix} {index}" for index in range(start, start + 10)]
+        cache.put_many(MODEL, texts, [vector_for(text) for text in texts])
+        cache.get_many(MODEL, texts[:3])
+    cache.close()
+
+
+@pytest.mark.skipif(embedding_cache.fcntl is None, reason="needs fcntl")
+def test_processes_sharing_a_cache_never_swap_vectors(tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=fill_cache, args=(str(tmp_path), prefix, 150))
+        for prefix in ("cli", "server", "ingest")
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    cache = EmbeddingCache(str(tmp_path), max_entries=150)
+    texts = [f"{prefix} {index}" for prefix in ("cli", "server", "ingest") for index in range(200)]
+    results = cache.get_many(MODEL, texts)
+    present = [(text, result) for text, result in zip(texts, results) if result is not None]
+    assert len(present) == cache.stats()["entries"] <= 150
+    for text, result in present:
+        assert result == pytest.approx(vector_for(text))
+    cache.close()
@@ -0,0 +1,152 @@
+import base64
+import hashlib
+import json
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+pytest.importorskip("chromadb")
+
+from create_database_rag import create_database
+from embedding_cache import cached_openai_embeddings
+from embedding_pipeline import RateLimiter, embed_and_store, estimate_tokens, get_encoding
+
+DIMENSIONS = 8
+
+
+def fake_vector(item):
+    digest = hashlib.sha256(json.dumps(item).encode("utf-8")).digest()
+    return [byte / 255 for byte in digest[:DIMENSIONS]]
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    """
+    Answers POST .../embeddings like the OpenAI API, recording every request.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self.server.requests.append(inputs)
+        data = []
+        for index, item in enumerate(inputs):
+            vector = fake_vector(item)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"{len(vector)}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        payload = json.dumps({
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_base():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmbeddingsHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    # langchain_openai downloads its tokenizer; without network send texts as they are
+    if get_encoding() is None:
+        from langchain_openai import OpenAIEmbeddings
+
+        original = OpenAIEmbeddings.__init__
+
+        def init(self, **kwargs):
+            kwargs.setdefault("check_embedding_ctx_length", False)
+            original(self, **kwargs)
+
+        monkeypatch.setattr(OpenAIEmbeddings, "__init__", init)
+
+
+class CountingRateLimiter(RateLimiter):
+    def __init__(self):
+        super().__init__()
+        self.charged = []
+
+    def acquire(self, tokens):
+        self.charged.append(tokens)
+        super().acquire(tokens)
+
+
+class Chunk:
+    def __init__(self, text):
+        self.page_content = text
+        self.metadata = {}
+
+
+def texts_sent(server):
+    return sum(len(inputs) for inputs in server.requests)
+
+
+def test_embed_and_store_charges_rate_limiter_only_for_cache_misses(api_base, tmp_path):
+    server, base = api_base
+    embeddings = cached_openai_embeddings("test-key", cache_path=str(tmp_path / "cache"), openai_api_base=base)
+    texts = [f"rule text {index}" for index in range(5)]
+    written = {}
+
+    def write_batch(ids, chunks, vectors):
+        written.update(zip(ids, vectors))
+
+    limiter = CountingRateLimiter()
+    embed_and_store(((str(index), Chunk(text)) for index, text in enumerate(texts[:3])), embeddings, write_batch, rate_limiter=limiter)
+    assert texts_sent(server) == 3
+    assert limiter.charged == [sum(estimate_tokens(text) for text in texts[:3])]
+
+    limiter = CountingRateLimiter()
+    embed_and_store(((str(index), Chunk(text)) for index, text in enumerate(texts)), embeddings, write_batch, rate_limiter=limiter)
+    assert texts_sent(server) == 5
+    assert limiter.charged == [sum(estimate_tokens(text) for text in texts[3:])]
+    assert len(written) == 5
+
+    limiter = CountingRateLimiter()
+    embed_and_store(((str(index), Chunk(text)) for index, text in enumerate(texts)), embeddings, write_batch, rate_limiter=limiter)
+    assert texts_sent(server) == 5
+    assert limiter.charged == []
+    embeddings.cache.close()
+
+
+def test_create_database_against_fake_endpoint(api_base, tmp_path, monkeypatch):
+    server, base = api_base
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data" / "jsons").mkdir(parents=True)
+    (tmp_path / "jsons").mkdir()
+    (tmp_path / "data" / "notes.txt").write_text("Judges answer questions about the rules.\n" * 20)
+    options = dict(embedding_cache_path=str(tmp_path / "cache"), openai_api_base=base)
+
+    create_database("data", "jsons", "store", "test-key", **options)
+    assert server.requests
+    requests_made = len(server.requests)
+    manifest = json.loads((tmp_path / "store" / "manifest.json").read_text())
+    (source,) = manifest["sources"].values()
+
+    import chromadb
+
+    collection = chromadb.PersistentClient(path="store").get_collection("langchain")
+    assert sorted(collection.get()["ids"]) == sorted(source["chunk_ids"])
+
+    # A rebuild is served entirely from the embedding cache
+    create_database("data", "jsons", "store", "test-key", rebuild=True, **options)
+    assert len(server.requests) == requests_made
+    collection = chromadb.PersistentClient(path="store").get_collection("langchain")
+    assert sorted(collection.get()["ids"]) == sorted(source["chunk_ids"])
@@ -0,0 +1,83 @@
+import functools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_clients
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive server answering like the Custom Search API and Reddit,
+    recording the client port of every request.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def respond(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.ports.append((self.path.split("?")[0], self.client_address[1]))
+        if self.path.startswith("/customsearch"):
+            self.respond({"items": [{"snippet": "Trample lets excess damage through."}]})
+        else:
+            self.respond({"kind": "Listing", "data": {"children": [], "after": None, "before": None}})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.ports.append((self.path, self.client_address[1]))
+        self.respond({"access_token": "token", "expires_in": 3600, "scope": "*", "token_type": "bearer"})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+    server.ports = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    http_clients.close_clients()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    http_clients.close_clients()
+    server.shutdown()
+    server.server_close()
+
+
+def test_google_searches_reuse_one_connection(server, monkeypatch):
+    pytest.importorskip("httpx")
+    query_google = pytest.importorskip("query_google")
+    server, url = server
+    monkeypatch.setattr(query_google, "GOOGLE_CSE_URL", url + "/customsearch/v1")
+    tool = query_google.get_google_tool("cse-id", "api-key", http_client=http_clients.get_http_client())
+
+    for query in ("trample", "deathtouch", "ward"):
+        assert "Trample" in tool.run(query)
+
+    assert len(server.ports) == 3
+    assert len({port for _, port in server.ports}) == 1
+
+
+def test_reddit_searches_reuse_one_connection(server, monkeypatch):
+    praw = pytest.importorskip("praw")
+    query_reddit = pytest.importorskip("query_reddit")
+    server, url = server
+    monkeypatch.setattr(praw, "Reddit", functools.partial(praw.Reddit, oauth_url=url, reddit_url=url))
+    tool = query_reddit.get_reddit_tool("client-id", "client-secret", "judgebot-test", session=http_clients.get_requests_session())
+
+    for query in ("trample", "deathtouch", "ward"):
+        tool.run({"query": query, "sort": "relevance", "time_filter": "all", "subreddit": "mtgrules", "limit": "5"})
+
+    paths = [path for path, _ in server.ports]
+    assert paths.count("/api/v1/access_token") == 1
+    # prawcore closes the token request's connection itself; the searches share one
+    search_ports = {port for path, port in server.ports if path == "/r/mtgrules/search/"}
+    assert paths.count("/r/mtgrules/search/") == 3
+    assert len(search_ports) == 1
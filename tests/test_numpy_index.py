@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from config import RELEVANCE_THRESHOLD
+from numpy_index import NumpyVectorStore
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "index")
+
+
+def test_empty_store_returns_no_hits(path):
+    store = NumpyVectorStore(path)
+    assert len(store) == 0
+    assert store.search_many([[1.0, 0.0], [0.0, 1.0]], k=3) == [[], []]
+
+
+def test_upsert_update_delete_survive_reload(path):
+    store = NumpyVectorStore(path)
+    store.upsert(
+        ids=["a", "b", "c"],
+        embeddings=[[3.0, 0.0], [0.0, 2.0], [1.0, 1.0]],
+        metadatas=[{"source": "a.txt"}, {"source": "b.txt"}, {"source": "c.txt"}],
+        documents=["alpha", "beta", "gamma"],
+    )
+    store.persist()
+
+    store = NumpyVectorStore(path)
+    assert store.ids == ["a", "b", "c"]
+    # Stored L2-normalized
+    assert np.allclose(store.get(["a"], include=("embeddings",))["embeddings"], [[1.0, 0.0]])
+
+    store.upsert(ids=["b"], embeddings=[[0.0, -1.0]], metadatas=[{"source": "b2.txt"}], documents=["beta 2"])
+    store.update(ids=["c", "missing"], metadatas=[{"source": "c.txt", "page": 2}, {"source": "x"}])
+    store.delete(["a", "missing"])
+    # Readers see the old map until persist
+    assert len(store) == 3
+    store.persist()
+
+    for reloaded in (store, NumpyVectorStore(path)):
+        record = reloaded.get()
+        assert record["ids"] == ["b", "c"]
+        assert record["documents"] == ["beta 2", "gamma"]
+        assert record["metadatas"] == [{"source": "b2.txt"}, {"source": "c.txt", "page": 2}]
+        assert np.allclose(reloaded.get(["b"], include=("embeddings",))["embeddings"], [[0.0, -1.0]])
+
+
+def test_deleting_every_record_persists_an_empty_store(path):
+    store = NumpyVectorStore(path)
+    store.upsert(ids=["a"], embeddings=[[1.0, 0.0]], metadatas=[{}], documents=["alpha"])
+    store.persist()
+    store.delete(["a"])
+    store.persist()
+
+    store = NumpyVectorStore(path)
+    assert len(store) == 0
+    assert store.search_by_vector([1.0, 0.0]) == []
+
+
+def test_top_k_matches_brute_force(path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+    store = NumpyVectorStore(path)
+    store.upsert(
+        ids=[str(i) for i in range(len(vectors))],
+        embeddings=vectors,
+        metadatas=[{} for _ in vectors],
+        documents=["" for _ in vectors],
+    )
+    store.persist()
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for k in (1, 7, 200, 500):
+        results = store.search_many(queries, k=k)
+        assert len(results) == len(queries)
+        for query, hits in zip(queries, results):
+            expected = np.sum((normalized - unit(query)) ** 2, axis=1)
+            order = np.argsort(expected)[:k]
+            assert [row for row, _ in hits] == order.tolist()
+            assert np.allclose([distance for _, distance in hits], expected[order], atol=1e-5)
+        # search_by_vector is one row of search_many
+        single = store.search_by_vector(queries[0], k=k)
+        assert [row for row, _ in single] == [row for row, _ in results[0]]
+        assert np.allclose([d for _, d in single], [d for _, d in results[0]], atol=1e-5)
+
+
+def test_relevance_score_matches_the_threshold_scale(path):
+    # Chroma's squared-L2 distance and langchain's 1 - d / sqrt(2) score,
+    # so RELEVANCE_THRESHOLD means the same thing for both backends
+    store = NumpyVectorStore(path)
+    score = store._select_relevance_score_fn()
+    near, far = unit([0.95, np.sqrt(1 - 0.95 ** 2)]), unit([0.6, 0.8])
+    store.upsert(
+        ids=["same", "near", "far", "orthogonal"],
+        embeddings=[[1.0, 0.0], near, far, [0.0, 1.0]],
+        metadatas=[{}, {}, {}, {}],
+        documents=["", "", "", ""],
+    )
+    store.persist()
+
+    hits = store.search_by_vector([2.0, 0.0], k=4)
+    scores = {store.ids[row]: score(distance) for row, distance in hits}
+    assert scores["same"] == pytest.approx(1.0)
+    assert scores["near"] == pytest.approx(1 - (2 - 2 * 0.95) / np.sqrt(2), abs=1e-5)
+    assert scores["near"] >= RELEVANCE_THRESHOLD
+    assert scores["far"] < RELEVANCE_THRESHOLD
+    assert scores["orthogonal"] < RELEVANCE_THRESHOLD
+    assert [store.ids[row] for row, _ in hits] == ["same", "near", "far", "orthogonal"]
+
+
+def test_search_many_returns_documents_and_scores(path):
+    pytest.importorskip("langchain")
+    from query_database_rag import search_many
+
+    store = NumpyVectorStore(path)
+    store.upsert(
+        ids=["a", "b"],
+        embeddings=[[1.0, 0.0], [0.0, 1.0]],
+        metadatas=[{"source": "a.txt"}, {"source": "b.txt"}],
+        documents=["alpha", "beta"],
+    )
+    store.persist()
+
+    first, second = search_many(store, [[1.0, 0.0], [0.1, 1.0]], k=2)
+    assert [(doc.page_content, doc.metadata) for doc, _ in first] == [
+        ("alpha", {"source": "a.txt", "chunk_id": "a"}),
+        ("beta", {"source": "b.txt", "chunk_id": "b"}),
+    ]
+    assert first[0][1] == pytest.approx(1.0)
+    assert [doc.metadata["chunk_id"] for doc, _ in second] == ["b", "a"]
+    assert second[0][1] >= RELEVANCE_THRESHOLD > second[1][1]
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+
+
+def stub_runners(monkeypatch, runners):
+    monkeypatch.setattr(main, "source_runners", lambda query_text, rag_details=None: runners)
+
+
+def sleeper(seconds, answer, calls=None, name=None):
+    def run():
+        if calls is not None:
+            calls.append(name)
+        time.sleep(seconds)
+        return answer
+    return run
+
+
+def failing():
+    raise RuntimeError("quota exceeded")
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=3)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def test_slow_and_failing_sources_do_not_hold_up_the_others(monkeypatch, executor):
+    stub_runners(monkeypatch, {"rag": sleeper(0.05, "rag answer"), "google": sleeper(5, "late"), "reddit": failing})
+    timeouts = {"rag": 2.0, "google": 0.3, "reddit": 2.0}
+
+    started = time.monotonic()
+    results, statuses = main.query_sources("what is ward", timeouts=timeouts, executor=executor)
+    seconds = time.monotonic() - started
+
+    assert statuses == {"rag": "ok", "google": "timed out after 0.3s", "reddit": "failed: quota exceeded"}
+    assert results == {"rag": "rag answer"}
+    assert seconds < 1.0
+    combined = main.combine_results(results, statuses)
+    assert "**RAG_DB_Result**:\nrag answer" in combined
+    assert "**Google_Search_Result**:\n[timed out after 0.3s]" in combined
+    assert "**Reddit_Search_Result**:\n[failed: quota exceeded]" in combined
+
+
+def test_wall_time_is_bounded_by_the_longest_deadline(monkeypatch, executor):
+    stub_runners(monkeypatch, {name: sleeper(5, name) for name in main.RESULT_NAMES})
+    timeouts = {"rag": 0.4, "google": 0.2, "reddit": 0.3}
+
+    started = time.monotonic()
+    results, statuses = main.query_sources("what is ward", timeouts=timeouts, executor=executor)
+    seconds = time.monotonic() - started
+
+    assert results == {}
+    assert all(status.startswith("timed out") for status in statuses.values())
+    # Deadlines run concurrently from the start of the call, not one after another
+    assert 0.4 <= seconds < 0.8
+
+
+def test_a_source_still_queued_at_its_deadline_is_cancelled(monkeypatch):
+    calls = []
+    stub_runners(monkeypatch, {
+        "rag": sleeper(0.5, "rag answer", calls, "rag"),
+        "google": sleeper(0, "google answer", calls, "google"),
+    })
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        results, statuses = main.query_sources(
+            "what is ward", timeouts={"rag": 2.0, "google": 0.1}, names=("rag", "google"), executor=executor)
+    finally:
+        executor.shutdown(wait=True)
+
+    assert statuses == {"rag": "ok", "google": "timed out after 0.1s"}
+    assert calls == ["rag"]
+
+
+def test_run_queries_reports_statuses_and_does_not_cache_partial_answers(monkeypatch, executor):
+    remembered = []
+
+    class FakeRetriever:
+        def remember_answer(self, query_text, query_embedding, answer, namespace="rag"):
+            remembered.append(answer)
+
+    monkeypatch.setattr(
+        main, "plan_sources",
+        lambda query_text, policy, query_embedding=None, retrieved=None: (FakeRetriever(), [1.0], None, ("rag", "google"), ["reddit"], "confident"))
+    stub_runners(monkeypatch, {"rag": sleeper(0, "rag answer"), "google": failing})
+
+    details = {}
+    combined = main.run_queries("what is ward", executor=executor, details=details)
+
+    assert details["statuses"] == {"rag": "ok", "google": "failed: quota exceeded", "reddit": "skipped: confident"}
+    assert details["cached"] is False
+    assert set(details["seconds"]) == {"rag"}
+    assert "[skipped: confident]" in combined
+    assert remembered == []
+
+    stub_runners(monkeypatch, {"rag": sleeper(0, "rag answer"), "google": sleeper(0, "google answer")})
+    main.run_queries("what is ward", executor=executor)
+    assert len(remembered) == 1
+
+
+def test_refresh_db_rebuilds_from_the_configured_paths(monkeypatch, executor):
+    pytest.importorskip("langchain")
+    import create_database_rag
+    import query_database_rag
+    from config import DATA_PATH, JSON_DIRECTORY, Settings
+
+    calls, closed = [], []
+
+    class FakeRetriever:
+        def close(self):
+            closed.append(True)
+
+    monkeypatch.setattr(create_database_rag, "create_database", lambda *args, **kwargs: calls.append((args, kwargs)))
+    monkeypatch.setattr(query_database_rag, "get_retriever", FakeRetriever)
+    monkeypatch.setattr(main, "get_settings", lambda: Settings(openai_api_key="test-key"))
+    monkeypatch.setattr(main, "VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(
+        main, "plan_sources",
+        lambda query_text, policy, query_embedding=None, retrieved=None: (None, None, "cached answer", (), [], ""))
+
+    assert main.run_queries("what is ward", refresh_db=True, executor=executor) == "cached answer"
+    ((args, kwargs),) = calls
+    assert args == (DATA_PATH, JSON_DIRECTORY, query_database_rag.NUMPY_INDEX_PATH, "test-key")
+    assert kwargs["backend"] == "numpy"
+    # The next query opens the refreshed store
+    assert closed == [True]
@@ -0,0 +1,123 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from numpy_index import NumpyVectorStore
+from query_database_rag import fuse_results, search_many
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Chunks written without chunk_id metadata, and two of them with the same text
+    store = NumpyVectorStore(str(tmp_path / "index"))
+    store.upsert(
+        ids=["a", "b", "c"],
+        embeddings=[[1.0, 0.0, 0.0], [0.9, 0.1, 0.0], [0.0, 0.0, 1.0]],
+        metadatas=[{"source": "rules.txt"}, {"source": "rules.txt"}, {"source": "faq.txt"}],
+        documents=["Trample lets excess damage through.", "Trample lets excess damage through.", "Ward counters."],
+    )
+    store.persist()
+    return NumpyVectorStore(str(tmp_path / "index"))
+
+
+def test_search_many_sets_chunk_id_from_store_ids(store):
+    (results,) = search_many(store, [[1.0, 0.0, 0.0]], k=3)
+    assert [doc.metadata["chunk_id"] for doc, _ in results] == ["a", "b", "c"]
+    assert "chunk_id" not in store.metadatas[0]
+
+
+def test_fuse_results_keys_by_store_id(store):
+    query = [1.0, 0.0, 0.0]
+    (vector_results,) = search_many(store, [query], k=2)
+    fused = fuse_results(store, query, vector_results, [("b", 3.0), ("c", 1.0), ("a", 0.5)], k=4)
+    # Each chunk once, even though "a" and "b" share their text
+    assert sorted(doc.metadata["chunk_id"] for doc, _ in fused) == ["a", "b", "c"]
+
+
+def test_routing_retrieval_is_reused_for_the_rag_prompt(store, tmp_path, monkeypatch):
+    pytest.importorskip("langchain_openai")
+    import query_database_rag
+    from query_database_rag import JudgeRetriever
+
+    searches = []
+
+    def counting_search_many(db, query_embeddings, k=4):
+        searches.append(len(query_embeddings))
+        return search_many(db, query_embeddings, k=k)
+
+    monkeypatch.setattr(query_database_rag, "search_many", counting_search_many)
+    monkeypatch.setattr(query_database_rag, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings"))
+    monkeypatch.setattr(query_database_rag, "ANSWER_CACHE_PATH", str(tmp_path / "answers"))
+    retriever = JudgeRetriever(chroma_path=store.persist_directory, openai_api_key="test-key", backend="numpy")
+    try:
+        query_text = "does trample let damage through"
+        assert retriever.retrieval_confidence(query_text, [1.0, 0.0, 0.0]) > 0.9
+        prompt = retriever.create_prompt(query_text, query_embedding=[1.0, 0.0, 0.0])
+        assert "Trample lets excess damage through." in prompt
+        assert searches == [1]
+
+        # Used once: the next prompt for the question searches again
+        retriever.create_prompt(query_text, query_embedding=[1.0, 0.0, 0.0])
+        assert searches == [1, 1]
+    finally:
+        retriever.close()
+
+
+def test_batch_answers_report_only_the_sources_they_used(store, tmp_path, monkeypatch):
+    pytest.importorskip("langchain_openai")
+    import query_database_rag
+    from query_database_rag import JudgeRetriever, describe_sources
+
+    class FakeModel:
+        def invoke(self, prompt):
+            return type("Message", (), {"content": "Excess damage goes through."})()
+
+    monkeypatch.setattr(query_database_rag, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings"))
+    monkeypatch.setattr(query_database_rag, "ANSWER_CACHE_PATH", str(tmp_path / "answers"))
+    retriever = JudgeRetriever(chroma_path=store.persist_directory, openai_api_key="test-key", backend="numpy")
+    try:
+        retriever.warm_up()
+        retriever.model = FakeModel()
+        query_text = "does trample let damage through"
+        monkeypatch.setattr(retriever, "embed_queries", lambda query_texts: [[1.0, 0.0, 0.0] for _ in query_texts])
+        (item,) = retriever.prepare_batch([query_text])
+
+        details = {}
+        assert retriever.query(query_text, details=details, **item) == "Excess damage goes through."
+        assert details["cached"] is False
+        assert "a" in {source["chunk_id"] for source in describe_sources(details["sources"])}
+
+        details = {}
+        retriever.query(query_text, details=details, **item)
+        assert details == {"cached": True, "sources": []}
+    finally:
+        retriever.close()
+
+
+@pytest.mark.parametrize("query_text, chunks", [
+    ("how does trample work", 3),
+    ("does trample damage carry over when my attacker is blocked", 4),
+    ("can my creature reach the top of the stack", 4),
+])
+def test_keyword_definitions_only_replace_chunks_for_term_lookups(query_text, chunks):
+    import os
+    from langchain.schema import Document
+    from query_database_rag import create_context_and_prompt
+    from rules_index import RulesIndex
+
+    rules_path = os.path.join(os.path.dirname(__file__), os.path.pardir, "data", "mtg_rules.txt")
+    with open(rules_path, encoding="utf-8") as file:
+        rules_index = RulesIndex.build(file.read(), "mtg_rules.txt")
+    retrieved = [
+        (Document(f"Retrieved chunk {index}.", metadata={"source": "faq.txt", "start_index": 100 * index}), 0.9)
+        for index in range(4)
+    ]
+
+    class Template:
+        def format(self, context_text, query):
+            return context_text
+
+    context_text = create_context_and_prompt(
+        query_text, None, prompt_template=Template(), rules_index=rules_index,
+        expansion_hops=0, context_tokens=4000, retrieved=retrieved)
+    assert context_text.count("Retrieved chunk") == chunks
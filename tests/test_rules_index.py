@@ -0,0 +1,171 @@
+import json
+import os
+
+import pytest
+
+from rules_index import RulesIndex
+from source_texts import SourceTexts
+
+RULES_PATH = os.path.join(os.path.dirname(__file__), os.path.pardir, "data", "mtg_rules.txt")
+
+
+@pytest.fixture(scope="module")
+def rules_index():
+    with open(RULES_PATH, encoding="utf-8") as file:
+        return RulesIndex.build(file.read(), "mtg_rules.txt")
+
+
+def test_cited_subrule_is_fully_resolved(rules_index):
+    assert rules_index.is_fully_resolved("what does 702.19c say")
+
+
+@pytest.mark.parametrize("query_text", ["what does rule 702 say", "rule 100"])
+def test_bare_chapter_is_not_fully_resolved(rules_index, query_text):
+    assert rules_index.find_references(query_text)
+    assert not rules_index.is_fully_resolved(query_text)
+
+
+def test_chapter_spans_list_its_rules_within_budget(rules_index):
+    assert [span["rule"] for span in rules_index.unit_spans("702")] == ["702"]
+    spans = rules_index.unit_spans("100", max_chars=2000)
+    assert [span["rule"] for span in spans][:3] == ["100", "100.1", "100.2"]
+    assert sum(len(span["text"]) for span in spans) <= 2000
+
+
+@pytest.mark.parametrize("query_text", [
+    "put two +1/+1 counters on it",
+    "can I cast a spell during combat",
+    "what happens to the card I discarded",
+    "does it become day or night",
+    "do I double the damage",
+    "search your library and reveal it",
+])
+def test_generic_game_verbs_are_not_keywords(rules_index, query_text):
+    assert rules_index.find_terms(query_text) == []
+
+
+@pytest.mark.parametrize("query_text, terms", [
+    ("a creature with trample and double strike", ["trample", "double strike"]),
+    ("what happens when it explores", ["explore"]),
+    ("scry 2 then draw", ["scry"]),
+    ("can a megamorph creature be turned face up", ["megamorph"]),
+])
+def test_keyword_abilities_and_curated_actions_match(rules_index, query_text, terms):
+    assert rules_index.find_terms(query_text) == terms
+
+
+def test_unmatched_keywords_can_still_be_defined(rules_index):
+    assert "counter" not in rules_index.matched_terms()
+    assert rules_index.define("counter").startswith("Counter")
+
+
+@pytest.mark.parametrize("query_text", [
+    "can my creature reach the top of the stack",
+    "does the storm of triggers resolve in order",
+    "can I escape the combat damage step",
+    "I want to visit the judge about protection of hidden information",
+    "is there training for new judges",
+    "should I recover the card from my graveyard",
+    "what is the epic story of the set",
+    "how fast can I dash through my turn",
+    "Reach the top of the stack first",
+])
+def test_everyday_words_are_not_keywords(rules_index, query_text):
+    assert rules_index.find_terms(query_text) == []
+
+
+@pytest.mark.parametrize("query_text, terms", [
+    ("a creature with flying and reach", ["flying", "reach"]),
+    ("does it have protection from red", ["protection"]),
+    ("what is the ward cost when it is targeted", ["ward"]),
+    ("ward 2 and a copy of the spell", ["ward"]),
+    ("pay its dash {2}{R} cost", ["dash"]),
+    ("how does Storm count spells", ["storm"]),
+])
+def test_everyday_keywords_match_with_a_cue(rules_index, query_text, terms):
+    assert rules_index.find_terms(query_text) == terms
+
+
+@pytest.mark.parametrize("query_text, expected", [
+    ("how does trample work", True),
+    ("what does deathtouch mean", True),
+    ("does trample damage carry over to a planeswalker when blocked", False),
+    ("can my creature reach the top of the stack", False),
+])
+def test_term_lookup(rules_index, query_text, expected):
+    assert rules_index.is_term_lookup(query_text) == expected
+
+
+@pytest.fixture(scope="module")
+def sample_index(sample_rules):
+    return RulesIndex.build(sample_rules, "rules.txt")
+
+
+def test_references_and_glossary_terms(sample_index):
+    assert sample_index.references["100.1b"] == ["702.19e"]
+    assert sample_index.references["702.19e"] == ["702.2a"]
+    assert sample_index.references["702.2a"] == ["702.19e"]
+    assert sample_index.references["glossary:Trample"] == ["702.19"]
+    assert sample_index.terms["trample"] == {"glossary": "glossary:Trample", "rule": "702.19"}
+    assert sample_index.lookup_term("DEATHTOUCH").startswith("Deathtouch\n")
+
+
+def test_expand_follows_hops_and_stops_on_cycles(sample_index):
+    assert sample_index.expand(["100.1b"], max_hops=1) == ["702.19e"]
+    # 702.2a cites 702.19e back; neither is visited twice, nor is the seed
+    assert sample_index.expand(["100.1b"], max_hops=5) == ["702.19e", "702.2a"]
+    assert sample_index.expand(["702.19e"], max_hops=5) == ["702.2a"]
+    assert sample_index.expand(["702.19e", "702.2a"], max_hops=5) == []
+
+
+def test_expand_skips_chapter_headings(sample_index):
+    assert sample_index.references["100.2"] == ["702"]
+    assert sample_index.expand(["100.2"]) == []
+
+
+def tokens(text):
+    return -(-len(text) // 4)
+
+
+def test_expand_character_budget(sample_index):
+    subrule, other = sample_index.lookup("702.19e"), sample_index.lookup("702.2a")
+    whole_rule = sample_index.lookup("702.19")
+    assert len(whole_rule) > len(subrule)
+
+    # A rule that does not fit is skipped, and smaller ones after it still fit
+    assert sample_index.expand(["glossary:Trample", "100.1b"], max_tokens=tokens(subrule)) == ["702.19e"]
+    assert sample_index.expand(["glossary:Trample", "100.1b"], max_tokens=tokens(whole_rule) + tokens(subrule)) == [
+        "702.19", "702.19e"]
+    # The budget is shared across hops
+    assert sample_index.expand(["100.1b"], max_hops=2, max_tokens=tokens(subrule)) == ["702.19e"]
+    assert sample_index.expand(["100.1b"], max_hops=2, max_tokens=tokens(subrule) + tokens(other)) == [
+        "702.19e", "702.2a"]
+
+
+def test_saved_index_reads_unit_text_from_the_source_file(sample_rules, tmp_path):
+    (tmp_path / "rules.txt").write_text(sample_rules, encoding="utf-8")
+    source_texts = SourceTexts(root=str(tmp_path))
+    built = RulesIndex.build(sample_rules, "rules.txt", source_texts)
+    built.save(str(tmp_path / "store"))
+
+    with open(tmp_path / "store" / "rules_index.json") as file:
+        saved = json.load(file)
+    assert not any("text" in unit for unit in saved["units"].values())
+
+    loaded = RulesIndex.load(str(tmp_path / "store"), SourceTexts(root=str(tmp_path)))
+    for number in ("702.19", "100.1a", "702"):
+        assert loaded.lookup(number) == built.lookup(number)
+    assert loaded.lookup_term("trample") == built.lookup_term("trample")
+    assert loaded.define("trample") == built.define("trample")
+
+    (tmp_path / "rules.txt").write_text(sample_rules.replace("Trample", "Tramble"), encoding="utf-8")
+    with pytest.raises(ValueError, match="changed since it was indexed"):
+        RulesIndex.load(str(tmp_path / "store"), SourceTexts(root=str(tmp_path))).lookup("702.19")
+
+
+def test_units_the_file_does_not_match_keep_their_text(sample_rules, tmp_path):
+    # Text decoded with different newlines than the file on disk
+    (tmp_path / "rules.txt").write_bytes(sample_rules.replace("\n", "\r\n").encode("utf-8"))
+    RulesIndex.build(sample_rules, "rules.txt", SourceTexts(root=str(tmp_path))).save(str(tmp_path / "store"))
+    loaded = RulesIndex.load(str(tmp_path / "store"), SourceTexts(root=str(tmp_path)))
+    assert loaded.lookup("702.19e").startswith("702.19e If there are no creatures blocking it")
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+from rules_parser import parse_rules
+
+RULES_PATH = os.path.join(os.path.dirname(__file__), os.path.pardir, "data", "mtg_rules.txt")
+
+
+@pytest.fixture(scope="module")
+def units(sample_rules):
+    return list(parse_rules(sample_rules))
+
+
+@pytest.fixture(scope="module")
+def real_units():
+    with open(RULES_PATH, encoding="utf-8") as file:
+        return {unit["rule"]: unit for unit in parse_rules(file.read()) if unit["kind"] != "glossary"}
+
+
+def test_units_follow_the_body_not_the_contents(units):
+    assert [(unit["kind"], unit["rule"] or unit["term"]) for unit in units] == [
+        ("section", "1"),
+        ("chapter", "100"),
+        ("rule", "100.1"),
+        ("subrule", "100.1a"),
+        ("subrule", "100.1b"),
+        ("rule", "100.2"),
+        ("section", "7"),
+        ("chapter", "702"),
+        ("title", "702.2"),
+        ("subrule", "702.2a"),
+        ("title", "702.19"),
+        ("subrule", "702.19a"),
+        ("subrule", "702.19e"),
+        ("glossary", "Deathtouch"),
+        ("glossary", "Trample"),
+    ]
+
+
+def test_offsets_slice_the_unit_text(units, sample_rules):
+    for unit in units:
+        assert sample_rules[unit["start"]:unit["end"]] == unit["text"]
+
+
+def test_section_and_chapter_headers(units):
+    by_rule = {unit["rule"]: unit for unit in units if unit["rule"]}
+    assert by_rule["1"]["title"] == "Game Concepts"
+    assert by_rule["702"]["title"] == "Keyword Abilities"
+    assert by_rule["702"]["parent_rule"] == "7"
+    assert by_rule["702"]["section_title"] == "Additional Rules"
+    # Rules that are sentences take their chapter's title
+    assert by_rule["100.1"]["title"] == "General"
+    assert by_rule["100.1"]["parent_rule"] == "100"
+
+
+def test_subrules_belong_to_their_rule(units):
+    by_rule = {unit["rule"]: unit for unit in units if unit["rule"]}
+    for number in ("702.19a", "702.19e"):
+        assert by_rule[number]["parent_rule"] == "702.19"
+        assert by_rule[number]["title"] == "Trample"
+    # Wrapped lines and examples stay with the subrule above them
+    assert by_rule["702.19a"]["text"].endswith("attacking creature's combat damage.")
+    assert by_rule["100.1a"]["text"].endswith("between two friends.")
+    # Malformed numbers: "100.1b." and "100.2 To play"
+    assert by_rule["100.1b"]["parent_rule"] == "100.1"
+    assert by_rule["100.2"]["text"].startswith("100.2 To play")
+
+
+def test_glossary_entries(units):
+    glossary = [unit for unit in units if unit["kind"] == "glossary"]
+    assert [unit["term"] for unit in glossary] == ["Deathtouch", "Trample"]
+    deathtouch = glossary[0]
+    assert deathtouch["section"] == "Glossary"
+    assert deathtouch["text"].splitlines() == [
+        "Deathtouch",
+        "A keyword ability that causes damage dealt by an object to be especially effective.",
+        'See rule 702.2, "Deathtouch."',
+    ]
+    # Parsing stops at the closing Credits
+    assert "Garfield" not in glossary[-1]["text"]
+
+
+def test_real_rules_subrule_letters(real_units):
+    assert real_units["702.19"]["kind"] == "title"
+    letters = [number for number in real_units if number.startswith("702.19") and number != "702.19"]
+    assert letters == [f"702.19{letter}" for letter in "abcdefg"]
+    for number in letters:
+        assert real_units[number]["parent_rule"] == "702.19"
+        assert real_units[number]["text"].startswith(number + " ")
+    # Each subrule ends before the next one starts
+    assert "702.19b" not in real_units["702.19a"]["text"]
+    assert "702.20" not in real_units["702.19g"]["text"]
+
+
+def test_real_rules_malformed_numbers(real_units):
+    assert real_units["119.1d"]["kind"] == "subrule"
+    assert real_units["119.1d"]["parent_rule"] == "119.1"
+    assert real_units["606.5"]["kind"] == "rule"
+    assert real_units["606.5"]["text"].startswith("606.5 If the total cost")
+
+
+def test_split_rules_skips_headings(sample_rules):
+    pytest.importorskip("langchain")
+    from langchain.schema import Document
+    from rules_parser import split_rules
+
+    chunks = split_rules(Document(sample_rules, metadata={"source": "rules.txt"}))
+    assert [chunk.metadata.get("rule") or chunk.metadata["term"] for chunk in chunks] == [
+        "100.1", "100.1a", "100.1b", "100.2", "702.2a", "702.19a", "702.19e", "Deathtouch", "Trample"]
+    trample = chunks[5]
+    assert trample.metadata["source"] == "rules.txt"
+    assert trample.metadata["title"] == "Trample"
+    assert sample_rules[trample.metadata["start_index"]:trample.metadata["end_index"]] == trample.page_content
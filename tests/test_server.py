@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+import server
+from config import SERVER_WORKERS
+
+
+class BlockingAnswers:
+    """
+    Stands in for run_queries: every call waits until release() and is counted.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self, query_text, policy=None, executor=None):
+        self.calls.append(query_text)
+        self.started.set()
+        self._release.wait(10)
+        return f"answer to {query_text}"
+
+    def release(self):
+        self._release.set()
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    answers = BlockingAnswers()
+    monkeypatch.setattr(server, "run_queries", answers)
+    monkeypatch.setattr(server, "pool", server.CoalescingPool(max_workers=2, max_pending=2))
+    yield answers
+    answers.release()
+    server.pool.shutdown()
+
+
+def post_in_thread(client, query_text, responses):
+    def post():
+        responses.append(client.post("/query", json={"query_text": query_text, "policy": "never"}))
+    thread = threading.Thread(target=post)
+    thread.start()
+    return thread
+
+
+def wait_for(condition, seconds=5):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_source_executor_covers_every_worker():
+    assert server.sources._max_workers == len(server.RESULT_NAMES) * SERVER_WORKERS
+
+
+def test_identical_questions_are_coalesced(answers):
+    client = TestClient(server.app)
+    responses = []
+    first = post_in_thread(client, "Does trample  work with deathtouch?", responses)
+    answers.started.wait(5)
+    second = post_in_thread(client, "does trample work with DEATHTOUCH?", responses)
+    wait_for(lambda: server.pool.stats()["coalesced"] == 1)
+    answers.release()
+    first.join(5)
+    second.join(5)
+
+    assert len(answers.calls) == 1
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].json() == responses[1].json()
+
+
+def test_full_queue_answers_503_with_retry_after(answers):
+    client = TestClient(server.app)
+    responses = []
+    threads = [post_in_thread(client, f"question {index}", responses) for index in range(2)]
+    wait_for(lambda: server.pool.stats()["pending"] == 2)
+
+    response = client.post("/query", json={"query_text": "one question too many", "policy": "never"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert server.pool.stats()["rejected"] == 1
+
+    answers.release()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(response.status_code for response in responses) == [200, 200]
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def stream_pool(monkeypatch):
+    monkeypatch.setattr(server, "pool", server.CoalescingPool(max_workers=2, max_pending=2))
+    yield
+    server.pool.shutdown()
+
+
+def test_stream_endpoint_frames_each_event(monkeypatch, stream_pool):
+    import main
+
+    def fake_stream_queries(query_text, policy=None, executor=None):
+        yield {"source": "rag", "type": "token", "text": "Ward "}
+        yield {"source": "rag", "type": "token", "text": "counters it."}
+        yield {"source": "rag", "type": "result", "status": "ok", "text": "Ward counters it."}
+        yield {"source": "google", "type": "result", "status": "timed out after 45s", "text": ""}
+        yield {"type": "done", "ttft": 0.1, "seconds": 45.0}
+
+    monkeypatch.setattr(main, "stream_queries", fake_stream_queries)
+    response = TestClient(server.app).post("/query/stream", json={"query_text": "what is ward", "policy": "always"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["token", "token", "result", "result", "done"]
+    assert "".join(data["text"] for name, data in events if name == "token") == "Ward counters it."
+    assert events[3][1]["status"] == "timed out after 45s"
+
+
+def test_stream_endpoint_ends_with_an_error_event(monkeypatch, stream_pool):
+    import main
+
+    def fake_stream_queries(query_text, policy=None, executor=None):
+        yield {"source": "rag", "type": "token", "text": "Ward "}
+        raise RuntimeError("store went away")
+
+    monkeypatch.setattr(main, "stream_queries", fake_stream_queries)
+    response = TestClient(server.app).post("/query/stream", json={"query_text": "what is ward"})
+
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["token", "error"]
+    assert events[1][1] == {"type": "error", "detail": "store went away"}
@@ -0,0 +1,41 @@
+import pytest
+
+from source_texts import SourceTexts
+
+
+class Document:
+    def __init__(self, page_content, metadata):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+def locate_chunk(source_texts, source, text, start, end):
+    chunk = Document(text[start:end], {"source": source, "start_index": start, "end_index": end})
+    assert source_texts.locate(Document(text, {"source": source}), [chunk]) == 1
+    return chunk
+
+
+def test_same_size_edit_is_detected_by_content_hash(tmp_path):
+    path = tmp_path / "rules.txt"
+    path.write_text("702.19. Trample\n702.19a Trample lets damage through.\n", encoding="utf-8")
+    indexed = SourceTexts()
+    chunk = locate_chunk(indexed, str(path), path.read_text(encoding="utf-8"), 16, 52)
+    indexed.close()
+    metadata = dict(chunk.metadata)
+
+    assert SourceTexts().hydrate([Document("", metadata)])[0].page_content == chunk.page_content
+
+    path.write_text("702.19. Trample\n702.19a Trample lets damage THROUGH.\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="changed since it was indexed"):
+        SourceTexts().hydrate([Document("", metadata)])
+
+
+def test_relative_sources_resolve_against_root(tmp_path, monkeypatch):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "faq.txt").write_text("Judges answer questions.", encoding="utf-8")
+    source_texts = SourceTexts(root=str(tmp_path))
+    chunk = locate_chunk(source_texts, "data/faq.txt", "Judges answer questions.", 7, 13)
+
+    # Served from the same file whatever the working directory
+    monkeypatch.chdir(tmp_path / "data")
+    assert SourceTexts(root=str(tmp_path)).hydrate([Document("", dict(chunk.metadata))])[0].page_content == "answer"
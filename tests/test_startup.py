@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+# Generous for slow CI machines; loading LangChain alone takes several times this
+HELP_SECONDS = 1.5
+
+CHECK_HELP = """
+import runpy, sys
+sys.argv = ["src/main.py", "--help"]
+try:
+    runpy.run_path("src/main.py", run_name="__main__")
+except SystemExit:
+    pass
+heavy = sorted(name for name in sys.modules if name.split(".")[0] in ("langchain", "langchain_core", "langchain_community", "chromadb", "praw"))
+print("HEAVY:" + ",".join(heavy), file=sys.stderr)
+"""
+
+
+def test_help_imports_no_langchain_and_needs_no_api_key():
+    env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+    result = subprocess.run([sys.executable, "-c", CHECK_HELP], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert "usage:" in result.stdout
+    assert "HEAVY:\n" in result.stderr
+
+
+def test_help_stays_within_startup_budget():
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "src/main.py", "--help"], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    seconds = time.perf_counter() - started
+    assert result.returncode == 0, result.stderr
+    assert seconds < HELP_SECONDS, f"--help took {seconds:.2f}s"
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+from query_database_rag import JudgeRetriever
+
+
+class Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeModel:
+    """
+    Streams fixed pieces, delay seconds apart.
+    """
+
+    def __init__(self, pieces, delay=0.0, error=None):
+        self.pieces = pieces
+        self.delay = delay
+        self.error = error
+
+    def stream(self, prompt):
+        for piece in self.pieces:
+            time.sleep(self.delay)
+            yield Chunk(piece)
+        if self.error is not None:
+            raise self.error
+
+
+def fake_retriever(monkeypatch, model, cached=None):
+    retriever = JudgeRetriever()
+    remembered = []
+    monkeypatch.setattr(retriever, "is_rule_lookup", lambda query_text: False)
+    monkeypatch.setattr(retriever, "embed_query", lambda query_text: [1.0, 0.0])
+    monkeypatch.setattr(retriever, "cached_answer", lambda query_text, query_embedding, namespace="rag": cached)
+    monkeypatch.setattr(retriever, "create_prompt", lambda query_text, query_embedding=None: "prompt")
+    monkeypatch.setattr(
+        retriever, "remember_answer",
+        lambda query_text, query_embedding, answer, namespace="rag": remembered.append((namespace, answer)))
+    retriever.model = model
+    return retriever, remembered
+
+
+def test_retriever_stream_yields_pieces_in_order_and_caches_the_whole_answer(monkeypatch):
+    retriever, remembered = fake_retriever(monkeypatch, FakeModel(["Trample ", "", "assigns ", "excess."]))
+    assert list(retriever.stream("how does trample work")) == ["Trample ", "assigns ", "excess."]
+    assert remembered == [("rag", "Trample assigns excess.")]
+
+
+def test_retriever_stream_yields_a_cached_answer_whole(monkeypatch):
+    retriever, remembered = fake_retriever(monkeypatch, FakeModel(["never"]), cached="Cached answer.")
+    assert list(retriever.stream("how does trample work")) == ["Cached answer."]
+    assert remembered == []
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=6)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def stub_sources(monkeypatch, retriever, runners, cached=None):
+    names = ("rag",) + tuple(runners)
+    skipped = [name for name in main.RESULT_NAMES if name not in names]
+    monkeypatch.setattr(
+        main, "plan_sources",
+        lambda query_text, policy: (retriever, [1.0, 0.0], cached, names, skipped, "test"))
+    monkeypatch.setattr(main, "source_runners", lambda query_text, rag_details=None: runners)
+
+
+def slow(seconds, answer):
+    def run():
+        time.sleep(seconds)
+        return answer
+    return run
+
+
+def failing():
+    raise RuntimeError("quota exceeded")
+
+
+def test_stream_queries_emits_tokens_first_then_each_source(monkeypatch, executor):
+    retriever, remembered = fake_retriever(monkeypatch, FakeModel(["Ward ", "counters ", "it."], delay=0.05))
+    stub_sources(monkeypatch, retriever, {"google": slow(0.4, "google answer"), "reddit": failing})
+    timeouts = {"rag": 2.0, "google": 2.0, "reddit": 2.0}
+
+    events = list(main.stream_queries("what is ward", timeouts=timeouts, executor=executor))
+
+    tokens = [event["text"] for event in events if event["type"] == "token"]
+    assert tokens == ["Ward ", "counters ", "it."]
+    results = {event["source"]: event for event in events if event["type"] == "result"}
+    assert results["rag"]["status"] == "ok" and results["rag"]["text"] == "Ward counters it."
+    assert results["google"]["status"] == "ok" and results["google"]["text"] == "google answer"
+    assert results["reddit"]["status"] == "failed: quota exceeded"
+    # The first token is shown long before the slow web source answers
+    order = [(event["type"], event.get("source")) for event in events]
+    assert order.index(("token", "rag")) < order.index(("result", "rag")) < order.index(("result", "google"))
+    done = events[-1]
+    assert done["type"] == "done"
+    assert done["ttft"] < 0.3 <= done["seconds"]
+    # A failed source keeps the combined answer out of the cache
+    assert [namespace for namespace, _ in remembered] == ["rag"]
+
+
+def test_stream_queries_reports_rag_errors_and_timeouts(monkeypatch, executor):
+    retriever, _ = fake_retriever(monkeypatch, FakeModel(["Partial "], error=RuntimeError("connection reset")))
+    stub_sources(monkeypatch, retriever, {"google": slow(5, "too late")})
+    timeouts = {"rag": 2.0, "google": 0.3}
+
+    started = time.monotonic()
+    events = list(main.stream_queries("what is ward", timeouts=timeouts, executor=executor))
+
+    assert time.monotonic() - started < 1.0
+    results = {event["source"]: event for event in events if event["type"] == "result"}
+    assert results["rag"]["status"] == "failed: connection reset"
+    assert results["google"] == {"source": "google", "type": "result", "status": "timed out after 0.3s", "text": ""}
+    assert events[-1]["type"] == "done"
+
+
+def test_stream_queries_answers_from_the_cache(monkeypatch, executor):
+    retriever, _ = fake_retriever(monkeypatch, FakeModel(["never"]))
+    stub_sources(monkeypatch, retriever, {}, cached="Cached combined answer.")
+
+    events = list(main.stream_queries("what is ward", executor=executor))
+
+    assert events[0] == {"source": "cache", "type": "result", "status": "ok", "text": "Cached combined answer."}
+    assert [event["type"] for event in events] == ["result", "done"]
+
+
+def test_astream_queries_matches_the_blocking_stream(monkeypatch, executor):
+    retriever, _ = fake_retriever(monkeypatch, FakeModel(["Ward ", "counters ", "it."]))
+    stub_sources(monkeypatch, retriever, {"google": slow(0.05, "google answer")})
+
+    async def collect():
+        return [event async for event in main.astream_queries("what is ward", executor=executor)]
+
+    events = asyncio.run(collect())
+    assert [event["text"] for event in events if event["type"] == "token"] == ["Ward ", "counters ", "it."]
+    assert {event["source"] for event in events if event["type"] == "result"} == {"rag", "google"}
+    assert events[-1]["type"] == "done"
+
+
+def test_iterate_async_raises_the_producer_error_after_its_items():
+    def produce():
+        yield 1
+        yield 2
+        raise ValueError("store went away")
+
+    async def collect(items):
+        async for item in main.iterate_async(produce):
+            items.append(item)
+
+    items = []
+    with pytest.raises(ValueError, match="store went away"):
+        asyncio.run(collect(items))
+    assert items == [1, 2]
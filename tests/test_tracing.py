@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def traced(tmp_path, monkeypatch):
+    trace_path = str(tmp_path / "trace.jsonl")
+    metrics_path = str(tmp_path / "metrics.prom")
+    monkeypatch.setattr(tracing, "ENABLED", True)
+    monkeypatch.setattr(tracing, "TRACE_PATH", trace_path)
+    monkeypatch.setattr(tracing, "METRICS_PATH", metrics_path)
+    monkeypatch.setattr(tracing, "METRICS_INTERVAL", 0.0)
+    monkeypatch.setattr(tracing, "_histograms", {})
+    monkeypatch.setattr(tracing, "_counters", {})
+    monkeypatch.setattr(tracing, "_trace_file", None)
+    yield trace_path, metrics_path
+    tracing.flush()
+
+
+def read_spans(trace_path):
+    tracing.flush()
+    with open(trace_path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_disabled_tracing_returns_the_noop_span(monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", False)
+    assert tracing.span("query") is tracing.NOOP_SPAN
+    assert tracing.current_span() is tracing.NOOP_SPAN
+    fn = lambda: 1
+    assert tracing.propagate(fn) is fn
+
+
+def test_nested_spans_share_a_trace_and_record_their_parent(traced):
+    trace_path, _ = traced
+    with tracing.span("query", mode="cli") as outer:
+        with tracing.span("vector_search", k=4) as inner:
+            assert tracing.current_span() is inner
+            inner.set(hits=3)
+        assert tracing.current_span() is outer
+
+    spans = {record["name"]: record for record in read_spans(trace_path)}
+    assert spans["vector_search"]["parent_id"] == spans["query"]["span_id"]
+    assert spans["vector_search"]["trace_id"] == spans["query"]["trace_id"]
+    assert spans["query"]["parent_id"] is None
+    assert spans["vector_search"]["attributes"] == {"k": 4, "hits": 3}
+    assert spans["query"]["duration_ms"] >= spans["vector_search"]["duration_ms"]
+
+
+def test_propagate_parents_spans_opened_on_other_threads(traced):
+    trace_path, _ = traced
+
+    def work():
+        with tracing.span("source", source="rag"):
+            pass
+
+    with tracing.span("query"):
+        thread = threading.Thread(target=tracing.propagate(work))
+        thread.start()
+        thread.join()
+    # Without propagation a worker thread starts its own trace
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+
+    propagated, query, orphan = read_spans(trace_path)
+    assert propagated["parent_id"] == query["span_id"]
+    assert propagated["trace_id"] == query["trace_id"]
+    assert orphan["parent_id"] is None and orphan["trace_id"] != query["trace_id"]
+
+
+def test_errors_are_recorded_and_still_raised(traced):
+    trace_path, _ = traced
+    with pytest.raises(ValueError):
+        with tracing.span("source", source="google"):
+            raise ValueError("quota")
+    record, = read_spans(trace_path)
+    assert record["attributes"]["error"] == "ValueError: quota"
+    assert 'judgebot_span_errors_total{span="source",source="google"} 1' in tracing.metrics_text()
+
+
+def test_metrics_text_is_prometheus_exposition(traced):
+    _, metrics_path = traced
+    for _ in range(2):
+        with tracing.span("llm_call", source="rag", prompt="not a label"):
+            pass
+    tracing.count("answer_cache_lookups_total", result="hit")
+    text = tracing.metrics_text()
+
+    assert "# TYPE judgebot_span_duration_seconds histogram" in text
+    assert 'judgebot_span_duration_seconds_bucket{span="llm_call",source="rag",le="+Inf"} 2' in text
+    assert 'judgebot_span_duration_seconds_count{span="llm_call",source="rag"} 2' in text
+    assert "prompt" not in text
+    assert "# TYPE judgebot_answer_cache_lookups_total counter" in text
+    assert 'judgebot_answer_cache_lookups_total{result="hit"} 1' in text
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in text.splitlines() if "_bucket{" in line]
+    assert buckets == sorted(buckets)
+    with open(metrics_path) as file:
+        assert "judgebot_span_duration_seconds_count" in file.read()
+
+
+def test_concurrent_exports_never_fail_spans(traced):
+    _, metrics_path = traced
+    errors = []
+
+    def work():
+        try:
+            for _ in range(100):
+                with tracing.span("vector_search"):
+                    pass
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    tracing.write_metrics()
+    with open(metrics_path) as file:
+        assert 'judgebot_span_duration_seconds_count{span="vector_search"} 800' in file.read()
+    assert [name for name in os.listdir(os.path.dirname(metrics_path)) if name.endswith(".tmp")] == []
+
+
+def test_export_errors_are_logged_not_raised(traced, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(tracing, "TRACE_PATH", str(tmp_path / "missing" / "trace.jsonl"))
+    monkeypatch.setattr(tracing, "METRICS_PATH", str(tmp_path / "missing" / "metrics.prom"))
+    with tracing.span("query"):
+        pass
+    output = capsys.readouterr().out
+    assert "Could not write trace" in output
+    assert "Could not write metrics" in output
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+
+class FakeLLM:
+    """
+    Stands in for ChatOpenAI, counting invoke() calls.
+    """
+
+    def __init__(self, **kwargs):
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return type("Message", (), {"content": "Excess damage goes to the player.", "response_metadata": {}})()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    llms = []
+
+    def make_llm(**kwargs):
+        llms.append(FakeLLM(**kwargs))
+        return llms[-1]
+    return llms, make_llm
+
+
+QUESTION = "Does Trample damage carry over when my attacker is blocked by a chump blocker?"
+
+
+def test_google_direct_mode_makes_one_search_and_one_llm_call(monkeypatch, fake_llm):
+    httpx = pytest.importorskip("httpx")
+    query_google = pytest.importorskip("query_google")
+    requests = []
+
+    def handle(request):
+        requests.append(request)
+        return httpx.Response(200, json={"items": [{"snippet": "Trample lets excess damage through."}]})
+
+    llms, make_llm = fake_llm
+    monkeypatch.setattr(query_google, "ChatOpenAI", make_llm)
+    monkeypatch.setattr(query_google, "build_agent_executor", lambda llm, tools: None)
+    monkeypatch.setattr(query_google, "get_http_client", lambda: httpx.Client(transport=httpx.MockTransport(handle)))
+    source = query_google.GoogleSource("openai-key", "cse-id", "api-key")
+
+    for count in (1, 2):
+        assert source.query(QUESTION, mode="direct") == "Excess damage goes to the player."
+        assert len(requests) == count
+        assert len(llms) == 1 and len(llms[0].prompts) == count
+
+    params = requests[0].url.params
+    assert (params["cx"], params["key"]) == ("cse-id", "api-key")
+    assert params["q"] == "Trample damage carry over attacker blocked chump blocker mtg"
+    assert "Trample lets excess damage through." in llms[0].prompts[0]
+
+
+def test_reddit_direct_mode_makes_one_search_and_one_llm_call(monkeypatch, fake_llm):
+    pytest.importorskip("praw")
+    requests_lib = pytest.importorskip("requests")
+    query_reddit = pytest.importorskip("query_reddit")
+    from requests.adapters import BaseAdapter
+
+    sent = []
+
+    class RedditAdapter(BaseAdapter):
+        """
+        Answers the OAuth token request and searches like Reddit, recording each request.
+        """
+
+        def send(self, request, **kwargs):
+            sent.append((request.method, request.path_url.split("?")[0]))
+            if request.path_url.startswith("/api/v1/access_token"):
+                payload = {"access_token": "token", "expires_in": 3600, "scope": "*", "token_type": "bearer"}
+            else:
+                post = {"kind": "t3", "data": {
+                    "id": "abc", "name": "t3_abc", "subreddit_name_prefixed": "r/mtgrules", "category": None, "title": "Trample and chump blockers",
+                    "selftext": "Excess damage tramples over.", "subreddit": "mtgrules", "author": "judge",
+                    "score": 12, "num_comments": 3, "url": "https://reddit.com/abc", "permalink": "/r/mtgrules/abc",
+                    "created_utc": 0, "link_flair_text": None}}
+                payload = {"kind": "Listing", "data": {"children": [post], "after": None, "before": None}}
+            response = requests_lib.Response()
+            response.status_code = 200
+            response.headers["Content-Type"] = "application/json"
+            response._content = json.dumps(payload).encode("utf-8")
+            response.url = request.url
+            response.request = request
+            return response
+
+        def close(self):
+            pass
+
+    session = requests_lib.Session()
+    session.mount("https://", RedditAdapter())
+    llms, make_llm = fake_llm
+    monkeypatch.setattr(query_reddit, "ChatOpenAI", make_llm)
+    monkeypatch.setattr(query_reddit, "build_agent_executor", lambda llm, tools: None)
+    monkeypatch.setattr(query_reddit, "get_requests_session", lambda: session)
+    source = query_reddit.RedditSource("openai-key", "client-id", "client-secret", "judgebot-test")
+
+    for count in (1, 2):
+        assert source.query(QUESTION, mode="direct") == "Excess damage goes to the player."
+        searches = [path for method, path in sent if method == "GET"]
+        assert len(searches) == count
+        assert len(llms) == 1 and len(llms[0].prompts) == count
+
+    assert searches[0] == "/r/mtgrules+magicTCG/search/"
+    assert "Trample and chump blockers" in llms[0].prompts[0]
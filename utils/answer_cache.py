@@ -0,0 +1,159 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+
+DEFAULT_ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache")
+# Written next to the store by create_database_rag.py
+MANIFEST_FILENAME = "manifest.json"
+# manifest path -> ((mtime_ns, size), version)
+_versions = {}
+
+
+def corpus_version(store_path):
+    """
+    Return a short hash of the store's manifest, which changes whenever any
+    indexed source changes. Empty if the store has no manifest.
+    Cheap enough to call on every lookup: the manifest is only re-read when
+    its mtime or size changes.
+    """
+    manifest_path = os.path.join(store_path, MANIFEST_FILENAME)
+    try:
+        stat = os.stat(manifest_path)
+    except FileNotFoundError:
+        return ""
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _versions.get(manifest_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(manifest_path, "rb") as file:
+        version = hashlib.sha256(file.read()).hexdigest()[:16]
+    _versions[manifest_path] = (key, version)
+    return version
+
+
+class SemanticAnswerCache:
+    """
+    On-disk cache of final answers keyed by query embedding.
+
+    A new question is answered from the cache when its embedding has cosine
+    similarity >= threshold with a cached question in the same namespace
+    ("rag", "combined", ...), corpus version and anchors, so rephrasings of
+    the same question skip retrieval and the LLM. anchors is a string naming
+    what the question is specifically about (cited rule numbers, keywords),
+    since "what does 702.19b say" and "what does 702.19c say" embed almost
+    identically. Entries expire after ttl seconds and
+    the least recently used ones are dropped beyond max_entries. Embeddings of
+    each (namespace, corpus version) are held in memory as one normalized
+    matrix, so a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, path=DEFAULT_ANSWER_CACHE_PATH, threshold=0.95, max_entries=1000, ttl=7 * 24 * 3600):
+        os.makedirs(path, exist_ok=True)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self._lock = threading.Lock()
+        self._scopes = {}
+        self._conn = sqlite3.connect(os.path.join(path, "answers.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, namespace TEXT NOT NULL, corpus_version TEXT NOT NULL, "
+            "query TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(answers)")]
+        if "anchors" not in columns:
+            self._conn.execute("ALTER TABLE answers ADD COLUMN anchors TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (namespace, corpus_version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._conn.commit()
+
+    def _scope(self, namespace, corpus_version, anchors):
+        """
+        Return (ids, matrix) of the live entries in a scope, loading them on first use.
+        """
+        key = (namespace, corpus_version, anchors)
+        if key not in self._scopes:
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM answers "
+                "WHERE namespace = ? AND corpus_version = ? AND anchors = ? AND created >= ?",
+                (namespace, corpus_version, anchors, time.time() - self.ttl),
+            ).fetchall()
+            ids = [row[0] for row in rows]
+            matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+            self._scopes[key] = (ids, matrix)
+        return self._scopes[key]
+
+    def lookup(self, embedding, namespace="rag", corpus_version="", anchors=""):
+        """
+        Return the cached answer for the most similar question, or None.
+        """
+        started = time.perf_counter()
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            ids, matrix = self._scope(namespace, corpus_version, anchors)
+            row = None
+            if matrix is not None and matrix.shape[1] == query.shape[0]:
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    row = self._conn.execute(
+                        "SELECT answer, created FROM answers WHERE id = ?", (ids[best],)
+                    ).fetchone()
+            if row is None or row[1] < time.time() - self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), ids[best]))
+            self._conn.commit()
+            self.hits += 1
+            self.hit_seconds += time.perf_counter() - started
+        return row[0]
+
+    def store(self, query_text, embedding, answer, namespace="rag", corpus_version="", anchors=""):
+        """
+        Cache an answer, dropping expired and least recently used entries.
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (namespace, corpus_version, anchors, query, embedding, answer, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (namespace, corpus_version, anchors, query_text, vector.tobytes(), answer, now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+            self._scopes = {}
+
+    def stats(self):
+        """
+        Return hit/miss counters, the mean hit latency and the number of cached answers.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "hit_ms": 1000 * self.hit_seconds / self.hits if self.hits else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._scopes = {}
+            self._conn.close()
@@ -0,0 +1,144 @@
+import json
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tracing import span
+
+
+def question_id(query_text):
+    """
+    Stable id for a question without one: a short hash of its normalized text.
+    """
+    return hashlib.sha256(" ".join(query_text.split()).encode("utf-8")).hexdigest()[:12]
+
+
+def read_questions(path):
+    """
+    Read questions from a file with one per line: either JSON objects with
+    "query_text" (or "question") and an optional "id", or plain text.
+    Blank lines, repeated ids and malformed JSON lines are skipped, the
+    latter with their line number printed.
+    Returns [{"id": ..., "query_text": ...}, ...] in file order.
+    """
+    questions, seen = [], set()
+    with open(path, "r") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    print(f"Skipping line {number} of {path}: invalid JSON ({e}).")
+                    continue
+                query_text = record.get("query_text") or record.get("question")
+                qid = record.get("id")
+            else:
+                query_text, qid = line, None
+            if not query_text:
+                continue
+            qid = str(qid) if qid is not None else question_id(query_text)
+            if qid in seen:
+                continue
+            seen.add(qid)
+            questions.append({"id": qid, "query_text": query_text})
+    return questions
+
+
+def completed_ids(output_path):
+    """
+    Return the ids already answered without error in an output file.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            if "error" in record:
+                done.discard(record.get("id"))
+            else:
+                done.add(record.get("id"))
+    return done
+
+
+def run_batch(questions, answer, output_path, concurrency=8, prepare=None):
+    """
+    Answer questions with up to concurrency in flight, appending one JSON
+    line per question to output_path as soon as it finishes.
+    prepare(questions) does the batched work up front (embedding, retrieval)
+    and returns one item per question; answer(question, item) returns the
+    record fields ({"answer": ..., "sources": ...}, optionally "timings" to
+    add to the measured ones, or "error" to have the question retried).
+    Questions already answered in output_path are skipped, so a restarted
+    run resumes where it stopped; failed questions are retried.
+    Returns summary stats, including questions per minute.
+    """
+    done = completed_ids(output_path)
+    pending = [question for question in questions if question["id"] not in done]
+    print(f"\n{len(pending)} of {len(questions)} questions to answer, {len(questions) - len(pending)} already in {output_path}.\n")
+
+    started = time.perf_counter()
+    items = [None] * len(pending)
+    if prepare is not None and pending:
+        with span("batch_prepare", questions=len(pending)):
+            items = prepare(pending)
+    prepare_seconds = time.perf_counter() - started
+    prepare_share = prepare_seconds / len(pending) if pending else 0.0
+
+    def run_one(question, item):
+        answer_started = time.perf_counter()
+        record = {"id": question["id"], "query_text": question["query_text"]}
+        try:
+            with span("batch_question", question_id=question["id"]):
+                record.update(answer(question, item))
+        except Exception as e:
+            record["error"] = str(e)
+        record["timings"] = dict(
+            record.get("timings", {}),
+            prepare_seconds=round(prepare_share, 4),
+            answer_seconds=round(time.perf_counter() - answer_started, 4),
+        )
+        return record
+
+    # Start on a fresh line if an interrupted run left a partial one
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb+") as output:
+            output.seek(-1, os.SEEK_END)
+            if output.read(1) != b"\n":
+                output.write(b"\n")
+
+    answered, failed = 0, 0
+    with open(output_path, "a") as output, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_one, question, item) for question, item in zip(pending, items)]
+        for future in as_completed(futures):
+            record = future.result()
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            if "error" in record:
+                failed += 1
+                print(f"[{answered + failed}/{len(pending)}] {record['id']} failed: {record['error']}")
+            else:
+                answered += 1
+                print(f"[{answered + failed}/{len(pending)}] {record['id']} answered in {record['timings']['answer_seconds']:.1f}s")
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "questions": len(pending),
+        "answered": answered,
+        "failed": failed,
+        "skipped": len(questions) - len(pending),
+        "concurrency": concurrency,
+        "prepare_seconds": round(prepare_seconds, 3),
+        "seconds": round(seconds, 3),
+        "per_minute": round(60 * len(pending) / seconds, 1) if pending and seconds else 0.0,
+    }
+    print(f"\nBatch done: {stats}\n")
+    return stats
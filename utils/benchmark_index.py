@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import numpy as np
+from langchain_chroma import Chroma
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from numpy_index import NumpyVectorStore
+
+
+def export_chroma_to_numpy(chroma_path, numpy_path):
+    """
+    Copy vectors, texts and metadata from a Chroma store into a NumpyVectorStore.
+    No embedding calls are made.
+    """
+    db = Chroma(persist_directory=chroma_path)
+    data = db._collection.get(include=["embeddings", "metadatas", "documents"])
+    store = NumpyVectorStore(numpy_path)
+    store.upsert(data["ids"], data["embeddings"], data["metadatas"], data["documents"])
+    store.persist()
+    print(f"Exported {len(data['ids'])} chunks from {chroma_path} to {numpy_path}.")
+
+
+def time_backend(name, open_store, queries, k):
+    """
+    Time cold start (open + first query) and steady-state query latency.
+    """
+    started = time.perf_counter()
+    store = open_store()
+    store.similarity_search_by_vector_with_relevance_scores(queries[0], k=k)
+    cold_start = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for query in queries:
+        store.similarity_search_by_vector_with_relevance_scores(query, k=k)
+    per_query = (time.perf_counter() - started) / len(queries)
+
+    print(f"{name:>6}: cold start {cold_start * 1000:.1f} ms, query {per_query * 1000:.3f} ms")
+    return {"cold_start": cold_start, "per_query": per_query}
+
+
+def benchmark(chroma_path, numpy_path, n_queries=200, k=4):
+    """
+    Compare the Chroma and NumPy backends on the same vectors.
+    Stored vectors (plus a little noise) are used as queries, so no API key is needed.
+    """
+    if not os.path.exists(os.path.join(numpy_path, "vectors.npy")):
+        export_chroma_to_numpy(chroma_path, numpy_path)
+
+    vectors = np.load(os.path.join(numpy_path, "vectors.npy"), mmap_mode="r")
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, vectors.shape[0], size=n_queries)
+    queries = [(vectors[row] + rng.normal(0, 0.01, vectors.shape[1])).tolist() for row in rows]
+
+    results = {
+        "chroma": time_backend("chroma", lambda: Chroma(persist_directory=chroma_path), queries, k),
+        "numpy": time_backend("numpy", lambda: NumpyVectorStore(numpy_path), queries, k),
+    }
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the Chroma and NumPy vector backends.")
+    parser.add_argument("--chroma_path", type=str, default="chroma", help="Path to the Chroma store.")
+    parser.add_argument("--numpy_path", type=str, default="numpy_index", help="Path to the NumPy index.")
+    parser.add_argument("--n_queries", type=int, default=200, help="Number of queries to time.")
+    parser.add_argument("--k", type=int, default=4, help="Results per query.")
+
+    args = parser.parse_args()
+
+    benchmark(args.chroma_path, args.numpy_path, n_queries=args.n_queries, k=args.k)
+
+# python utils/benchmark_index.py --chroma_path chroma --numpy_path numpy_index
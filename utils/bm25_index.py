@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import numpy as np
+
+BM25_ARRAYS_FILENAME = "bm25.npz"
+BM25_VOCAB_FILENAME = "bm25.json"
+
+# Rule numbers such as 702.19b stay whole so they can be matched exactly
+TOKEN_RE = re.compile(r"\d{3}\.\d+[a-z]?|[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have if in is it its of on or "
+    "that the their this to was when which with you your i my me".split()
+)
+
+
+def tokenize(text):
+    """
+    Lowercase and split text into BM25 terms, dropping common stopwords.
+    """
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Compact in-memory BM25 index.
+
+    Postings are stored CSR-style: offsets[term_id]:offsets[term_id + 1]
+    slices the doc_ids (int32) and precomputed BM25 weights (float32) of a term,
+    so a query is a handful of numpy scatter-adds.
+    """
+
+    def __init__(self, ids, vocab, offsets, doc_ids, weights):
+        self.ids = ids
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+
+    @classmethod
+    def build(cls, ids, texts, k1=1.5, b=0.75):
+        """
+        Build the index from parallel lists of chunk ids and texts.
+        """
+        vocab = {}
+        postings = []
+        doc_lengths = np.zeros(len(ids), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_id = vocab.setdefault(token, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc, count))
+
+        n_docs = max(len(ids), 1)
+        average_length = float(doc_lengths.mean()) if len(ids) else 1.0
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        for term_id, term_postings in enumerate(postings):
+            offsets[term_id + 1] = offsets[term_id] + len(term_postings)
+        doc_ids = np.empty(int(offsets[-1]), dtype=np.int32)
+        weights = np.empty(int(offsets[-1]), dtype=np.float32)
+        for term_id, term_postings in enumerate(postings):
+            start, end = offsets[term_id], offsets[term_id + 1]
+            docs = np.fromiter((doc for doc, _ in term_postings), dtype=np.int32, count=len(term_postings))
+            tf = np.fromiter((count for _, count in term_postings), dtype=np.float32, count=len(term_postings))
+            idf = np.log(1.0 + (n_docs - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            norm = k1 * (1.0 - b + b * doc_lengths[docs] / average_length)
+            doc_ids[start:end] = docs
+            weights[start:end] = idf * tf * (k1 + 1.0) / (tf + norm)
+        return cls(list(ids), vocab, offsets, doc_ids, weights)
+
+    def search(self, query_text, k=4):
+        """
+        Return [(chunk_id, score), ...] for the k best matching chunks.
+        """
+        term_ids = [self.vocab[token] for token in set(tokenize(query_text)) if token in self.vocab]
+        if not term_ids or not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        k = min(k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[doc], float(scores[doc])) for doc in top if scores[doc] > 0]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        arrays_path = os.path.join(path, BM25_ARRAYS_FILENAME)
+        vocab_path = os.path.join(path, BM25_VOCAB_FILENAME)
+        with open(arrays_path + ".tmp", "wb") as file:
+            np.savez(file, offsets=self.offsets, doc_ids=self.doc_ids, weights=self.weights)
+        with open(vocab_path + ".tmp", "w") as file:
+            json.dump({"ids": self.ids, "terms": list(self.vocab)}, file)
+        os.replace(arrays_path + ".tmp", arrays_path)
+        os.replace(vocab_path + ".tmp", vocab_path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a saved index, or return None if path has none.
+        """
+        arrays_path = os.path.join(path, BM25_ARRAYS_FILENAME)
+        vocab_path = os.path.join(path, BM25_VOCAB_FILENAME)
+        if not os.path.exists(arrays_path):
+            return None
+        with open(vocab_path, "r") as file:
+            data = json.load(file)
+        arrays = np.load(arrays_path)
+        vocab = {term: term_id for term_id, term in enumerate(data["terms"])}
+        return cls(data["ids"], vocab, arrays["offsets"], arrays["doc_ids"], arrays["weights"])
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse several ranked lists of keys. Returns keys ordered by sum of 1 / (k + rank).
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
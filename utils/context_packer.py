@@ -0,0 +1,133 @@
+import re
+
+from embedding_pipeline import estimate_tokens
+
+RULE_NUMBER_RE = re.compile(r"^(\d+)(?:\.(\d+)([a-z]?))?$")
+SEPARATOR = "\n\n---\n\n"
+
+
+def make_span(text, source="", start=None, end=None, rule=""):
+    """
+    Describe one piece of context. start/end are character offsets of text in source, if known.
+    """
+    if start is not None and end is None:
+        end = start + len(text)
+    return {"text": text, "source": source, "start": start, "end": end, "rule": rule}
+
+
+def span_from_document(doc):
+    """
+    Build a span from a retrieved chunk using its start_index metadata.
+    """
+    metadata = doc.metadata
+    rule = f"glossary:{metadata['term']}" if metadata.get("kind") == "glossary" else metadata.get("rule", "")
+    return make_span(
+        doc.page_content,
+        source=metadata.get("source", ""),
+        start=metadata.get("start_index"),
+        end=metadata.get("end_index"),
+        rule=rule,
+    )
+
+
+def rule_sort_key(rule):
+    """
+    Order numbered rules numerically (100.2 < 100.10, 702.19 < 702.19a); everything else after.
+    """
+    match = RULE_NUMBER_RE.match(rule or "")
+    if not match:
+        return (1, 0, 0, "")
+    chapter, number, letter = match.groups()
+    return (0, int(chapter), int(number or 0), letter or "")
+
+
+def merge_spans(spans, max_gap=2):
+    """
+    Merge spans from the same source that overlap or touch (up to max_gap
+    characters apart), and drop exact duplicates of spans without offsets.
+    Each merged span keeps the best (lowest) priority of its pieces.
+    """
+    located, loose = {}, {}
+    for priority, span in enumerate(spans):
+        if span["start"] is None:
+            loose.setdefault(span["text"], (priority, span))
+        else:
+            located.setdefault(span["source"], []).append((priority, span))
+
+    merged = list(loose.values())
+    for source, pieces in located.items():
+        pieces.sort(key=lambda piece: (piece[1]["start"], -piece[1]["end"]))
+        current_priority, current = pieces[0][0], dict(pieces[0][1])
+        for priority, span in pieces[1:]:
+            if span["start"] <= current["end"] + max_gap:
+                if span["end"] > current["end"]:
+                    overlap = current["end"] - span["start"]
+                    joiner = "" if overlap >= 0 else "\n" * -overlap
+                    current["text"] += joiner + span["text"][max(overlap, 0):]
+                    current["end"] = span["end"]
+                current_priority = min(current_priority, priority)
+            else:
+                merged.append((current_priority, current))
+                current_priority, current = priority, dict(span)
+        merged.append((current_priority, current))
+    return merged
+
+
+def truncate_span(span, max_tokens):
+    """
+    Cut a span to at most max_tokens, keeping whole lines (each subrule is
+    its own line); a first line that is too long on its own is cut at a word.
+    """
+    kept, used = [], 0
+    for line in span["text"].split("\n"):
+        tokens = estimate_tokens(line + "\n")
+        if used + tokens > max_tokens:
+            if not kept:
+                words = line.split(" ")
+                while words and estimate_tokens(" ".join(words)) > max_tokens:
+                    words = words[:max(len(words) * 3 // 4, len(words) - 1)]
+                kept.append(" ".join(words))
+            break
+        kept.append(line)
+        used += tokens
+    text = "\n".join(kept).rstrip()
+    end = span["start"] + len(text) if span["start"] is not None else None
+    return dict(span, text=text, end=end)
+
+
+def pack_context(spans, max_tokens=2000):
+    """
+    Merge overlapping spans, keep the highest-priority ones that fit in
+    max_tokens, and join them in rule-number order.
+    spans should be given in priority order (most important first). The
+    first one is always kept: if it alone is over budget (e.g. a long cited
+    rule), it is cut at a line boundary to fit.
+    Returns (context_text, stats) where stats reports tokens before/after packing.
+    """
+    tokens_before = sum(estimate_tokens(span["text"]) for span in spans)
+    tokens_before += estimate_tokens(SEPARATOR) * max(len(spans) - 1, 0)
+
+    kept, used, truncated = [], 0, 0
+    separator_tokens = estimate_tokens(SEPARATOR)
+    for priority, span in sorted(merge_spans(spans), key=lambda item: item[0]):
+        tokens = estimate_tokens(span["text"]) + (separator_tokens if kept else 0)
+        if used + tokens > max_tokens:
+            if kept:
+                continue
+            span = truncate_span(span, max_tokens)
+            tokens = estimate_tokens(span["text"])
+            truncated += 1
+        kept.append((priority, span))
+        used += tokens
+
+    kept.sort(key=lambda item: (rule_sort_key(item[1]["rule"]), item[0]))
+    context_text = SEPARATOR.join(span["text"] for _, span in kept)
+    stats = {
+        "spans_in": len(spans),
+        "spans_out": len(kept),
+        "spans_truncated": truncated,
+        "tokens_before": tokens_before,
+        "tokens": used,
+        "tokens_saved": max(tokens_before - used, 0),
+    }
+    return context_text, stats
@@ -2,48 +2,74 @@ import os
 import shutil
 import sys
 import json  # Added since you use json in the function
+import hashlib
+import itertools
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import DirectoryLoader
+from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from dotenv import load_dotenv
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 
+from rules_parser import is_rules_document, split_rules
+from embedding_cache import DEFAULT_CACHE_PATH, cached_openai_embeddings
+from embedding_pipeline import DEFAULT_MAX_WORKERS, embed_and_store, store_writer
+from numpy_index import NumpyVectorStore
+from bm25_index import BM25_ARRAYS_FILENAME, BM25Index
+from rules_index import RulesIndex
+from source_texts import SourceTexts
 
-def load_documents(
+MANIFEST_FILENAME = "manifest.json"
+# LangChain's default collection, which the query side opens
+CHROMA_COLLECTION_NAME = "langchain"
+
+
+def iter_documents(
     data_path,
     json_directory):
     """
-    Load documents from the data directory, supporting both text and JSON formats.
+    Lazily yield documents from the data directory, supporting both text and JSON formats.
+    Only one file is held in memory at a time. Every file is its own source,
+    so a source's documents are always adjacent; a JSON file's own 'source'
+    metadata is kept as 'origin'.
     """
-    # Load text documents
-    loader = DirectoryLoader(os.path.join(data_path), glob="*.txt")
-    documents = loader.load()
+    # Load text documents verbatim so rule numbering and offsets are preserved
+    loader = DirectoryLoader(
+        os.path.join(data_path),
+        glob="*.txt",
+        loader_cls=TextLoader,
+        loader_kwargs={"encoding": "utf-8"},
+    )
+    yield from loader.lazy_load()
 
     # Load JSON documents
-    json_documents = []
     for filename in os.listdir(os.path.join(data_path, json_directory)):
         if filename.endswith('.json'):
             with open(os.path.join(json_directory, filename), 'r') as file:
                 try:
                     data = json.load(file)
-                    document = Document(data['content'], metadata=data.get('metadata', {}))
-                    json_documents.append(document)
+                    metadata = dict(data.get('metadata', {}))
+                    path = os.path.join(json_directory, filename)
+                    if metadata.get('source', path) != path:
+                        metadata['origin'] = metadata['source']
+                    metadata['source'] = path
+                    document = Document(data['content'], metadata=metadata)
                 except KeyError as e:
                     print(f"Error processing {filename}: Missing key {e}")
+                    continue
                 except json.JSONDecodeError:
                     print(f"Error decoding JSON file {filename}")
-
-    res = documents + json_documents
-    print(f"Loaded {len(res)} documents.")
-    return res
+                    continue
+            yield document
 
 
-def split_text(documents: list[Document], verbose=True):
+def iter_chunks(documents):
     """
-    Split the text into chunks.
+    Lazily split documents into chunks, one document at a time.
+    The Comprehensive Rules get one chunk per rule, subrule and glossary entry;
+    everything else goes through the generic character splitter.
     """
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=300,
@@ -51,49 +77,279 @@ def split_text(documents: list[Document], verbose=True):
         length_function=len,
         add_start_index=True,
     )
-    chunks = text_splitter.split_documents(documents)
-    print(f"Split {len(documents)} documents into {len(chunks)} chunks.")
+    for document in documents:
+        if is_rules_document(document):
+            yield from split_rules(document)
+        else:
+            yield from text_splitter.split_documents([document])
 
-    if verbose:
-        sample_document = chunks[10] if len(chunks) > 10 else chunks[0]
-        print(f"Sample document content: {sample_document.page_content}")
-        print(f"Sample document metadata: {sample_document.metadata}")
 
-    return chunks
+def hash_text(text):
+    """
+    Return the SHA-256 hex digest of a string.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
-def save_to_chroma(chroma_path, chunks: list[Document], openai_api_key):
+def assign_chunk_ids(chunks: list[Document]):
     """
-    Save the chunks to the Chroma vector database.
+    Give each chunk a stable ID derived from its source and content.
+    Identical chunks within one source get a numeric suffix.
     """
-    # Remove DB if it exists
-    if os.path.exists(chroma_path):
-        shutil.rmtree(chroma_path)
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        base = hash_text(f"{chunk.metadata.get('source', '')}\x00{chunk.page_content}")
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        ids.append(base if count == 0 else f"{base}-{count}")
+    return ids
+
+
+def load_manifest(chroma_path):
+    """
+    Load the manifest describing what is currently indexed in chroma_path.
+    """
+    manifest_path = os.path.join(chroma_path, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {"sources": {}}
+    with open(manifest_path, 'r') as file:
+        return json.load(file)
+
+
+def save_manifest(chroma_path, manifest):
+    """
+    Write the manifest next to the Chroma database.
+    """
+    os.makedirs(chroma_path, exist_ok=True)
+    manifest_path = os.path.join(chroma_path, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_path)
+
+
+def open_store(
+    chroma_path,
+    openai_api_key,
+    embedding_cache_path=DEFAULT_CACHE_PATH,
+    openai_api_base=None,
+    backend="chroma"):
+    """
+    Open (or create) the vector store with the cached embedding function.
+    backend is "chroma" or "numpy" (memory-mapped NumpyVectorStore); either
+    way chroma_path is the directory holding the store and its manifest.
+    Returns (db, collection, embedding_function). collection takes writes
+    with precomputed embeddings (get/upsert/update/delete): the chromadb
+    collection behind the Chroma store, or the NumpyVectorStore itself.
+    """
+    embedding_function = cached_openai_embeddings(
+        openai_api_key,
+        cache_path=embedding_cache_path,
+        openai_api_base=openai_api_base)
+    if backend == "numpy":
+        db = NumpyVectorStore(chroma_path, embedding_function=embedding_function)
+        return db, db, embedding_function
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector backend: {backend}")
+    import chromadb
 
-    # Create new DB from documents.
-    db = Chroma.from_documents(
-        chunks,
-        OpenAIEmbeddings(openai_api_key=openai_api_key),
-        persist_directory=chroma_path
+    # One client for both, so the LangChain store sees what the collection writes
+    client = chromadb.PersistentClient(path=chroma_path)
+    collection = client.get_or_create_collection(CHROMA_COLLECTION_NAME)
+    db = Chroma(
+        client=client,
+        collection_name=CHROMA_COLLECTION_NAME,
+        persist_directory=chroma_path,
+        embedding_function=embedding_function,
     )
-    # Persist the database
-    db.persist()
-    print(f"Saved {len(chunks)} chunks to {chroma_path}.")
+    return db, collection, embedding_function
+
+
+def release_chroma_clients():
+    """
+    Drop chromadb's cached clients, which are shared per path and would keep
+    writing to files that a rebuild deleted.
+    """
+    if "chromadb" not in sys.modules:
+        return
+    import chromadb
+
+    # SharedSystemClient is private (chromadb 0.4.x-0.5.x); look it up defensively
+    # so a chromadb that moves it skips the clear instead of failing the rebuild
+    shared_client = getattr(getattr(chromadb.api, "client", None), "SharedSystemClient", None)
+    clear_system_cache = getattr(shared_client, "clear_system_cache", None)
+    if clear_system_cache is not None:
+        clear_system_cache()
+
+
+def refresh_metadata(collection, retained):
+    """
+    Update metadata of chunks that are already embedded, e.g. when their offsets moved.
+    """
+    if retained:
+        retained_ids = list(retained)
+        collection.update(
+            ids=retained_ids,
+            metadatas=[retained[chunk_id].metadata for chunk_id in retained_ids],
+        )
+
+
+def build_lexical_index(collection, path, source_texts=None):
+    """
+    Rebuild the BM25 index from every chunk currently in the store.
+    Reads texts back from the store, so unchanged sources need no re-splitting;
+    chunks stored without text are read from their source file.
+    """
+    data = collection.get(include=["documents", "metadatas"])
+    ids, texts = data["ids"], list(data["documents"])
+    owned = source_texts is None
+    source_texts = source_texts or SourceTexts()
+    try:
+        for index, (text, metadata) in enumerate(zip(texts, data["metadatas"])):
+            if not text and "byte_start" in metadata:
+                texts[index] = source_texts.text(
+                    metadata["source"], metadata["byte_start"], metadata["byte_end"],
+                    metadata.get("source_bytes"), metadata.get("source_sha256"))
+    finally:
+        if owned:
+            source_texts.close()
+    BM25Index.build(ids, texts).save(path)
+    print(f"Built BM25 index over {len(ids)} chunks.")
+
+
+def sync_sources(documents, collection, old_sources, new_sources, counts, index_path=None, source_texts=None):
+    """
+    Compare documents against the manifest one source at a time.
+    Documents of one source must be adjacent, as iter_documents yields them.
+
+    Unchanged sources are skipped without splitting. For changed sources,
+    vanished chunks are deleted and retained chunks get their metadata
+    refreshed right away, and every chunk that needs embedding is yielded as
+    (chunk_id, chunk). new_sources and counts are filled in as sources are consumed.
+    With index_path, the rule-number index is rebuilt there whenever the
+    Comprehensive Rules change (or the index is missing). With source_texts,
+    chunks of single-file sources (and the rule-number index) get byte
+    offsets into that file.
+    """
+    seen = set()
+    for source, source_documents in itertools.groupby(documents, key=lambda document: document.metadata.get('source', '')):
+        if source in seen:
+            # A second group would overwrite the first one's manifest entry
+            raise ValueError(f"Documents of source {source} are not adjacent.")
+        seen.add(source)
+        source_documents = list(source_documents)
+        counts["documents"] += len(source_documents)
+        source_hash = hash_text("\x00".join(document.page_content for document in source_documents))
+        previous = old_sources.get(source)
+
+        if index_path is not None:
+            unchanged = previous and previous["hash"] == source_hash
+            for document in source_documents:
+                if is_rules_document(document) and not (unchanged and RulesIndex.load(index_path) is not None):
+                    RulesIndex.build(document.page_content, source, source_texts).save(index_path)
+                    print(f"Built rule-number index for {source}.")
+
+        if previous and previous["hash"] == source_hash:
+            new_sources[source] = previous
+            continue
+
+        chunks = list(iter_chunks(source_documents))
+        chunk_ids = assign_chunk_ids(chunks)
+        for chunk, chunk_id in zip(chunks, chunk_ids):
+            chunk.metadata["chunk_id"] = chunk_id
+        if source_texts is not None and len(source_documents) == 1:
+            source_texts.locate(source_documents[0], chunks)
+        old_ids = set(previous["chunk_ids"]) if previous else set()
+        stale_ids = old_ids - set(chunk_ids)
+        if stale_ids:
+            collection.delete(ids=list(stale_ids))
+            counts["deleted"] += len(stale_ids)
+        retained = {chunk_id: chunk for chunk, chunk_id in zip(chunks, chunk_ids) if chunk_id in old_ids}
+        refresh_metadata(collection, retained)
+        counts["retained"] += len(retained)
+        new_sources[source] = {"hash": source_hash, "chunk_ids": chunk_ids}
+
+        for chunk, chunk_id in zip(chunks, chunk_ids):
+            if chunk_id not in old_ids:
+                counts["new"] += 1
+                yield chunk_id, chunk
 
 
 def create_database(
     data_path,
     json_directory,
     chroma_path,
-    openai_api_key):
+    openai_api_key,
+    rebuild=False,
+    embedding_cache_path=DEFAULT_CACHE_PATH,
+    max_workers=DEFAULT_MAX_WORKERS,
+    openai_api_base=None,
+    backend="chroma",
+    store_text=True):
     """
-    Full pipeline: Load documents, split text, and save to the Chroma database.
+    Full pipeline: Load documents, split text, and save to the Chroma database
+    (or the NumPy index with backend="numpy").
+
+    Documents are read, split and handed to the embedding stage lazily, so
+    memory stays flat and embedding starts with the first changed source.
+    Sources whose content hash matches the manifest are skipped, so only
+    new or changed chunks are embedded. Pass rebuild=True to start from scratch.
+
+    With store_text=False, chunks of text files are stored as embeddings plus
+    byte offsets only, and their text is read from the (memory-mapped) source
+    file at query time. Switching modes rebuilds the store from the embedding cache.
     """
-    documents = load_documents(
-        data_path,
-        json_directory)
-    chunks = split_text(documents)
-    save_to_chroma(chroma_path, chunks, openai_api_key)
+    previous = load_manifest(chroma_path)
+    has_manifest = os.path.exists(os.path.join(chroma_path, MANIFEST_FILENAME))
+    if not rebuild and not has_manifest and os.path.isdir(chroma_path) and os.listdir(chroma_path):
+        # Built before the manifest existed, with random ids: adding would duplicate every chunk
+        print(f"{chroma_path} has no manifest, rebuilding it.")
+        rebuild = True
+    if not rebuild and previous["sources"] and previous.get("store_text", True) != store_text:
+        print(f"Chunk text mode changed, rebuilding {chroma_path}.")
+        rebuild = True
+    if rebuild and os.path.exists(chroma_path):
+        shutil.rmtree(chroma_path)
+        release_chroma_clients()
+
+    manifest = load_manifest(chroma_path)
+    # A manifest written for another backend says nothing about this store
+    old_sources = manifest["sources"] if manifest.get("backend", "chroma") == backend else {}
+    new_sources = {}
+    counts = {"documents": 0, "new": 0, "deleted": 0, "retained": 0}
+    source_texts = SourceTexts()
+
+    db, collection, embedding_function = open_store(chroma_path, openai_api_key, embedding_cache_path, openai_api_base, backend)
+    items = sync_sources(
+        iter_documents(data_path, json_directory),
+        collection,
+        old_sources,
+        new_sources,
+        counts,
+        index_path=chroma_path,
+        source_texts=source_texts)
+    embed_and_store(items, embedding_function, store_writer(collection, store_text), max_workers=max_workers)
+
+    for source in old_sources.keys() - new_sources.keys():
+        if old_sources[source]["chunk_ids"]:
+            collection.delete(ids=old_sources[source]["chunk_ids"])
+        counts["deleted"] += len(old_sources[source]["chunk_ids"])
+
+    if counts["new"] or counts["deleted"] or counts["retained"]:
+        db.persist()
+        build_lexical_index(collection, chroma_path, source_texts)
+        print(f"Saved {counts['new']} new chunks to {chroma_path}, deleted {counts['deleted']} stale chunks, "
+              f"refreshed {counts['retained']} unchanged chunks from {counts['documents']} documents.")
+    else:
+        if not os.path.exists(os.path.join(chroma_path, BM25_ARRAYS_FILENAME)):
+            build_lexical_index(collection, chroma_path, source_texts)
+        print(f"No source changes in {counts['documents']} documents, {chroma_path} is up to date.")
+    print(f"Embedding cache: {embedding_function.cache.stats()}")
+    embedding_function.cache.close()
+    source_texts.close()
+
+    save_manifest(chroma_path, {"backend": backend, "store_text": store_text, "sources": new_sources})
 
 
 if __name__ == "__main__":
@@ -101,9 +357,15 @@ if __name__ == "__main__":
     load_dotenv(dotenv_path)
 
     openai_api_key = os.getenv('OPENAI_API_KEY')
-    chroma_path = os.getenv('CHROMA_PATH')
+    backend = os.getenv('VECTOR_BACKEND', 'chroma')
+    chroma_path = os.getenv('NUMPY_INDEX_PATH', 'numpy_index') if backend == 'numpy' else os.getenv('CHROMA_PATH')
     data_path = os.getenv('DATA_PATH')
     json_directory = os.getenv('JSON_DIRECTORY')
+    embedding_cache_path = os.getenv('EMBEDDING_CACHE_PATH', DEFAULT_CACHE_PATH)
+    # Point at a local fake embeddings server for load testing
+    openai_api_base = os.getenv('EMBEDDING_API_BASE')
+    # STORE_CHUNK_TEXT=0 keeps only embeddings and source offsets in the store
+    store_text = os.getenv('STORE_CHUNK_TEXT', '1') != '0'
 
     print(f"\nCreating database with data_path={data_path}, json_directory={json_directory}, chroma_path={chroma_path}, openai_api_key={openai_api_key[:5]}...\n")
 
@@ -111,4 +373,8 @@ if __name__ == "__main__":
         data_path,
         json_directory,
         chroma_path,
-        openai_api_key)
\ No newline at end of file
+        openai_api_key,
+        embedding_cache_path=embedding_cache_path,
+        openai_api_base=openai_api_base,
+        backend=backend,
+        store_text=store_text)
\ No newline at end of file
@@ -0,0 +1,304 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on Windows; one process per cache there
+    fcntl = None
+
+from tracing import count, span
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache")
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+# langchain_openai's default; part of every cache key
+DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by model name + text hash.
+
+    A SQLite table maps each key to a slot in a flat float32 file that is read
+    through a memory map. When max_entries is reached the least recently used
+    slots are reused. Several processes may share one cache (e.g. the CLI and
+    the server): writes hold an exclusive lock on the cache's lock file and
+    reads a shared one, and a reused slot is unmapped in the index before its
+    vector is overwritten, so a key never points at another text's vector.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        self._map = None
+        open(self._vectors_path, "ab").close()
+        self._lock_file = open(os.path.join(path, "cache.lock"), "a")
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        """
+        Hold the cross-process lock on the cache; call with self._lock held.
+        """
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _vectors(self, slot):
+        """
+        Return a memory map of the vector file that covers the given slot.
+        """
+        if self._map is None or slot >= self._map.shape[0]:
+            count = os.path.getsize(self._vectors_path) // (4 * self.dim)
+            self._map = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim)) if count else None
+        return self._map
+
+    def _lookup(self, keys):
+        """
+        Return {key: slot} for the keys that are present in the index.
+        """
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def get_many(self, model, texts):
+        """
+        Look up embeddings for texts. Returns a list with None for every miss.
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        results = [None] * len(texts)
+        found = {}
+        with self._lock, self._file_lock(exclusive=False):
+            if self.dim is None:
+                # Another process may have stored the first vectors since we opened
+                row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+                self.dim = int(row[0]) if row else None
+            if self.dim is not None:
+                found = self._lookup(keys)
+                for index, key in enumerate(keys):
+                    slot = found.get(key)
+                    if slot is not None:
+                        vectors = self._vectors(slot)
+                        if vectors is not None and slot < vectors.shape[0]:
+                            results[index] = vectors[slot].tolist()
+            hit_count = sum(result is not None for result in results)
+            self.hits += hit_count
+            self.misses += len(texts) - hit_count
+        if found:
+            # Recency only orders eviction, so it is written after the read lock is released
+            now = time.time()
+            with self._lock, self._file_lock(exclusive=True):
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return results
+
+    def _free_slots(self, used_count, next_slot, n):
+        """
+        Return up to n slots below max_entries that no entry uses: holes left
+        by an interrupted write first, then slots past the end of the file.
+        """
+        free = []
+        if next_slot > used_count:
+            used = {slot for (slot,) in self._conn.execute("SELECT slot FROM entries")}
+            free = [slot for slot in range(next_slot) if slot not in used][:n]
+        capacity = max(0, self.max_entries - used_count - len(free))
+        free += range(next_slot, next_slot + min(capacity, n - len(free)))
+        return free
+
+    def put_many(self, model, texts, vectors):
+        """
+        Store embeddings for texts, evicting least recently used entries when full.
+        Evicted entries are deleted and committed first, then the vectors are
+        written, then the new entries are committed: a crash in between only
+        loses cache entries.
+        """
+        if not texts:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        keys = [self.make_key(model, text) for text in texts]
+        with self._lock, self._file_lock(exclusive=True):
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            self.dim = int(row[0]) if row else self.dim
+            if self.dim is None:
+                self.dim = array.shape[1]
+                self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+            elif array.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {array.shape[1]} does not match cache dimension {self.dim}.")
+
+            # Deduplicate keys, keeping the last vector for each
+            unique = dict(zip(keys, range(len(keys))))
+            slots = self._lookup(list(unique))
+            new_keys = [key for key in unique if key not in slots]
+
+            count, next_slot = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(slot) + 1, 0) FROM entries"
+            ).fetchone()
+            free = self._free_slots(count, next_slot, len(new_keys))
+            for key, slot in zip(new_keys, free):
+                slots[key] = slot
+
+            # Reuse the slots of the least recently used entries not part of this batch
+            evict_keys = new_keys[len(free):]
+            if evict_keys:
+                victims = []
+                for key, slot in self._conn.execute("SELECT key, slot FROM entries ORDER BY last_used"):
+                    if len(victims) == len(evict_keys):
+                        break
+                    if key not in unique:
+                        victims.append((key, slot))
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+                for key, (_, slot) in zip(evict_keys, victims):
+                    slots[key] = slot
+            # Unmap evicted slots (and record dim) before their vectors are overwritten
+            self._conn.commit()
+
+            now = time.time()
+            with open(self._vectors_path, "r+b") as file:
+                for key, slot in slots.items():
+                    file.seek(slot * self.dim * 4)
+                    file.write(array[unique[key]].tobytes())
+            self._map = None
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(key, slot, now) for key, slot in slots.items()],
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Return hit/miss counters and the number of cached entries.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._map = None
+            self._conn.close()
+            self._lock_file.close()
+
+
+class CachedEmbeddings:
+    """
+    Wrap an embeddings object (e.g. OpenAIEmbeddings) so repeated texts are
+    served from an EmbeddingCache instead of the network.
+    With factory (and model) instead of embeddings, the embeddings object is
+    only built on the first cache miss.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache, model=None, factory=None):
+        self._embeddings = embeddings
+        self._factory = factory
+        self._lock = threading.Lock()
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+
+    @property
+    def embeddings(self):
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = self._factory()
+            return self._embeddings
+
+    def embed_documents(self, texts, before_request=None):
+        """
+        Embed texts, sending only cache misses; before_request(missing_texts) runs just before the request.
+        """
+        texts = list(texts)
+        with span("embed_documents", texts=len(texts)) as trace:
+            results = self.cache.get_many(self.model, texts)
+            missing = [index for index, result in enumerate(results) if result is None]
+            trace.set(cache_hits=len(texts) - len(missing))
+            count("embedding_cache_lookups_total", len(texts) - len(missing), result="hit")
+            count("embedding_cache_lookups_total", len(missing), result="miss")
+            if missing:
+                # Embed each distinct missing text once
+                missing_texts = list(dict.fromkeys(texts[index] for index in missing))
+                if before_request is not None:
+                    before_request(missing_texts)
+                vectors = self.embeddings.embed_documents(missing_texts)
+                self.cache.put_many(self.model, missing_texts, vectors)
+                by_text = dict(zip(missing_texts, vectors))
+                for index in missing:
+                    results[index] = list(by_text[texts[index]])
+        return results
+
+    def embed_query(self, text):
+        with span("embed_query") as trace:
+            result = self.cache.get_many(self.model, [text])[0]
+            trace.set(cache_hit=result is not None)
+            count("embedding_cache_lookups_total", result="hit" if result is not None else "miss")
+            if result is None:
+                result = self.embeddings.embed_query(text)
+                self.cache.put_many(self.model, [text], [result])
+        return list(result)
+
+
+def cached_openai_embeddings(
+    openai_api_key,
+    cache_path=DEFAULT_CACHE_PATH,
+    max_entries=DEFAULT_MAX_ENTRIES,
+    openai_api_base=None,
+    model=DEFAULT_EMBEDDING_MODEL):
+    """
+    Build OpenAIEmbeddings wrapped in the on-disk cache, on the shared HTTP connection pool.
+    openai_api_base points the client at another endpoint, e.g. a local fake server.
+    The client (and langchain_openai) is only loaded on the first cache miss.
+    """
+    def make_embeddings():
+        from langchain_openai import OpenAIEmbeddings
+        from http_clients import openai_client_kwargs
+
+        kwargs = dict(openai_client_kwargs())
+        if openai_api_base:
+            kwargs["openai_api_base"] = openai_api_base
+        return OpenAIEmbeddings(model=model, openai_api_key=openai_api_key, **kwargs)
+
+    return CachedEmbeddings(
+        None,
+        EmbeddingCache(cache_path, max_entries=max_entries),
+        model=model,
+        factory=make_embeddings,
+    )
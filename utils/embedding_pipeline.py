@@ -0,0 +1,204 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Loaded on first use, so importing this module stays cheap
+_encoding = None
+
+DEFAULT_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+DEFAULT_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "8000"))
+DEFAULT_MAX_BATCH_SIZE = 256
+
+
+def retryable_errors():
+    """
+    Return the exception types worth retrying (openai's when it is installed).
+    """
+    try:
+        import openai
+    except ImportError:
+        return (TimeoutError, ConnectionError)
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+def get_encoding():
+    """
+    Return the tiktoken encoding, or None if tiktoken is unavailable.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def estimate_tokens(text):
+    """
+    Count tokens with tiktoken when available, otherwise estimate ~4 characters per token.
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests and tokens per minute, shared across threads.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens):
+        """
+        Block until one request carrying the given number of tokens fits the budget.
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.requests_per_minute,
+                    (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                )
+            time.sleep(max(wait, 0.01))
+
+
+def batch_chunks(items, max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    """
+    Group (chunk_id, chunk) pairs into batches bounded by an estimated token count and a size cap.
+    Consumes items lazily. Yields (batch_ids, batch_chunks, batch_tokens).
+    """
+    batch_ids, batch, batch_tokens = [], [], 0
+    for chunk_id, chunk in items:
+        tokens = estimate_tokens(chunk.page_content)
+        if batch and (batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_size):
+            yield batch_ids, batch, batch_tokens
+            batch_ids, batch, batch_tokens = [], [], 0
+        batch_ids.append(chunk_id)
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch_ids, batch, batch_tokens
+
+
+def embed_with_backoff(embedding_function, texts, max_retries=6, base_delay=1.0, before_request=None):
+    """
+    Embed texts, retrying rate-limit and transient errors with exponential backoff and jitter.
+    before_request(texts) is called with the texts about to be sent, e.g. to
+    charge a rate limiter; a CachedEmbeddings only sends its cache misses.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            if before_request is None:
+                return embedding_function.embed_documents(texts)
+            if hasattr(embedding_function, "cache"):
+                return embedding_function.embed_documents(texts, before_request=before_request)
+            before_request(texts)
+            return embedding_function.embed_documents(texts)
+        except retryable_errors() as e:
+            if attempt == max_retries:
+                raise
+            delay = base_delay * 2 ** attempt + random.uniform(0, base_delay)
+            print(f"Embedding batch failed ({type(e).__name__}), retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+def store_writer(collection, store_text=True):
+    """
+    Return a write_batch callable that upserts precomputed embeddings into a
+    collection (a Chroma collection or a NumpyVectorStore).
+    With store_text=False, chunks that carry byte offsets into their source
+    file are stored without text.
+    """
+    def write_batch(ids, chunks, vectors):
+        collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            metadatas=[chunk.metadata for chunk in chunks],
+            documents=[
+                "" if not store_text and "byte_start" in chunk.metadata else chunk.page_content
+                for chunk in chunks
+            ],
+        )
+    return write_batch
+
+
+def embed_and_store(
+    items,
+    embedding_function,
+    write_batch,
+    max_workers=DEFAULT_MAX_WORKERS,
+    rate_limiter=None,
+    max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS):
+    """
+    Embed (chunk_id, chunk) pairs in token-bounded batches over a thread pool
+    and write each batch to the store as soon as it completes.
+    items may be a generator; at most 2 * max_workers batches are held at once.
+    Writes happen on the calling thread, so the store never sees concurrent writers.
+    Only texts missing from the embedding cache count against rate_limiter.
+    Returns a dict with chunk, batch and throughput counts.
+    """
+    rate_limiter = rate_limiter or RateLimiter()
+    started = time.perf_counter()
+    stored = 0
+    batches = 0
+
+    def charge(texts):
+        rate_limiter.acquire(sum(estimate_tokens(text) for text in texts))
+
+    def embed_batch(batch_ids, batch):
+        vectors = embed_with_backoff(embedding_function, [chunk.page_content for chunk in batch], before_request=charge)
+        return batch_ids, batch, vectors
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for batch_ids, batch, _batch_tokens in batch_chunks(items, max_batch_tokens=max_batch_tokens):
+            pending.add(executor.submit(embed_batch, batch_ids, batch))
+            # Keep a bounded number of batches in flight
+            if len(pending) >= max_workers * 2:
+                done = next(as_completed(pending))
+                pending.remove(done)
+                batch_ids, batch, vectors = done.result()
+                write_batch(batch_ids, batch, vectors)
+                stored += len(batch_ids)
+                batches += 1
+        for done in as_completed(pending):
+            batch_ids, batch, vectors = done.result()
+            write_batch(batch_ids, batch, vectors)
+            stored += len(batch_ids)
+            batches += 1
+
+    elapsed = time.perf_counter() - started
+    rate = stored / elapsed if elapsed > 0 else 0.0
+    print(f"Embedded {stored} chunks in {batches} batches in {elapsed:.1f}s ({rate:.1f} chunks/sec).")
+    return {"chunks": stored, "batches": batches, "seconds": elapsed, "chunks_per_sec": rate}
@@ -0,0 +1,97 @@
+import os
+import threading
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+_lock = threading.Lock()
+_http_client = None
+_requests_session = None
+
+
+def http2_available():
+    """
+    HTTP/2 needs the optional h2 package.
+    """
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def make_http_client(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive=HTTP_MAX_KEEPALIVE,
+    timeout=HTTP_TIMEOUT,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    http2=None):
+    """
+    Build a pooled, keep-alive httpx client (HTTP/2 when h2 is installed, unless http2 is given).
+    """
+    import httpx
+
+    return httpx.Client(
+        http2=http2_available() if http2 is None else http2,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+    )
+
+
+def make_requests_session(pool_size=HTTP_MAX_CONNECTIONS):
+    """
+    Build a requests session whose adapters keep up to pool_size connections per host alive.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_http_client():
+    """
+    Return the process-wide httpx client used for OpenAI and Google, creating it on first use.
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = make_http_client()
+        return _http_client
+
+
+def get_requests_session():
+    """
+    Return the process-wide requests session used for Reddit (praw), creating it on first use.
+    """
+    global _requests_session
+    with _lock:
+        if _requests_session is None:
+            _requests_session = make_requests_session()
+        return _requests_session
+
+
+def openai_client_kwargs():
+    """
+    Keyword arguments that put a langchain_openai client (ChatOpenAI,
+    OpenAIEmbeddings) on the shared connection pool.
+    """
+    return {"http_client": get_http_client(), "timeout": HTTP_TIMEOUT}
+
+
+def close_clients():
+    """
+    Close the shared clients; the next get_* call opens new ones.
+    """
+    global _http_client, _requests_session
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        if _requests_session is not None:
+            _requests_session.close()
+        _http_client, _requests_session = None, None
@@ -1,33 +1,20 @@
 import os
+import re
 import sys
-from dotenv import load_dotenv
 from langchain.agents import AgentExecutor, StructuredChatAgent
 from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory, ReadOnlySharedMemory
-from langchain_community.tools.reddit_search.tool import RedditSearchRun
-from langchain_community.utilities.reddit_search import RedditSearchAPIWrapper
-from langchain_core.prompts import PromptTemplate
-from langchain_core.tools import Tool
-from langchain_openai import ChatOpenAI
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 # Add paths for utilities and source files
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-def create_prompt(
-    input,
-    tools,
-    openai_api_key):
-    template = """This is a conversation between a human and a bot:
+from tracing import record_tokens, span
 
-    {chat_history}
-
-    Write a summary of the conversation for {input}:
+def create_prompt(tools):
+    """
+    Build the StructuredChatAgent prompt; chat_history is passed with each input.
     """
-
-    memory = ConversationBufferMemory(memory_key="chat_history")
-
     prefix = """Have a conversation with a human, answering the following questions as best you can. You have access to the following tools:"""
     suffix = """Begin!"
 
@@ -40,28 +27,54 @@ def create_prompt(
         tools=tools, # an arg
         suffix=suffix,
         input_variables=["input", "chat_history", "agent_scratchpad"],
-    )    
-    return prompt, memory
+    )
+    return prompt
 
-def run_query(openai_api_key, prompt, memory, tools, input_text):
+# Words that carry no search signal in a rules question
+SEARCH_STOPWORDS = frozenset(
+    "a an and are as at be by can could do does did for from has have how i if in into is it its "
+    "me my of on or so than that the their them then there these they this to was what when "
+    "whenever where which while who why will with would you your one up another following text "
+    "creature card cards put there turn player control choose target".split()
+)
 
-    llm = ChatOpenAI(temperature=0, openai_api_key=openai_api_key)
+SYNTHESIS_TEMPLATE = """Answer the question using the {source} search results below.
+If the results do not answer it, say so.
 
-    llm_chain = LLMChain(llm=llm, prompt=prompt)
-    agent = StructuredChatAgent(llm_chain=llm_chain, verbose=True, tools=tools)
-    agent_chain = AgentExecutor.from_agent_and_tools(
-        agent=agent, verbose=True, memory=memory, tools=tools
-    )
+Search results:
+{results}
 
-    response = agent_chain.invoke(input=input_text)
+Question: {input}
+"""
 
-    return response['output']
+def derive_search_query(input_text, max_terms=10, suffix="mtg"):
+    """
+    Build a short search query from a question without an LLM call.
+    Capitalized words (card names, keywords) come first, then the remaining
+    content words in order of appearance.
+    """
+    words = re.findall(r"[A-Za-z0-9][A-Za-z0-9'’-]*", input_text)
+    terms = list(dict.fromkeys(word for word in words if word.lower() not in SEARCH_STOPWORDS))
+    terms.sort(key=lambda word: not word[0].isupper())
+    return " ".join(terms[:max_terms] + ([suffix] if suffix else []))
 
-if __name__ == "__main__":
-    load_dotenv()
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    tools = [RedditSearchRun(), RedditSearchAPIWrapper()]
-    input = "What is the best way to cook a steak?"
+def synthesize_answer(llm, input_text, results, source):
+    """
+    Answer input_text from search results with exactly one LLM call.
+    """
+    prompt = SYNTHESIS_TEMPLATE.format(source=source, results=results, input=input_text)
+    source = source.lower()
+    with span("llm_call", source=source) as trace:
+        response = llm.invoke(prompt)
+        record_tokens(trace, response, source=source)
+    return response.content
 
-    prompt, memory = create_prompt(input, tools, openai_api_key)
-    run_query(openai_api_key, prompt, memory, tools, input)
\ No newline at end of file
+def build_agent_executor(llm, tools):
+    """
+    Build a StructuredChatAgent executor without memory, so one instance can
+    serve concurrent requests. Pass chat_history="" along with each input.
+    """
+    prompt = create_prompt(tools)
+    llm_chain = LLMChain(llm=llm, prompt=prompt)
+    agent = StructuredChatAgent(llm_chain=llm_chain, verbose=True, tools=tools)
+    return AgentExecutor.from_agent_and_tools(agent=agent, verbose=True, tools=tools)
@@ -0,0 +1,172 @@
+import os
+import json
+import numpy as np
+
+VECTORS_FILENAME = "vectors.npy"
+RECORDS_FILENAME = "records.json"
+
+
+class NumpyVectorStore:
+    """
+    Exact top-k vector index over a memory-mapped .npy file.
+
+    Embeddings are stored L2-normalized as float32, one row per chunk, with a
+    parallel records table of ids, texts and metadata. Reads map the file
+    read-only, so worker processes share the same pages; writes are buffered
+    in memory and atomically replace the files on persist().
+    Scores follow Chroma's default squared-L2 convention so the same
+    relevance threshold applies to both backends.
+    """
+
+    def __init__(self, persist_directory, embedding_function=None):
+        self.persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self._vectors = None
+        self.ids, self.documents, self.metadatas = [], [], []
+        self._positions = {}
+        self._pending = None
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def _load(self):
+        vectors_path = os.path.join(self.persist_directory, VECTORS_FILENAME)
+        records_path = os.path.join(self.persist_directory, RECORDS_FILENAME)
+        if not os.path.exists(vectors_path):
+            return
+        self._vectors = np.load(vectors_path, mmap_mode="r")
+        with open(records_path, "r") as file:
+            records = json.load(file)
+        self.ids = records["ids"]
+        self.documents = records["documents"]
+        self.metadatas = records["metadatas"]
+        self._positions = {chunk_id: index for index, chunk_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, ids=None, include=("documents", "metadatas")):
+        """
+        Fetch records by id, in the same dict shape as Chroma's get().
+        """
+        if ids is None:
+            rows = list(range(len(self.ids)))
+        else:
+            rows = [self._positions[chunk_id] for chunk_id in ids if chunk_id in self._positions]
+        result = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self._vectors[rows]) if rows else np.zeros((0, 0), dtype=np.float32)
+        return result
+
+    # Search
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance / np.sqrt(2)
+
+    def search_by_vector(self, embedding, k=4):
+        """
+        Return [(row, squared_l2_distance), ...] for the k nearest rows.
+        """
+        return self.search_many([embedding], k=k)[0]
+
+    def search_many(self, embeddings, k=4):
+        """
+        search_by_vector for many queries with one matrix product.
+        Returns one [(row, squared_l2_distance), ...] list per query.
+        """
+        if self._vectors is None or len(self.ids) == 0:
+            return [[] for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        similarities = queries @ self._vectors.T
+        k = min(k, similarities.shape[1])
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(similarities, top, axis=1), axis=1), axis=1)
+        # For unit vectors ||a - b||^2 = 2 - 2 cos(a, b)
+        distances = np.maximum(0.0, 2.0 - 2.0 * np.take_along_axis(similarities, top, axis=1))
+        return [
+            [(int(row), float(distance)) for row, distance in zip(rows, row_distances)]
+            for rows, row_distances in zip(top, distances)
+        ]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        from langchain.schema import Document
+
+        return [
+            (Document(page_content=self.documents[row], metadata=self.metadatas[row]), distance)
+            for row, distance in self.search_by_vector(embedding, k=k)
+        ]
+
+    def similarity_search_with_relevance_scores(self, query, k=4):
+        relevance_score_fn = self._select_relevance_score_fn()
+        results = self.similarity_search_by_vector_with_relevance_scores(self.embeddings.embed_query(query), k=k)
+        return [(doc, relevance_score_fn(distance)) for doc, distance in results]
+
+    def similarity_search(self, query, k=4):
+        return [doc for doc, _ in self.similarity_search_with_relevance_scores(query, k=k)]
+
+    # Writes
+
+    def _writable(self):
+        if self._pending is None:
+            self._pending = {
+                chunk_id: (np.array(self._vectors[index], dtype=np.float32), self.metadatas[index], self.documents[index])
+                for index, chunk_id in enumerate(self.ids)
+            }
+        return self._pending
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        pending = self._writable()
+        for chunk_id, embedding, metadata, document in zip(ids, embeddings, metadatas, documents):
+            vector = np.asarray(embedding, dtype=np.float32)
+            pending[chunk_id] = (vector / (np.linalg.norm(vector) or 1.0), metadata, document)
+
+    def update(self, ids, metadatas):
+        pending = self._writable()
+        for chunk_id, metadata in zip(ids, metadatas):
+            if chunk_id in pending:
+                vector, _, document = pending[chunk_id]
+                pending[chunk_id] = (vector, metadata, document)
+
+    def delete(self, ids):
+        pending = self._writable()
+        for chunk_id in ids:
+            pending.pop(chunk_id, None)
+
+    def persist(self):
+        """
+        Write buffered changes and remap the files.
+        """
+        if self._pending is None:
+            return
+        os.makedirs(self.persist_directory, exist_ok=True)
+        ids = list(self._pending)
+        if ids:
+            vectors = np.stack([self._pending[chunk_id][0] for chunk_id in ids]).astype(np.float32)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        records = {
+            "ids": ids,
+            "metadatas": [self._pending[chunk_id][1] for chunk_id in ids],
+            "documents": [self._pending[chunk_id][2] for chunk_id in ids],
+        }
+
+        # Replace atomically so readers holding the old map are unaffected
+        vectors_path = os.path.join(self.persist_directory, VECTORS_FILENAME)
+        records_path = os.path.join(self.persist_directory, RECORDS_FILENAME)
+        with open(vectors_path + ".tmp", "wb") as file:
+            np.save(file, vectors)
+        with open(records_path + ".tmp", "w") as file:
+            json.dump(records, file)
+        os.replace(vectors_path + ".tmp", vectors_path)
+        os.replace(records_path + ".tmp", records_path)
+
+        self._pending = None
+        self._load()
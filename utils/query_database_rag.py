@@ -1,18 +1,58 @@
 import os
 import sys
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain.prompts import ChatPromptTemplate
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
-from config import API_KEY, CHROMA_PATH, PROMPT_TEMPLATE
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+from config import (
+    ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_PATH, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL,
+    CHROMA_PATH, CONTEXT_TOKENS, EMBEDDING_CACHE_PATH, EXPANSION_HOPS, EXPANSION_TOKENS,
+    KEYWORD_TOKENS, MIN_TOP_K, NUMPY_INDEX_PATH, PROMPT_TEMPLATE, RELEVANCE_THRESHOLD,
+    TOP_K, VECTOR_BACKEND, BATCH_CONCURRENCY, get_settings,
+)
+from embedding_cache import cached_openai_embeddings
+from numpy_index import NumpyVectorStore
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from rules_index import RulesIndex
+from context_packer import pack_context, span_from_document
+from source_texts import SourceTexts
+from answer_cache import SemanticAnswerCache, corpus_version
+from http_clients import openai_client_kwargs
+from batch_queries import read_questions, run_batch
+from tracing import count, current_span, record_tokens, span, start_span
 
-def load_db():
+_default_retriever = None
+_default_retriever_lock = threading.Lock()
+_lexical_executor = ThreadPoolExecutor(max_workers=2)
+# Shared by retrieve() calls made without a JudgeRetriever's own SourceTexts
+_source_texts = SourceTexts()
+RETRIEVAL_REUSE_ENTRIES = 64 # routing retrievals kept for the RAG answer of the same question
+
+def resolve_store_path(chroma_path=None, backend=VECTOR_BACKEND):
+    """
+    Return the store directory for a backend, defaulting from config.
+    """
+    return chroma_path or (NUMPY_INDEX_PATH if backend == "numpy" else CHROMA_PATH)
+
+def load_db(chroma_path=None, openai_api_key=None, backend=VECTOR_BACKEND, embedding_function=None):
     """
     Load the RAG database.
+    backend is "chroma" or "numpy" (memory-mapped NumpyVectorStore).
+    Query embeddings go through the on-disk cache, so repeated questions skip the API.
     """
-    embedding_function = OpenAIEmbeddings(openai_api_key=API_KEY)
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+    if embedding_function is None:
+        openai_api_key = openai_api_key or get_settings().require("openai_api_key")
+        embedding_function = cached_openai_embeddings(openai_api_key, cache_path=EMBEDDING_CACHE_PATH)
+    with span("load_db", backend=backend):
+        if backend == "numpy":
+            return NumpyVectorStore(resolve_store_path(chroma_path, backend), embedding_function=embedding_function)
+        from langchain_chroma import Chroma
+
+        db = Chroma(persist_directory=resolve_store_path(chroma_path, backend), embedding_function=embedding_function)
     return db
 
 def load_query_text(query_text=None, file_path=None):
@@ -28,61 +68,564 @@ def load_query_text(query_text=None, file_path=None):
     else:
         raise ValueError("Either query_text or a valid file_path must be provided.")
 
-def create_context_and_prompt(query_text, db, show_similarity=False):
+def fuse_results(db, query_embedding, vector_results, lexical_hits, k=TOP_K):
+    """
+    Merge vector and BM25 results with reciprocal rank fusion.
+    Chunks found only by BM25 are fetched from the store and scored against
+    the query embedding, so every result carries a vector relevance score.
+    Results are keyed by store id, which search_many puts in metadata["chunk_id"].
+    """
+    relevance_score_fn = db._select_relevance_score_fn()
+    by_key = {doc.metadata["chunk_id"]: (doc, score) for doc, score in vector_results}
+
+    missing = [chunk_id for chunk_id, _ in lexical_hits if chunk_id not in by_key]
+    if missing:
+        from langchain.schema import Document
+
+        data = db.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        for chunk_id, text, metadata, embedding in zip(data["ids"], data["documents"], data["metadatas"], data["embeddings"]):
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            # Squared L2 between unit vectors, matching the vector search scores
+            distance = max(0.0, 2.0 - 2.0 * float(vector @ query))
+            by_key[chunk_id] = (Document(page_content=text, metadata=dict(metadata or {}, chunk_id=chunk_id)), relevance_score_fn(distance))
+
+    fused = reciprocal_rank_fusion([
+        [doc.metadata["chunk_id"] for doc, _ in vector_results],
+        [chunk_id for chunk_id, _ in lexical_hits],
+    ])
+    return [by_key[key] for key in fused if key in by_key][:k]
+
+def retrieve(query_text, db, k=TOP_K, query_embedding=None, lexical_index=None, source_texts=None):
+    """
+    Embed the query once and run a single top-k search.
+    With a lexical_index, BM25 runs alongside the vector search and the two
+    rankings are fused. Chunks stored without text are filled in from
+    source_texts.
+    Returns (query_embedding, [(doc, relevance_score), ...]) in rank order.
+    """
+    lexical_future = None
+    if lexical_index is not None:
+        lexical_future = _lexical_executor.submit(lexical_index.search, query_text, k)
+
+    if query_embedding is None:
+        query_embedding = db.embeddings.embed_query(query_text)
+    with span("vector_search", k=k) as trace:
+        vector_results = search_many(db, [query_embedding], k=k)[0]
+        trace.set(best_score=max((score for _, score in vector_results), default=None))
+
+    if lexical_future is not None:
+        with span("lexical_fusion"):
+            vector_results = fuse_results(db, query_embedding, vector_results, lexical_future.result(), k=k)
+    (source_texts or _source_texts).hydrate([doc for doc, _ in vector_results])
+    return query_embedding, vector_results
+
+def search_many(db, query_embeddings, k=TOP_K):
+    """
+    Vector search for many queries in one pass: one matrix product on the
+    numpy backend, one multi-query call on Chroma.
+    Returns one [(doc, relevance_score), ...] list per query, in rank order.
+    Each doc's metadata["chunk_id"] is its id in the store, so results can be
+    deduplicated even for chunks stored without a chunk_id.
+    """
+    from langchain.schema import Document
+
+    relevance_score_fn = db._select_relevance_score_fn()
+    if isinstance(db, NumpyVectorStore):
+        return [
+            [(Document(page_content=db.documents[row], metadata=dict(db.metadatas[row], chunk_id=db.ids[row])),
+              relevance_score_fn(distance))
+             for row, distance in hits]
+            for hits in db.search_many(query_embeddings, k=k)
+        ]
+    data = db._collection.query(
+        query_embeddings=[list(embedding) for embedding in query_embeddings],
+        n_results=k,
+        include=["documents", "metadatas", "distances"])
+    return [
+        [(Document(page_content=text or "", metadata=dict(metadata or {}, chunk_id=chunk_id)), relevance_score_fn(distance))
+         for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances)]
+        for ids, texts, metadatas, distances in zip(data["ids"], data["documents"], data["metadatas"], data["distances"])
+    ]
+
+def retrieve_many(query_texts, db, query_embeddings, k=TOP_K, lexical_index=None, source_texts=None):
+    """
+    retrieve() for a batch of already embedded queries, with a single
+    vector search pass. Returns one [(doc, relevance_score), ...] list per query.
+    """
+    lexical_futures = []
+    if lexical_index is not None:
+        lexical_futures = [_lexical_executor.submit(lexical_index.search, query_text, k) for query_text in query_texts]
+
+    with span("vector_search", k=k, queries=len(query_embeddings)):
+        batch_results = search_many(db, query_embeddings, k=k)
+    if lexical_futures:
+        batch_results = [
+            fuse_results(db, query_embedding, vector_results, future.result(), k=k)
+            for query_embedding, vector_results, future in zip(query_embeddings, batch_results, lexical_futures)
+        ]
+    (source_texts or _source_texts).hydrate([doc for results in batch_results for doc, _ in results])
+    return batch_results
+
+def create_context_and_prompt(
+    query_text,
+    db,
+    show_similarity=False,
+    k=TOP_K,
+    prompt_template=None,
+    lexical_index=None,
+    rules_index=None,
+    expansion_hops=EXPANSION_HOPS,
+    expansion_tokens=EXPANSION_TOKENS,
+    keyword_tokens=KEYWORD_TOKENS,
+    context_tokens=CONTEXT_TOKENS,
+    source_texts=None,
+    query_embedding=None,
+    retrieved=None,
+    used=None):
     """
     Create the context and prompt for the query.
+    Both the relevance gate and the context come from one retrieval pass.
+    Rules cited by number are injected verbatim from rules_index; if the query
+    asks for nothing else, vector search is skipped entirely. Keywords named
+    in the question (trample, ward, ...) bring their Glossary entry and
+    governing rule; only when it asks nothing beyond what they mean are fewer
+    chunks fetched by vector search. Rules
+    referenced by the context ("see rule 510") are added along the
+    cross-reference graph up to expansion_hops / expansion_tokens. The pieces
+    are merged by offset, deduplicated, ordered by rule number and packed
+    into context_tokens. retrieved (from retrieve_many) replaces the vector
+    search with results fetched in a batch. used, when given, is extended
+    with the (doc, score) pairs that made it into the context.
     """
 
     # Create context
     print("\nCreating context.\n")
-    
-    # Method 1: Simple similarity search
-    context_results = db.similarity_search(query_text)
-    context_text = "\n\n---\n\n".join([doc.page_content for doc in context_results])
-
-    # Method 2: Search with relevance scores
-    context_results_with_sim = db.similarity_search_with_relevance_scores(query_text, k=3)
-    if len(context_results_with_sim) == 0 or context_results_with_sim[0][1] < 0.7:
-        print("No results found.")
-        return "No relevant context found."
-    context_text_sim = "\n\n---\n\n".join([doc.page_content for doc, _score in context_results_with_sim])
-    
-    # Create prompt
-    print("\nCreating prompt.\n")  
-    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    
-    if show_similarity:
-        prompt = prompt_template.format(context_text=context_text_sim, query=query_text)
+
+    # Rules cited by number, e.g. "what does 702.19c say"; a chapter ("rule 702") lists its rules
+    cited_numbers, cited_spans = [], []
+    if rules_index is not None:
+        cited_numbers = rules_index.find_references(query_text)
+        for number in cited_numbers:
+            cited_spans += rules_index.unit_spans(number, max_chars=context_tokens * 4)
+
+    # Keyword definitions, e.g. "trample" -> Glossary entry + rule 702.19
+    keyword_spans, keyword_count = [], 0
+    if rules_index is not None:
+        budget = keyword_tokens * 4  # ~4 characters per token
+        for term in rules_index.find_terms(query_text):
+            spans = rules_index.define_spans(term, max_chars=budget)
+            size = sum(len(span["text"]) for span in spans)
+            if size > budget:
+                continue
+            budget -= size
+            keyword_spans += spans
+            keyword_count += 1
+        if keyword_count:
+            print(f"Injected definitions for {keyword_count} keywords.")
+
+    context_results = []
+    if cited_spans and rules_index.is_fully_resolved(query_text):
+        print("Resolved from the rule-number index.")
     else:
-        prompt = prompt_template.format(context_text=context_text, query=query_text)
-    
+        # Definitions only stand in for retrieved chunks when they are all that was asked
+        vector_k = k
+        if keyword_count and rules_index.is_term_lookup(query_text):
+            vector_k = max(MIN_TOP_K, k - keyword_count)
+        if retrieved is not None:
+            context_results = retrieved[:vector_k]
+        else:
+            _, context_results = retrieve(
+                query_text, db, k=vector_k, query_embedding=query_embedding,
+                lexical_index=lexical_index, source_texts=source_texts)
+        relevant = len(context_results) > 0 and max(score for _, score in context_results) >= RELEVANCE_THRESHOLD
+        if not relevant and not cited_spans and not keyword_spans:
+            print("No results found.")
+            return "No relevant context found."
+        if show_similarity:
+            for doc, score in context_results:
+                print(f"{score:.3f}  {doc.page_content[:80]}")
+        if not relevant:
+            context_results = []
+    if used is not None:
+        used.extend(context_results)
+    spans = cited_spans + keyword_spans + [span_from_document(doc) for doc, _score in context_results]
+
+    # Follow "see rule ..." references out of the context
+    if rules_index is not None and expansion_hops > 0:
+        seeds = cited_numbers + [span["rule"] for span in spans]
+        for number in rules_index.expand(seeds, max_hops=expansion_hops, max_tokens=expansion_tokens):
+            spans += rules_index.unit_spans(number)
+
+    # Merge overlapping chunks, drop duplicates and fit the token budget
+    context_text, stats = pack_context(spans, max_tokens=context_tokens)
+    current_span().set(context_tokens=stats["tokens"], tokens_saved=stats["tokens_saved"])
+    print(f"Context: {stats['tokens']} tokens from {stats['spans_out']} spans, "
+          f"saved {stats['tokens_saved']} of {stats['tokens_before']} tokens.")
+
+    # Create prompt
+    print("\nCreating prompt.\n")
+    if prompt_template is None:
+        from langchain.prompts import ChatPromptTemplate
+        prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+    prompt = prompt_template.format(context_text=context_text, query=query_text)
+
     return prompt
 
-def query_rag_db(query_text=None, file_path=None, verbose=False):
+class JudgeRetriever:
+    """
+    Long-lived RAG session.
+    Opens the vector store, embedding client, LLM client and prompt template
+    once and serves many queries. Safe to share between threads once warmed up.
+    With use_answer_cache, answers are kept in a SemanticAnswerCache scoped to
+    the current corpus version and the rules and keywords a question names,
+    so rephrased repeat questions skip the LLM. The caches and the rule-number
+    index open before the store and LLM client (open_caches), so a cached
+    answer never loads LangChain or the vector store, and a pure rule lookup
+    never calls the embedding API.
+    """
+
+    def __init__(self, chroma_path=None, openai_api_key=None, k=TOP_K, backend=VECTOR_BACKEND, use_answer_cache=True):
+        self.chroma_path = chroma_path
+        self.openai_api_key = openai_api_key
+        self.k = k
+        self.backend = backend
+        self.use_answer_cache = use_answer_cache
+        self.answer_cache = None
+        self.embedding_function = None
+        self.db = None
+        self.model = None
+        self.prompt_template = None
+        self.lexical_index = None
+        self.rules_index = None
+        self.source_texts = None
+        self._retrievals = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open_caches(self):
+        """
+        Open the embedding and answer caches and the rule-number index only.
+        """
+        with self._lock:
+            if self.embedding_function is None:
+                self.openai_api_key = self.openai_api_key or get_settings().require("openai_api_key")
+                self.embedding_function = cached_openai_embeddings(self.openai_api_key, cache_path=EMBEDDING_CACHE_PATH)
+                self.source_texts = SourceTexts()
+                self.rules_index = RulesIndex.load(resolve_store_path(self.chroma_path, self.backend), self.source_texts)
+                if self.use_answer_cache:
+                    self.answer_cache = SemanticAnswerCache(
+                        ANSWER_CACHE_PATH,
+                        threshold=ANSWER_CACHE_THRESHOLD,
+                        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                        ttl=ANSWER_CACHE_TTL)
+        return self
+
+    def warm_up(self):
+        """
+        Open the store and clients. Called automatically by query().
+        """
+        self.open_caches()
+        with self._lock:
+            if self.db is None:
+                from langchain_openai import ChatOpenAI
+                from langchain.prompts import ChatPromptTemplate
+
+                self.prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+                self.model = ChatOpenAI(openai_api_key=self.openai_api_key, **openai_client_kwargs())
+                self.db = load_db(self.chroma_path, backend=self.backend, embedding_function=self.embedding_function)
+                store_path = resolve_store_path(self.chroma_path, self.backend)
+                self.lexical_index = BM25Index.load(store_path)
+        return self
+
+    def embed_query(self, query_text):
+        self.open_caches()
+        return self.embedding_function.embed_query(query_text)
+
+    def embed_queries(self, query_texts):
+        """
+        Embed many questions with one batched call; repeats come from the cache.
+        """
+        self.open_caches()
+        return self.embedding_function.embed_documents(query_texts)
+
+    def retrieve_batch(self, query_texts, query_embeddings):
+        """
+        Retrieve context for many embedded questions in one vector search pass.
+        """
+        self.warm_up()
+        return retrieve_many(
+            query_texts, self.db, query_embeddings, k=self.k,
+            lexical_index=self.lexical_index, source_texts=self.source_texts)
+
+    def prepare_batch(self, query_texts):
+        """
+        Embed and retrieve many questions at once (embed_queries, retrieve_batch).
+        Returns one {"query_embedding": ..., "retrieved": ...} per question, to
+        pass on to query(); both are None for rule lookups, which need neither.
+        """
+        items = [{"query_embedding": None, "retrieved": None} for _ in query_texts]
+        pending = [index for index, query_text in enumerate(query_texts) if not self.is_rule_lookup(query_text)]
+        if pending:
+            pending_texts = [query_texts[index] for index in pending]
+            query_embeddings = self.embed_queries(pending_texts)
+            batch_results = self.retrieve_batch(pending_texts, query_embeddings)
+            for index, query_embedding, results in zip(pending, query_embeddings, batch_results):
+                items[index] = {"query_embedding": query_embedding, "retrieved": results}
+        return items
+
+    @property
+    def corpus_version(self):
+        # Re-checked on every use, so a long-running process sees a rebuilt store
+        return corpus_version(resolve_store_path(self.chroma_path, self.backend))
+
+    def is_rule_lookup(self, query_text):
+        """
+        Check whether query_text only asks for rules it cites by number, so it
+        is answered from the rule-number index without embedding it.
+        """
+        self.open_caches()
+        return self.rules_index is not None and self.rules_index.is_fully_resolved(query_text)
+
+    def cache_anchors(self, query_text):
+        """
+        Return the rule numbers and keywords query_text names, as an answer cache scope.
+        """
+        if self.rules_index is None:
+            return ""
+        return "|".join(self.rules_index.find_references(query_text) + self.rules_index.find_terms(query_text))
+
+    def cached_answer(self, query_text, query_embedding, namespace="rag"):
+        """
+        Return a cached answer to an equivalent question, or None.
+        """
+        self.open_caches()
+        if self.answer_cache is None:
+            return None
+        answer = self.answer_cache.lookup(
+            query_embedding, namespace=namespace, corpus_version=self.corpus_version,
+            anchors=self.cache_anchors(query_text))
+        count("answer_cache_lookups_total", namespace=namespace, result="miss" if answer is None else "hit")
+        if answer is not None:
+            print(f"Answer cache hit ({namespace}): {self.answer_cache.stats()}")
+        return answer
+
+    def remember_answer(self, query_text, query_embedding, answer, namespace="rag"):
+        if self.answer_cache is not None and query_embedding is not None:
+            self.answer_cache.store(
+                query_text, query_embedding, answer, namespace=namespace, corpus_version=self.corpus_version,
+                anchors=self.cache_anchors(query_text))
+
+    def retrieval_confidence(self, query_text, query_embedding=None, retrieved=None):
+        """
+        Return how well the rules corpus covers a question: 1.0 when it only
+        asks for rules cited by number, otherwise the best retrieval relevance
+        score of retrieved (searching when not given, e.g. from retrieve_batch).
+        The retrieval is kept, and the next RAG answer to the same question
+        builds its context from it instead of searching again.
+        """
+        if self.is_rule_lookup(query_text):
+            return 1.0
+        if retrieved is None:
+            self.warm_up()
+            _, retrieved = retrieve(
+                query_text, self.db, k=self.k, query_embedding=query_embedding,
+                lexical_index=self.lexical_index, source_texts=self.source_texts)
+        self.keep_retrieval(query_text, retrieved)
+        return max((score for _, score in retrieved), default=0.0)
+
+    def keep_retrieval(self, query_text, retrieved):
+        """
+        Hold a retrieval for the next create_prompt of query_text.
+        """
+        with self._lock:
+            self._retrievals[query_text] = retrieved
+            while len(self._retrievals) > RETRIEVAL_REUSE_ENTRIES:
+                self._retrievals.popitem(last=False)
+
+    def take_retrieval(self, query_text):
+        """
+        Return (and forget) the retrieval retrieval_confidence made for query_text, or None.
+        """
+        with self._lock:
+            return self._retrievals.pop(query_text, None)
+
+    def create_prompt(self, query_text, show_similarity=False, query_embedding=None, retrieved=None, used=None):
+        self.warm_up()
+        if retrieved is None:
+            retrieved = self.take_retrieval(query_text)
+        with span("build_prompt", reused_retrieval=retrieved is not None):
+            return create_context_and_prompt(
+                query_text,
+                self.db,
+                show_similarity=show_similarity,
+                query_embedding=query_embedding,
+                retrieved=retrieved,
+                k=self.k,
+                prompt_template=self.prompt_template,
+                lexical_index=self.lexical_index,
+                rules_index=self.rules_index,
+                source_texts=self.source_texts,
+                used=used,
+            )
+
+    def query(self, query_text, verbose=False, query_embedding=None, retrieved=None, details=None):
+        """
+        Answer a question from the rules corpus.
+        query_embedding and retrieved may come from prepare_batch.
+        Rule lookups ("what does 702.19c say") skip the embedding and answer cache.
+        details, when given, is filled in with "cached" and "sources", the
+        retrieved (doc, score) pairs the answer's context used (none for a
+        cached answer or a rule lookup).
+        """
+        if details is not None:
+            details.update(cached=False, sources=[])
+        if query_embedding is None and not self.is_rule_lookup(query_text):
+            query_embedding = self.embed_query(query_text)
+        if query_embedding is not None:
+            cached = self.cached_answer(query_text, query_embedding)
+            if cached is not None:
+                if details is not None:
+                    details["cached"] = True
+                return cached
+
+        prompt = self.create_prompt(
+            query_text, query_embedding=query_embedding, retrieved=retrieved,
+            used=details["sources"] if details is not None else None)
+
+        if verbose:
+            print(f"\nQuerying the database with the following query:\n\n{query_text}\n")
+            print(f"\nGenerated prompt:\n\n{prompt}\n")
+
+        # Query LLM
+        with span("llm_call", source="rag") as trace:
+            response = self.model.invoke(prompt)
+            record_tokens(trace, response, source="rag")
+        response_text = response.content
+        print(f"\n{response_text}\n")
+        self.remember_answer(query_text, query_embedding, response_text)
+
+        return response_text
+
+    def stream(self, query_text):
+        """
+        Answer a question from the rules corpus, yielding the answer in pieces
+        as the model generates it. A cached answer is yielded whole.
+        """
+        query_embedding = None
+        if not self.is_rule_lookup(query_text):
+            query_embedding = self.embed_query(query_text)
+            cached = self.cached_answer(query_text, query_embedding)
+            if cached is not None:
+                yield cached
+                return
+
+        prompt = self.create_prompt(query_text, query_embedding=query_embedding)
+        parts = []
+        trace = start_span("llm_call", source="rag", stream=True)
+        started = time.perf_counter()
+        try:
+            for chunk in self.model.stream(prompt):
+                if chunk.content:
+                    if not parts:
+                        trace.set(first_token_seconds=round(time.perf_counter() - started, 4))
+                    parts.append(chunk.content)
+                    yield chunk.content
+        finally:
+            trace.set(chunks=len(parts)).end()
+        self.remember_answer(query_text, query_embedding, "".join(parts))
+
+    def close(self):
+        """
+        Release the store and clients; the next query() warms up again.
+        """
+        with self._lock:
+            if self.embedding_function is not None:
+                self.embedding_function.cache.close()
+            if self.source_texts is not None:
+                self.source_texts.close()
+            if self.answer_cache is not None:
+                self.answer_cache.close()
+            self.db = None
+            self.model = None
+            self.prompt_template = None
+            self.lexical_index = None
+            self.rules_index = None
+            self.source_texts = None
+            self.answer_cache = None
+            self.embedding_function = None
+            self._retrievals.clear()
+
+    def __enter__(self):
+        return self.warm_up()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def get_retriever():
+    """
+    Return the process-wide JudgeRetriever, creating it on first use.
+    """
+    global _default_retriever
+    with _default_retriever_lock:
+        if _default_retriever is None:
+            _default_retriever = JudgeRetriever()
+        return _default_retriever
+
+def query_rag_db(query_text=None, file_path=None, verbose=False, details=None):
     """
     Query the RAG database.
+    Reuses the process-wide JudgeRetriever, so setup is paid once per process.
+    details is passed on to JudgeRetriever.query.
     """
     # Load the query text from string or file
     query_text = load_query_text(query_text=query_text, file_path=file_path)
 
-    # Load the database
-    db = load_db()
+    with span("rag_query"):
+        return get_retriever().query(query_text, verbose=verbose, details=details)
 
-    # Create context and prompt
-    prompt = create_context_and_prompt(query_text, db)
+def describe_sources(results):
+    """
+    Return JSON-ready source, chunk id, rule and score of (doc, score) pairs.
+    """
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "chunk_id": doc.metadata.get("chunk_id"),
+            "rule": doc.metadata.get("rule"),
+            "score": round(float(score), 4),
+        }
+        for doc, score in results
+    ]
 
-    # Define LLM
-    model = ChatOpenAI()
+def stream_rag_db(query_text=None, file_path=None):
+    """
+    Like query_rag_db, but returns a generator of answer pieces as they arrive.
+    """
+    query_text = load_query_text(query_text=query_text, file_path=file_path)
 
-    if verbose:
-        print(f"\nQuerying the database with the following query:\n\n{query_text}\n")
-        print(f"\nGenerated prompt:\n\n{prompt}\n")
+    return get_retriever().stream(query_text)
 
-    # Query LLM
-    response_text = model.invoke(prompt).content
-    print(f"\n{response_text}\n")
+def query_rag_batch(input_path, output_path, concurrency=BATCH_CONCURRENCY):
+    """
+    Answer every question in input_path (JSONL or one question per line) and
+    append answers, sources, scores and timings to output_path as JSONL.
+    All questions are embedded in one batched call and retrieved in one
+    vector search pass; LLM calls then run concurrency at a time.
+    Rerunning with the same output_path resumes an interrupted batch.
+    """
+    retriever = get_retriever()
+
+    def prepare(questions):
+        return retriever.prepare_batch([question["query_text"] for question in questions])
 
-    return response_text
+    def answer(question, item):
+        details = {}
+        response_text = retriever.query(question["query_text"], details=details, **item)
+        return {"answer": response_text, "cached": details["cached"], "sources": describe_sources(details["sources"])}
+
+    return run_batch(read_questions(input_path), answer, output_path, concurrency=concurrency, prepare=prepare)
 
 if __name__ == "__main__":
     # For command line usage, specify either a string or a file
@@ -92,14 +635,30 @@ if __name__ == "__main__":
     parser.add_argument("--query_text", type=str, help="The text query to be used.")
     parser.add_argument("--file_path", type=str, help="Path to the file containing the query.")
     parser.add_argument("--verbose", action='store_true', help="Print detailed information.")
+    parser.add_argument("--stream", action='store_true', help="Print the answer as it is generated.")
+    parser.add_argument("--batch_file", type=str, help="JSONL or text file of questions, one per line, answered in batch mode.")
+    parser.add_argument("--output", type=str, help="JSONL file batch answers are appended to (default: <batch_file>.answers.jsonl).")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="LLM calls in flight in batch mode.")
 
     args = parser.parse_args()
 
     # Ensure either query_text or file_path is provided
-    if not args.query_text and not args.file_path:
-        raise ValueError("Either --query_text or --file_path must be provided.")
+    if not args.query_text and not args.file_path and not args.batch_file:
+        raise ValueError("Either --query_text, --file_path or --batch_file must be provided.")
 
     # Run the RAG DB query
-    query_rag_db(query_text=args.query_text, file_path=args.file_path, verbose=args.verbose)
+    if args.batch_file:
+        output = args.output or os.path.splitext(args.batch_file)[0] + ".answers.jsonl"
+        query_rag_batch(args.batch_file, output, concurrency=args.concurrency)
+    elif args.stream:
+        started = time.perf_counter()
+        first_token_seconds = None
+        for piece in stream_rag_db(query_text=args.query_text, file_path=args.file_path):
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - started
+            print(piece, end="", flush=True)
+        print(f"\n\nFirst token after {first_token_seconds or 0.0:.2f}s, done after {time.perf_counter() - started:.2f}s.")
+    else:
+        query_rag_db(query_text=args.query_text, file_path=args.file_path, verbose=args.verbose)
 
 # python utils/query_database_rag.py --query_text "I have a creature with the following text: Whenever Ghost of Ramirez DePietro deals combat damage to a player, choose up to one target card in a graveyard that was discarded or put there from a library this turn. Put that card into its owner's hand. I have another creature with the text: 'Whenever one or more Pirates you control deal damage to a player, Francisco explores.' Can I return a card put into my graveyard by the explore ability with the first ability? Ramirez is a pirate."
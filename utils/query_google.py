@@ -1,43 +1,54 @@
 import os
 import sys
+import threading
 from dotenv import load_dotenv
-from langchain.agents import AgentExecutor, StructuredChatAgent
-from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory
 from langchain_google_community import GoogleSearchAPIWrapper
-from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import Tool
 from langchain_openai import ChatOpenAI
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 
-from config import API_KEY
-from utils.langchain_query_tools import create_prompt
+from config import WEB_SEARCH_MODE
+from http_clients import get_http_client, openai_client_kwargs
+from tracing import langchain_callbacks, span
+from utils.langchain_query_tools import build_agent_executor, derive_search_query, synthesize_answer
+
+_sources = {}
+_sources_lock = threading.Lock()
+GOOGLE_CSE_URL = os.getenv("GOOGLE_CSE_URL", "https://www.googleapis.com/customsearch/v1")
+
+def google_cse_search(http_client, google_cse_id, google_api_key, query, num=10):
+    """
+    Query the Custom Search JSON API over a shared HTTP client.
+    Returns the result snippets joined, like GoogleSearchAPIWrapper.run.
+    """
+    response = http_client.get(GOOGLE_CSE_URL, params={"key": google_api_key, "cx": google_cse_id, "q": query, "num": num})
+    response.raise_for_status()
+    snippets = [item["snippet"] for item in response.json().get("items", []) if "snippet" in item]
+    return " ".join(snippets) if snippets else "No good Google Search Result was found"
 
 # Step 1: Define the function to get the Google Search tool
-def get_google_tool(google_cse_id, google_api_key):
-    search = GoogleSearchAPIWrapper(google_cse_id=google_cse_id, google_api_key=google_api_key)
+def get_google_tool(google_cse_id, google_api_key, http_client=None):
+    """
+    With http_client (e.g. the shared pooled client), searches go through it
+    instead of the googleapiclient wrapper.
+    """
+    if http_client is not None:
+        search = lambda query: google_cse_search(http_client, google_cse_id, google_api_key, query)
+    else:
+        search = GoogleSearchAPIWrapper(google_cse_id=google_cse_id, google_api_key=google_api_key).run
     google_tool = Tool(
         name="google_search",
         description="Search Google for recent results.",
-        func=search.run,
+        func=search,
     )
     return google_tool
 
-# Step 2: Define the function to handle queries and tool execution
-def run_query_with_action_handling(openai_api_key, prompt, memory, tools, input_text):
-    llm = ChatOpenAI(temperature=0, openai_api_key=openai_api_key)
-
-    llm_chain = LLMChain(llm=llm, prompt=prompt)
-    agent = StructuredChatAgent(llm_chain=llm_chain, verbose=True, tools=tools)
-    agent_chain = AgentExecutor.from_agent_and_tools(
-        agent=agent, verbose=True, memory=memory, tools=tools
-    )
-
-    # Invoke the agent chain with the memory being passed into the input
-    response = agent_chain.invoke(input=input_text)
-    
+def handle_agent_response(response, tools):
+    """
+    Return the agent's answer, running the search if the agent only named the action.
+    """
     # Handle tool actions within the response
     if "action" in response:
         action = response["action"]
@@ -53,8 +64,70 @@ def run_query_with_action_handling(openai_api_key, prompt, memory, tools, input_
     # If no action, just return the agent's regular response
     return response['output']
 
-# Step 3: Modify the main function to accept query text or a file
-def query_google(openai_api_key, google_cse_id, google_api_key, query_text=None, file_path=None):
+def search_and_synthesize(llm, google_tool, input_text):
+    """
+    Run one Google search with a locally derived query, then answer with one LLM call.
+    """
+    search_query = derive_search_query(input_text)
+    print(f"Searching Google for: {search_query}")
+    with span("tool_call", source="google", tool=google_tool.name) as trace:
+        search_result = google_tool.func(search_query)
+        trace.set(result_chars=len(search_result))
+    return synthesize_answer(llm, input_text, search_result, "Google")
+
+class GoogleSource:
+    """
+    Long-lived Google Search source.
+    Builds the search tool, LLM client and agent executor once and serves
+    many queries. The executor has no memory, so concurrent queries share
+    no per-request state. HTTP goes through the shared connection pool.
+    """
+
+    def __init__(self, openai_api_key, google_cse_id, google_api_key):
+        self.openai_api_key = openai_api_key
+        self.google_cse_id = google_cse_id
+        self.google_api_key = google_api_key
+        self.tool = None
+        self.llm = None
+        self.agent_executor = None
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        with self._lock:
+            if self.tool is None:
+                self.llm = ChatOpenAI(temperature=0, openai_api_key=self.openai_api_key, **openai_client_kwargs())
+                tool = get_google_tool(self.google_cse_id, self.google_api_key, http_client=get_http_client())
+                self.agent_executor = build_agent_executor(self.llm, [tool])
+                self.tool = tool
+        return self
+
+    def query(self, input_text, mode=WEB_SEARCH_MODE):
+        self.warm_up()
+        with span("web_query", source="google", mode=mode):
+            if mode == "direct":
+                return search_and_synthesize(self.llm, self.tool, input_text)
+            response = self.agent_executor.invoke(
+                {"input": input_text, "chat_history": ""},
+                config={"callbacks": langchain_callbacks(source="google")})
+            return handle_agent_response(response, [self.tool])
+
+def get_google_source(openai_api_key, google_cse_id, google_api_key):
+    """
+    Return the shared GoogleSource for these credentials, creating it on first use.
+    """
+    key = (openai_api_key, google_cse_id, google_api_key)
+    with _sources_lock:
+        if key not in _sources:
+            _sources[key] = GoogleSource(openai_api_key, google_cse_id, google_api_key)
+        return _sources[key]
+
+# Step 2: Modify the main function to accept query text or a file
+def query_google(openai_api_key, google_cse_id, google_api_key, query_text=None, file_path=None, mode=WEB_SEARCH_MODE):
+    """
+    Answer a question from Google Search.
+    mode="direct" searches once and makes a single LLM call; mode="agent"
+    lets a StructuredChatAgent decide how to use the search tool.
+    """
     # Load the query text from string or file
     if file_path and os.path.exists(file_path):
         with open(file_path, 'r') as file:
@@ -64,29 +137,10 @@ def query_google(openai_api_key, google_cse_id, google_api_key, query_text=None,
     else:
         raise ValueError("Either query_text or file_path must be provided.")
 
-    # Get the Google Search tool
-    google_tool = get_google_tool(google_cse_id, google_api_key)
-    
-    tools = [google_tool]  # Add more tools here if needed
-    
-    # Memory for the conversation to persist across inputs
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-    
-    # Generate prompt for the current input with memory included
-    prompt, _ = create_prompt(input_text, tools, openai_api_key)
-
-    # Get the agent's response, handling tools/actions if needed
-    response = run_query_with_action_handling(
-        openai_api_key,
-        prompt,
-        memory,
-        tools,
-        input_text
-    )
-    
-    return response
+    # Reuse the search wrapper, clients and agent built for these credentials
+    return get_google_source(openai_api_key, google_cse_id, google_api_key).query(input_text, mode=mode)
 
-# Step 4: Optionally, allow command line usage
+# Step 3: Optionally, allow command line usage
 if __name__ == "__main__":
     import argparse
 
@@ -101,6 +155,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Query Google with a string or file.")
     parser.add_argument("--query_text", type=str, help="The text query to be used.")
     parser.add_argument("--file_path", type=str, help="Path to the file containing the query.")
+    parser.add_argument("--mode", choices=("direct", "agent"), default=WEB_SEARCH_MODE, help="Search directly or through the agent.")
 
     args = parser.parse_args()
 
@@ -114,7 +169,8 @@ if __name__ == "__main__":
         google_cse_id=GOOGLE_CSE_ID,
         google_api_key=GOOGLE_API_KEY,
         query_text=args.query_text,
-        file_path=args.file_path
+        file_path=args.file_path,
+        mode=args.mode
     )
 
     # Print the result
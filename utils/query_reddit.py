@@ -1,22 +1,27 @@
 import os
 import sys
+import threading
 from dotenv import load_dotenv
-from langchain.agents import AgentExecutor, StructuredChatAgent
-from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory
 from langchain_community.tools.reddit_search.tool import RedditSearchRun
 from langchain_community.utilities.reddit_search import RedditSearchAPIWrapper
-from langchain_core.tools import Tool
 from langchain_openai import ChatOpenAI
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 
-from config import API_KEY
-from utils.langchain_query_tools import create_prompt
+from config import REDDIT_SUBREDDITS, WEB_SEARCH_MODE
+from http_clients import get_requests_session, openai_client_kwargs
+from tracing import langchain_callbacks, span
+from utils.langchain_query_tools import build_agent_executor, derive_search_query, synthesize_answer
+
+_sources = {}
+_sources_lock = threading.Lock()
 
 # Step 1: Define the function to get the Reddit Search tool
-def get_reddit_tool(client_id, client_secret, user_agent):
+def get_reddit_tool(client_id, client_secret, user_agent, session=None):
+    """
+    With session (e.g. the shared pooled requests session), praw sends its requests through it.
+    """
     reddit_tool = RedditSearchRun(
         api_wrapper=RedditSearchAPIWrapper(
             reddit_client_id=client_id,
@@ -24,35 +29,21 @@ def get_reddit_tool(client_id, client_secret, user_agent):
             reddit_user_agent=user_agent,
         )
     )
+    if session is not None:
+        import praw
+
+        reddit_tool.api_wrapper.reddit_client = praw.Reddit(
+            client_id=client_id,
+            client_secret=client_secret,
+            user_agent=user_agent,
+            requestor_kwargs={"session": session},
+        )
     return reddit_tool
 
-# Step 2: Define the function to handle queries and tool execution
-def run_query_with_action_handling(openai_api_key, prompt, memory, tools, input_text):
+def handle_agent_response(response, tools):
     """
-    This function handles the query and tool execution.
-    Args:
-        openai_api_key (str): The OpenAI API key.
-        prompt (BasePromptTemplate): The prompt template for the LLM.
-        memory (ConversationBufferMemory): The conversation memory.
-        tools (list): List of available tools.
-        input_text (str): The input text for the query.
-
-    Returns:
-        str: The response from the agent, which may include tool execution results.
+    Return the agent's answer, with the search result when the agent requested a search.
     """
-    print("Running query with action handling")
-
-    llm = ChatOpenAI(temperature=0, openai_api_key=openai_api_key)
-
-    llm_chain = LLMChain(llm=llm, prompt=prompt)
-    agent = StructuredChatAgent(llm_chain=llm_chain, verbose=True, tools=tools)
-    agent_chain = AgentExecutor.from_agent_and_tools(
-        agent=agent, verbose=True, memory=memory, tools=tools
-    )
-
-    # Invoke the agent chain with the memory being passed into the input
-    response = agent_chain.invoke({"input": input_text})
-    
     # Check if the response contains an action
     if "actions" in response:
         actions = response["actions"]
@@ -70,8 +61,74 @@ def run_query_with_action_handling(openai_api_key, prompt, memory, tools, input_
     # If no action, just return the agent's regular response
     return response['output']
 
-# Step 3: Modify the main function to accept query text or a file
-def query_reddit(openai_api_key, reddit_client_id, reddit_client_secret, reddit_user_agent, query_text=None, file_path=None):
+def search_and_synthesize(llm, reddit_tool, input_text, subreddit=REDDIT_SUBREDDITS):
+    """
+    Run one Reddit search with a locally derived query, then answer with one LLM call.
+    """
+    search_query = derive_search_query(input_text, suffix="")
+    print(f"Searching r/{subreddit} for: {search_query}")
+    with span("tool_call", source="reddit", tool=reddit_tool.name) as trace:
+        search_result = reddit_tool.run({
+            "query": search_query,
+            "sort": "relevance",
+            "time_filter": "all",
+            "subreddit": subreddit,
+            "limit": "5",
+        })
+        trace.set(result_chars=len(search_result))
+    return synthesize_answer(llm, input_text, search_result, "Reddit")
+
+class RedditSource:
+    """
+    Long-lived Reddit Search source.
+    Builds the Reddit client, LLM client and agent executor once and serves
+    many queries. The executor has no memory, so concurrent queries share
+    no per-request state. HTTP goes through the shared connection pools.
+    """
+
+    def __init__(self, openai_api_key, reddit_client_id, reddit_client_secret, reddit_user_agent):
+        self.openai_api_key = openai_api_key
+        self.reddit_client_id = reddit_client_id
+        self.reddit_client_secret = reddit_client_secret
+        self.reddit_user_agent = reddit_user_agent
+        self.tool = None
+        self.llm = None
+        self.agent_executor = None
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        with self._lock:
+            if self.tool is None:
+                self.llm = ChatOpenAI(temperature=0, openai_api_key=self.openai_api_key, **openai_client_kwargs())
+                tool = get_reddit_tool(
+                    self.reddit_client_id, self.reddit_client_secret, self.reddit_user_agent,
+                    session=get_requests_session())
+                self.agent_executor = build_agent_executor(self.llm, [tool])
+                self.tool = tool
+        return self
+
+    def query(self, input_text, mode=WEB_SEARCH_MODE):
+        self.warm_up()
+        with span("web_query", source="reddit", mode=mode):
+            if mode == "direct":
+                return search_and_synthesize(self.llm, self.tool, input_text)
+            response = self.agent_executor.invoke(
+                {"input": input_text, "chat_history": ""},
+                config={"callbacks": langchain_callbacks(source="reddit")})
+            return handle_agent_response(response, [self.tool])
+
+def get_reddit_source(openai_api_key, reddit_client_id, reddit_client_secret, reddit_user_agent):
+    """
+    Return the shared RedditSource for these credentials, creating it on first use.
+    """
+    key = (openai_api_key, reddit_client_id, reddit_client_secret, reddit_user_agent)
+    with _sources_lock:
+        if key not in _sources:
+            _sources[key] = RedditSource(openai_api_key, reddit_client_id, reddit_client_secret, reddit_user_agent)
+        return _sources[key]
+
+# Step 2: Modify the main function to accept query text or a file
+def query_reddit(openai_api_key, reddit_client_id, reddit_client_secret, reddit_user_agent, query_text=None, file_path=None, mode=WEB_SEARCH_MODE):
     """
     This function handles the query and tool execution.
     Args:
@@ -81,6 +138,8 @@ def query_reddit(openai_api_key, reddit_client_id, reddit_client_secret, reddit_
         reddit_user_agent (str): The Reddit user agent.
         query_text (str): The text query to be used.
         file_path (str): Path to the file containing the query.
+        mode (str): "direct" to search once and make a single LLM call,
+            "agent" to let a StructuredChatAgent drive the search tool.
 
     Returns:
         str: The response from the agent, which may include tool execution results.
@@ -94,29 +153,11 @@ def query_reddit(openai_api_key, reddit_client_id, reddit_client_secret, reddit_
     else:
         raise ValueError("Either query_text or file_path must be provided.")
 
-    # Get the Reddit Search tool
-    reddit_tool = get_reddit_tool(reddit_client_id, reddit_client_secret, reddit_user_agent)
-    
-    tools = [reddit_tool]  # Add more tools here if needed
-    
-    # Memory for the conversation to persist across inputs
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-    
-    # Generate prompt for the current input with memory included
-    prompt, _ = create_prompt(input_text, tools, openai_api_key)
-
-    # Get the agent's response, handling tools/actions if needed
-    response = run_query_with_action_handling(
-        openai_api_key,
-        prompt,
-        memory,
-        tools,
-        input_text
-    )
-    
-    return response
+    # Reuse the Reddit client, LLM client and agent built for these credentials
+    source = get_reddit_source(openai_api_key, reddit_client_id, reddit_client_secret, reddit_user_agent)
+    return source.query(input_text, mode=mode)
 
-# Step 4: Optionally, allow command line usage
+# Step 3: Optionally, allow command line usage
 if __name__ == "__main__":
     import argparse
 
@@ -133,6 +174,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Query Reddit with a string or file.")
     parser.add_argument("--query_text", type=str, help="The text query to be used.")
     parser.add_argument("--file_path", type=str, help="Path to the file containing the query.")
+    parser.add_argument("--mode", choices=("direct", "agent"), default=WEB_SEARCH_MODE, help="Search directly or through the agent.")
 
     args = parser.parse_args()
 
@@ -147,7 +189,8 @@ if __name__ == "__main__":
         reddit_client_secret=REDDIT_CLIENT_SECRET,
         reddit_user_agent=REDDIT_USER_AGENT,
         query_text=args.query_text,
-        file_path=args.file_path
+        file_path=args.file_path,
+        mode=args.mode
     )
 
     # Print the result
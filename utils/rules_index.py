@@ -0,0 +1,387 @@
+import os
+import re
+import json
+
+from rules_parser import parse_rules
+from source_texts import SourceTexts
+from term_matcher import TermMatcher
+
+RULES_INDEX_FILENAME = "rules_index.json"
+RULES_INDEX_VERSION = 4
+
+RULE_REFERENCE_RE = re.compile(r"\b(\d{3}\.\d+[a-z]?)(?![\d])")
+CHAPTER_REFERENCE_RE = re.compile(r"\brules?\s+(\d{3})\b(?!\.\d)", re.IGNORECASE)
+# Keyword actions and keyword abilities
+KEYWORD_CHAPTERS = ("701", "702")
+# Keyword actions distinctive enough to match in questions; generic ones
+# (cast, counter, create, destroy, discard, exile, play, tap, ...) are ordinary game verbs
+MATCHED_KEYWORD_ACTIONS = frozenset((
+    "scry", "mill", "fight", "regenerate", "fateseal", "clash", "planeswalk", "proliferate",
+    "transform", "detain", "populate", "monstrosity", "bolster", "manifest", "investigate",
+    "meld", "goad", "exert", "explore", "surveil", "amass", "venture into the dungeon", "connive",
+))
+# Keyword abilities that are also everyday words ("can it reach the stack", "a storm of
+# triggers"); these only match with a keyword cue, see has_keyword_cue
+COMMON_WORD_KEYWORDS = frozenset((
+    "absorb", "affinity", "amplify", "assist", "awaken", "boast", "champion", "cleave",
+    "companion", "crew", "dash", "decayed", "defender", "demonstrate", "devour", "disturb",
+    "echo", "emerge", "enchant", "encore", "enlist", "epic", "escape", "evolve", "exploit",
+    "fading", "fear", "flash", "forecast", "frenzy", "fuse", "haste", "haunt", "madness",
+    "melee", "menace", "mentor", "miracle", "offering", "overload", "partner", "persist",
+    "protection", "provoke", "rampage", "reach", "rebound", "recover", "reinforce",
+    "replicate", "riot", "ripple", "shadow", "spectacle", "splice", "squad", "storm",
+    "surge", "suspend", "training", "tribute", "visit", "ward", "wither",
+))
+# Words just before ("a creature with reach") or after ("ward cost") that mark a keyword
+KEYWORD_CUES_BEFORE = frozenset(
+    "has have had having with without gains gain gained gaining loses lose lost losing "
+    "grants grant granted keyword keywords its".split()
+)
+KEYWORD_CUES_AFTER = frozenset(
+    "ability abilities keyword cost costs trigger triggers triggered creature creatures".split()
+)
+# Words that may surround a rule number without asking anything beyond its text
+LOOKUP_FILLER = frozenset(
+    "what does do is are the rule rules say says said mean means text of read show me tell "
+    "please and subrule subrules cr comprehensive exactly about quote state states".split()
+)
+# Words that may surround a keyword in a question that only asks what it means
+TERM_LOOKUP_FILLER = LOOKUP_FILLER | frozenset(
+    "how work works keyword keywords ability abilities a an define definition".split()
+)
+
+
+def has_keyword_cue(text, start, end):
+    """
+    Check whether the word at text[start:end] reads as a keyword rather than
+    an everyday word: capitalized mid-sentence ("does Reach stop it"),
+    followed by a number or mana cost ("ward 2", "dash {2}{R}"), or next to
+    a cue word ("has flash", "with reach", "escape cost").
+    """
+    before, after = text[:start], text[end:].lstrip()
+    if text[start].isupper() and re.search(r"[a-z0-9,;]\s+$", before):
+        return True
+    if re.match(r"(\d|\{|x\b)", after, re.IGNORECASE):
+        return True
+    if KEYWORD_CUES_BEFORE.intersection(re.findall(r"[a-z]+", before.lower())[-3:]):
+        return True
+    following = re.match(r"[a-z]+", after.lower())
+    return following is not None and following.group() in KEYWORD_CUES_AFTER
+
+
+def keyword_forms(terms):
+    """
+    Map simple inflections of each keyword to the keyword, e.g. "explores" and
+    "explored" to "explore", so questions phrased with verbs still match.
+    """
+    forms = {}
+    for term in terms:
+        stem = term[:-1] if term.endswith("e") else term
+        for form in (term + "s", term + "es", stem + "ed", stem + "ing"):
+            forms.setdefault(form, term)
+    # Exact keywords win over an inflection of another keyword
+    forms.update({term: term for term in terms})
+    return forms
+
+
+class RulesIndex:
+    """
+    Rule number -> text/offset lookup over the Comprehensive Rules.
+
+    units maps every rule, subrule, chapter and section number (and
+    "glossary:<term>") to its offsets and parent; children lists the
+    direct subrules of each rule, so lookups are plain dict accesses.
+    Unit text is sliced from the memory-mapped rules file by byte offset
+    (see text()); units the file does not slice back to keep their text.
+    references is the cross-reference graph: the rules each unit cites
+    ("see rule 702.19", "as described in rule 608.2").
+    terms maps keyword names (trample, deathtouch, explore, ...) to their
+    Glossary entry and governing rule.
+    """
+
+    def __init__(self, source, units, children, glossary, references, terms,
+                 source_texts=None, source_bytes=None, source_sha256=None):
+        self.source = source
+        self.units = units
+        self.children = children
+        self.glossary = glossary
+        self.references = references
+        self.terms = terms
+        self.source_texts = source_texts
+        self.source_bytes = source_bytes
+        self.source_sha256 = source_sha256
+        self._matcher = None
+
+    @classmethod
+    def build(cls, text, source="", source_texts=None):
+        """
+        Index the rules text. With source_texts, units also get byte offsets
+        into the source file, so save() can leave their text out.
+        """
+        units, children, glossary = {}, {}, {}
+        for unit in parse_rules(text):
+            key = f"glossary:{unit['term']}" if unit["kind"] == "glossary" else unit["rule"]
+            units[key] = {
+                "kind": unit["kind"],
+                "text": unit["text"],
+                "start": unit["start"],
+                "end": unit["end"],
+                "parent_rule": unit["parent_rule"],
+                "title": unit["title"],
+            }
+            if unit["kind"] == "glossary":
+                glossary[unit["term"].lower()] = key
+            elif unit["kind"] in ("rule", "title", "subrule"):
+                children.setdefault(unit["parent_rule"], []).append(key)
+
+        # Cross-references, skipping the unit's own number at the start of its text
+        references = {}
+        for key, unit in units.items():
+            cited = RULE_REFERENCE_RE.findall(unit["text"]) + CHAPTER_REFERENCE_RE.findall(unit["text"])
+            targets = [number for number in dict.fromkeys(cited) if number != key and number in units]
+            if targets:
+                references[key] = targets
+
+        # Keywords: 701.x/702.x titles, plus Glossary terms that point into those chapters
+        terms = {}
+        for key, unit in units.items():
+            if unit["kind"] == "title" and unit["parent_rule"] in KEYWORD_CHAPTERS:
+                term = unit["title"].lower()
+                terms[term] = {"glossary": glossary.get(term, ""), "rule": key}
+        for term, key in glossary.items():
+            keyword_rules = [number for number in references.get(key, []) if number.split(".")[0] in KEYWORD_CHAPTERS]
+            if keyword_rules and re.fullmatch(r"[a-z][a-z '\-]*", term):
+                terms.setdefault(term, {"glossary": key, "rule": keyword_rules[0]})
+
+        source_bytes = source_sha256 = None
+        if source_texts is not None:
+            keys = list(units)
+            located, source_bytes, source_sha256 = source_texts.byte_ranges(
+                source, text, [(units[key]["start"], units[key]["end"]) for key in keys])
+            for key, byte_range in zip(keys, located):
+                if byte_range is not None:
+                    units[key]["byte_start"], units[key]["byte_end"] = byte_range
+        return cls(source, units, children, glossary, references, terms, source_texts, source_bytes, source_sha256)
+
+    def save(self, path):
+        """
+        Write the index to path. Units located in the source file are saved
+        as byte offsets only, the rest with their text.
+        """
+        units = {
+            key: {name: value for name, value in unit.items() if name != "text"} if "byte_start" in unit else unit
+            for key, unit in self.units.items()
+        }
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, RULES_INDEX_FILENAME)
+        with open(index_path + ".tmp", "w") as file:
+            json.dump({
+                "version": RULES_INDEX_VERSION,
+                "source": self.source,
+                "source_bytes": self.source_bytes,
+                "source_sha256": self.source_sha256,
+                "units": units,
+                "children": self.children,
+                "glossary": self.glossary,
+                "references": self.references,
+                "terms": self.terms,
+            }, file)
+        os.replace(index_path + ".tmp", index_path)
+
+    @classmethod
+    def load(cls, path, source_texts=None):
+        """
+        Load a saved index, or return None if path has none (or an outdated one).
+        Unit text saved as offsets is read through source_texts (a new
+        SourceTexts when None).
+        """
+        index_path = os.path.join(path, RULES_INDEX_FILENAME)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "r") as file:
+            data = json.load(file)
+        if data.get("version") != RULES_INDEX_VERSION:
+            return None
+        return cls(
+            data["source"], data["units"], data["children"], data["glossary"], data["references"], data["terms"],
+            source_texts or SourceTexts(), data["source_bytes"], data["source_sha256"])
+
+    def text(self, key):
+        """
+        Return the text of a unit, reading it from the source file if the
+        index was saved without it. Raises ValueError if the file changed.
+        """
+        unit = self.units[key]
+        if "text" in unit:
+            return unit["text"]
+        return self.source_texts.text(
+            self.source, unit["byte_start"], unit["byte_end"], self.source_bytes, self.source_sha256)
+
+    def unit_spans(self, number, max_chars=None):
+        """
+        Return context spans (text, source, offsets, rule) for a rule.
+        Rules (e.g. 702.19) include their lettered subrules, stopping before
+        max_chars when given. With max_chars, chapters (e.g. 702) also list
+        their rules without subrules; otherwise chapters and sections only
+        return their heading.
+        """
+        unit = self.units.get(number)
+        if unit is None:
+            return []
+        keys = [number]
+        if unit["kind"] in ("rule", "title") or (unit["kind"] == "chapter" and max_chars is not None):
+            keys += self.children.get(number, [])
+        spans, size = [], 0
+        for key in keys:
+            child, text = self.units[key], self.text(key)
+            if spans and max_chars is not None and size + len(text) > max_chars:
+                break
+            spans.append({"text": text, "source": self.source, "start": child["start"], "end": child["end"], "rule": key})
+            size += len(text) + 2
+        return spans
+
+    def lookup(self, number, max_chars=None):
+        """
+        Return the text of a rule, or None if it does not exist.
+        Rules (e.g. 702.19) include their lettered subrules, stopping before
+        max_chars when given; chapters and sections only return their heading.
+        """
+        spans = self.unit_spans(number, max_chars=max_chars)
+        if not spans:
+            return None
+        return "\n\n".join(span["text"] for span in spans)
+
+    def lookup_term(self, term):
+        """
+        Return the Glossary entry for a term (case-insensitive), or None.
+        """
+        key = self.glossary.get(term.lower())
+        return self.text(key) if key else None
+
+    def find_references(self, query_text):
+        """
+        Return the rule numbers mentioned in query_text that exist in the index, in order.
+        """
+        references = []
+        for match in RULE_REFERENCE_RE.finditer(query_text):
+            references.append(match.group(1))
+        for match in CHAPTER_REFERENCE_RE.finditer(query_text):
+            references.append(match.group(1))
+        return [number for number in dict.fromkeys(references) if number in self.units]
+
+    def is_fully_resolved(self, query_text):
+        """
+        Check whether the query asks for nothing beyond the rules it cites,
+        e.g. "what does 702.19c say", and every cited rule exists.
+        A bare chapter ("rule 702") is never resolved: its heading says nothing.
+        """
+        cited = RULE_REFERENCE_RE.findall(query_text) + CHAPTER_REFERENCE_RE.findall(query_text)
+        if not cited or any(number not in self.units for number in cited):
+            return False
+        if any(self.units[number]["kind"] in ("chapter", "section") for number in cited):
+            return False
+        remainder = RULE_REFERENCE_RE.sub(" ", query_text)
+        remainder = CHAPTER_REFERENCE_RE.sub(" ", remainder)
+        words = re.findall(r"[a-z]+", remainder.lower())
+        return all(word in LOOKUP_FILLER for word in words)
+
+    def expand(self, keys, max_hops=1, max_tokens=500):
+        """
+        Follow cross-references from the given rule keys breadth-first.
+        Returns the keys of referenced rules (not including the seeds) in
+        visiting order, up to max_hops away; rules whose text no longer fits
+        in roughly max_tokens are skipped. Chapter and section headings are not added.
+        """
+        seen = set(keys)
+        frontier = [key for key in keys if key in self.units]
+        expanded = []
+        budget = max_tokens * 4  # ~4 characters per token
+        for _ in range(max_hops):
+            next_frontier = []
+            for key in frontier:
+                for target in self.references.get(key, []):
+                    if target in seen:
+                        continue
+                    seen.add(target)
+                    next_frontier.append(target)
+                    if self.units[target]["kind"] in ("chapter", "section"):
+                        continue
+                    size = len(self.lookup(target))
+                    if size > budget:
+                        continue
+                    budget -= size
+                    expanded.append(target)
+            frontier = next_frontier
+        return expanded
+
+    def matched_terms(self):
+        """
+        Return the keywords find_terms looks for: keyword abilities (702),
+        the keyword actions in MATCHED_KEYWORD_ACTIONS, and Glossary entries
+        that contain a word of one of those names (e.g. "megamorph" for
+        morph), so plain words such as "day" or "face up" are left out.
+        """
+        names = {}
+        for term, entry in self.terms.items():
+            unit = self.units.get(entry["rule"].rstrip("abcdefghijklmnopqrstuvwxyz"), {})
+            if unit.get("kind") != "title":
+                continue
+            name = unit["title"].lower()
+            if unit["parent_rule"] == "702" or name in MATCHED_KEYWORD_ACTIONS:
+                names[term] = name
+        return [
+            term for term, name in names.items()
+            if term == name or any(len(word) > 3 and word in term for word in re.findall(r"[a-z]+", name))
+        ]
+
+    def term_spans(self, query_text):
+        """
+        Return (start, end, keyword) for each keyword mentioned in query_text,
+        using one Aho-Corasick pass. Only matched_terms() are looked for, and
+        COMMON_WORD_KEYWORDS only where has_keyword_cue says so.
+        """
+        if self._matcher is None:
+            self._matcher = TermMatcher(keyword_forms(self.matched_terms()))
+        return [
+            (start, end, term) for start, end, term in self._matcher.find_spans(query_text)
+            if term not in COMMON_WORD_KEYWORDS or has_keyword_cue(query_text, start, end)
+        ]
+
+    def find_terms(self, query_text):
+        """
+        Return the keywords mentioned in query_text, in order of appearance.
+        define() still covers every keyword, matched or not.
+        """
+        return list(dict.fromkeys(term for _start, _end, term in self.term_spans(query_text)))
+
+    def is_term_lookup(self, query_text):
+        """
+        Check whether the query asks for nothing beyond what its keywords
+        mean, e.g. "how does trample work", so their definitions answer it.
+        """
+        spans = self.term_spans(query_text)
+        if not spans:
+            return False
+        remainder, last_end = [], 0
+        for start, end, _term in spans:
+            remainder.append(query_text[last_end:start])
+            last_end = end
+        remainder.append(query_text[last_end:])
+        words = re.findall(r"[a-z]+", " ".join(remainder).lower())
+        return all(word in TERM_LOOKUP_FILLER for word in words)
+
+    def define_spans(self, term, max_chars=1200):
+        """
+        Return context spans for a keyword's Glossary entry and governing rule.
+        """
+        entry = self.terms[term]
+        spans = self.unit_spans(entry["glossary"]) if entry["glossary"] else []
+        if entry["rule"]:
+            spans += self.unit_spans(entry["rule"], max_chars=max_chars)
+        return spans
+
+    def define(self, term, max_chars=1200):
+        """
+        Return the Glossary entry and governing rule for a keyword as one text block.
+        """
+        return "\n\n".join(span["text"] for span in self.define_spans(term, max_chars=max_chars))
@@ -0,0 +1,182 @@
+import os
+import re
+import sys
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+RULES_HEADER = "Magic: The Gathering Comprehensive Rules"
+
+SECTION_RE = re.compile(r"^(\d)\. (.+)$")
+CHAPTER_RE = re.compile(r"^(\d{3})\. (.+)$")
+# Tolerates the few malformed numbers in the source, e.g. "119.1d." and "606.5 If"
+RULE_RE = re.compile(r"^(\d{3}\.\d+)([a-z]?)\.?\s*(.*)$")
+TITLE_END = ('.', ':', ')', '”', '"', '!', '?')
+
+
+def is_rules_document(document: "Document"):
+    """
+    Check whether a document is the Comprehensive Rules text.
+    """
+    return document.page_content.lstrip().startswith(RULES_HEADER)
+
+
+def iter_lines(text):
+    """
+    Yield (start, end, line) for every line in text, with end excluding the newline.
+    """
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.rstrip("\r\n")
+        yield offset, offset + len(stripped), stripped
+        offset += len(line)
+
+
+def parse_rules(text):
+    """
+    Parse the Comprehensive Rules into logical units.
+
+    Yields one dict per section, chapter, rule, subrule and glossary entry with
+    keys kind, rule, parent_rule, section, section_title, title, text, start and end.
+    start/end are character offsets into text, so text[start:end] == unit["text"].
+    Example lines and wrapped continuation lines belong to the unit above them.
+    """
+    lines = list(iter_lines(text))
+
+    # The table of contents lists the same headings; the body starts after its "Credits" line
+    body_start = 0
+    for index, (_, _, line) in enumerate(lines):
+        if line.strip() == "Credits":
+            body_start = index + 1
+            break
+
+    section, section_title, chapter_title, rule_title = "", "", "", ""
+    current = None
+    in_glossary = False
+
+    def close(unit):
+        if unit is not None:
+            unit["text"] = text[unit["start"]:unit["end"]]
+            return unit
+        return None
+
+    for start, end, line in lines[body_start:]:
+        stripped = line.strip()
+
+        if in_glossary:
+            if stripped == "Credits":
+                break
+            if not stripped:
+                if current is not None:
+                    yield close(current)
+                    current = None
+                continue
+            if current is None:
+                current = {
+                    "kind": "glossary", "rule": "", "parent_rule": "", "term": stripped,
+                    "section": "Glossary", "section_title": "Glossary", "title": stripped,
+                    "start": start, "end": end,
+                }
+            else:
+                current["end"] = end
+            continue
+
+        if not stripped:
+            continue
+
+        if stripped == "Glossary":
+            unit = close(current)
+            if unit is not None:
+                yield unit
+            current = None
+            in_glossary = True
+            continue
+
+        match = SECTION_RE.match(stripped)
+        if match:
+            unit = close(current)
+            if unit is not None:
+                yield unit
+            section, section_title = match.group(1), match.group(2)
+            current = {
+                "kind": "section", "rule": section, "parent_rule": "",
+                "section": section, "section_title": section_title, "title": section_title,
+                "start": start, "end": end,
+            }
+            continue
+
+        match = CHAPTER_RE.match(stripped)
+        if match:
+            unit = close(current)
+            if unit is not None:
+                yield unit
+            chapter_title = match.group(2)
+            current = {
+                "kind": "chapter", "rule": match.group(1), "parent_rule": section,
+                "section": section, "section_title": section_title, "title": chapter_title,
+                "start": start, "end": end,
+            }
+            continue
+
+        match = RULE_RE.match(stripped)
+        if match:
+            unit = close(current)
+            if unit is not None:
+                yield unit
+            number, letter, body = match.groups()
+            if letter:
+                current = {
+                    "kind": "subrule", "rule": number + letter, "parent_rule": number,
+                    "section": section, "section_title": section_title, "title": rule_title,
+                    "start": start, "end": end,
+                }
+            else:
+                # Rules such as "702.19. Trample" only name the subrules below them
+                is_title = len(body) <= 80 and not body.endswith(TITLE_END)
+                rule_title = body if is_title else chapter_title
+                current = {
+                    "kind": "title" if is_title else "rule", "rule": number,
+                    "parent_rule": number.split(".")[0],
+                    "section": section, "section_title": section_title, "title": rule_title,
+                    "start": start, "end": end,
+                }
+            continue
+
+        # Examples and wrapped lines continue the current unit
+        if current is not None:
+            current["end"] = end
+
+    unit = close(current)
+    if unit is not None:
+        yield unit
+
+
+def split_rules(document: "Document"):
+    """
+    Split the Comprehensive Rules into one chunk per rule, subrule and glossary entry.
+    Headings only contribute metadata, so chunks never overlap.
+    """
+    from langchain.schema import Document
+
+    chunks = []
+    for unit in parse_rules(document.page_content):
+        if unit["kind"] in ("section", "chapter", "title"):
+            continue
+        metadata = dict(document.metadata)
+        metadata.update({
+            "kind": unit["kind"],
+            "rule": unit["rule"],
+            "parent_rule": unit["parent_rule"],
+            "section": unit["section"],
+            "section_title": unit["section_title"],
+            "title": unit["title"],
+            "start_index": unit["start"],
+            "end_index": unit["end"],
+        })
+        if unit["kind"] == "glossary":
+            metadata["term"] = unit["term"]
+        chunks.append(Document(page_content=unit["text"], metadata=metadata))
+    return chunks
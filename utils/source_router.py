@@ -0,0 +1,36 @@
+import re
+
+ROUTING_POLICIES = ("always", "never", "on_low_confidence")
+WEB_SOURCES = ("google", "reddit")
+
+# Questions the Comprehensive Rules cannot answer on their own: card
+# legality, Oracle wording and rulings, sets, prices and community opinion
+WEB_CUE_RE = re.compile(
+    r"\b(banned|bans?|legal(ity)?|errata|oracle|rulings?|rotat(e|es|ion)|standard|modern|pioneer|"
+    r"commander legal|released?|spoilers?|previews?|prices?|cost to buy|tournaments?|reddit|latest|newest|new set)\b",
+    re.IGNORECASE,
+)
+
+
+def route_sources(query_text, policy="always", confidence=None, threshold=0.8):
+    """
+    Decide which sources to query.
+    policy is "always" (RAG and web), "never" (RAG only) or
+    "on_low_confidence": the web sources run only when the question has web
+    cues (legality, Oracle text, sets, ...) or the best rules retrieval score
+    (confidence) is below threshold.
+    Returns (sources, reason).
+    """
+    if policy not in ROUTING_POLICIES:
+        raise ValueError(f"Unknown routing policy: {policy}")
+    if policy == "always":
+        return ("rag",) + WEB_SOURCES, "policy is always"
+    if policy == "never":
+        return ("rag",), "policy is never"
+
+    cue = WEB_CUE_RE.search(query_text)
+    if cue:
+        return ("rag",) + WEB_SOURCES, f"question mentions '{cue.group(0)}'"
+    if confidence is None or confidence < threshold:
+        return ("rag",) + WEB_SOURCES, f"rules confidence {confidence or 0.0:.2f} < {threshold:.2f}"
+    return ("rag",), f"rules confidence {confidence:.2f} >= {threshold:.2f}"
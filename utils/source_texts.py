@@ -0,0 +1,134 @@
+import os
+import mmap
+import hashlib
+import threading
+import numpy as np
+
+# Relative source paths in the store are relative to the repository root
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+
+def byte_offsets(text):
+    """
+    Return an int64 array where entry i is the UTF-8 byte offset of character i
+    (with one extra entry for len(text)), so character offsets convert in O(1).
+    """
+    codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    widths = 1 + (codepoints >= 0x80) + (codepoints >= 0x800) + (codepoints >= 0x10000)
+    offsets = np.zeros(len(codepoints) + 1, dtype=np.int64)
+    np.cumsum(widths, out=offsets[1:])
+    return offsets
+
+
+class SourceTexts:
+    """
+    Read-only memory maps of the indexed source files.
+
+    Chunks indexed without their text carry byte_start/byte_end (and the
+    source's size and SHA-256) in their metadata; their text is sliced from
+    the mapped file when a query needs it. Maps are opened once and shared
+    between threads; relative source paths are resolved against root.
+    """
+
+    def __init__(self, root=REPO_ROOT):
+        self.root = root
+        self._maps = {}
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def path(self, source):
+        return os.path.join(self.root, source)
+
+    def _map(self, source):
+        with self._lock:
+            if source not in self._maps:
+                with open(self.path(source), "rb") as file:
+                    size = os.fstat(file.fileno()).st_size
+                    self._maps[source] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            return self._maps[source]
+
+    def _hash(self, source, data):
+        # Hashed once per source, on its first read
+        with self._lock:
+            if source not in self._hashes:
+                self._hashes[source] = hashlib.sha256(data).hexdigest()
+            return self._hashes[source]
+
+    def text(self, source, byte_start, byte_end, source_bytes=None, source_sha256=None):
+        """
+        Return the text between two byte offsets of a source file.
+        Raises ValueError if the file changed since it was indexed.
+        """
+        data = self._map(source)
+        if (source_bytes is not None and len(data) != source_bytes) or (
+                source_sha256 is not None and self._hash(source, data) != source_sha256):
+            raise ValueError(f"{source} changed since it was indexed; re-run create_database_rag.py.")
+        return data[byte_start:byte_end].decode("utf-8")
+
+    def byte_ranges(self, source, text, ranges):
+        """
+        Map (start, end) character offsets into text, the content of source,
+        to (byte_start, byte_end) offsets into the file, or None where the
+        file does not slice back to exactly text[start:end].
+        Returns (byte_ranges, source_bytes, source_sha256); every range is
+        None when the file is missing.
+        """
+        if not source or not os.path.isfile(self.path(source)):
+            return [None] * len(ranges), None, None
+        offsets = byte_offsets(text)
+        data = self._map(source)
+        located = []
+        for start, end in ranges:
+            if start < 0 or end > len(text):
+                located.append(None)
+                continue
+            byte_start, byte_end = int(offsets[start]), int(offsets[end])
+            matches = data[byte_start:byte_end] == text[start:end].encode("utf-8")
+            located.append((byte_start, byte_end) if matches else None)
+        return located, len(data), self._hash(source, data)
+
+    def locate(self, document, chunks):
+        """
+        Add byte_start/byte_end/source_bytes/source_sha256 to chunks split from
+        document when the file on disk slices back to exactly the chunk text.
+        Returns the number of chunks located; the rest keep their text in the store.
+        """
+        text = document.page_content
+        ranges = []
+        for chunk in chunks:
+            start = chunk.metadata.get("start_index", -1)
+            end = chunk.metadata.get("end_index", start + len(chunk.page_content))
+            ranges.append((start, end) if text[start:end] == chunk.page_content else (-1, -1))
+        located, source_bytes, source_sha256 = self.byte_ranges(document.metadata.get("source", ""), text, ranges)
+        count = 0
+        for chunk, byte_range in zip(chunks, located):
+            if byte_range is None:
+                continue
+            chunk.metadata.update({
+                "byte_start": byte_range[0],
+                "byte_end": byte_range[1],
+                "source_bytes": source_bytes,
+                "source_sha256": source_sha256,
+            })
+            count += 1
+        return count
+
+    def hydrate(self, documents):
+        """
+        Fill in page_content of documents stored without text. Returns documents.
+        """
+        for document in documents:
+            metadata = document.metadata
+            if not document.page_content and "byte_start" in metadata:
+                document.page_content = self.text(
+                    metadata["source"], metadata["byte_start"], metadata["byte_end"],
+                    metadata.get("source_bytes"), metadata.get("source_sha256"))
+        return documents
+
+    def close(self):
+        with self._lock:
+            for data in self._maps.values():
+                if isinstance(data, mmap.mmap):
+                    data.close()
+            self._maps = {}
+            self._hashes = {}
@@ -0,0 +1,81 @@
+from collections import deque
+
+
+class TermMatcher:
+    """
+    Aho-Corasick matcher for a fixed set of terms.
+
+    Finds every whole-word, case-insensitive occurrence of any term in one
+    pass over the text, regardless of how many terms there are. terms may be
+    a dict mapping each pattern (e.g. an inflected form) to the term it reports.
+    """
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.labels = dict(terms) if isinstance(terms, dict) else {term: term for term in terms}
+        self.labels = {pattern.lower(): label for pattern, label in self.labels.items()}
+        for pattern in self.labels:
+            self._add(pattern)
+        self._link()
+
+    def _add(self, term):
+        state = 0
+        for char in term:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(term)
+
+    def _link(self):
+        # Children of the root fail back to the root; deeper states inherit
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """
+        Return the matched terms in order of appearance.
+        Overlapping matches resolve to the longest one, e.g. "trample over
+        planeswalkers" wins over "trample".
+        """
+        return list(dict.fromkeys(term for _start, _end, term in self.find_spans(text)))
+
+    def find_spans(self, text):
+        """
+        Return (start, end, term) for every match find() keeps, so callers
+        can look at the words around it. Repeated terms are all listed.
+        """
+        text = text.lower()
+        matches = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for term in self.output[state]:
+                start, end = index - len(term) + 1, index + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    matches.append((start, end, term))
+
+        # Keep the longest non-overlapping matches, left to right
+        matches.sort(key=lambda match: (match[0], -(match[1] - match[0])))
+        found, last_end = [], -1
+        for start, end, term in matches:
+            if start >= last_end:
+                found.append((start, end, self.labels[term]))
+                last_end = end
+        return found
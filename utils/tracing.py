@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import tempfile
+import uuid
+import atexit
+import threading
+import contextvars
+
+TRACE_PATH = os.getenv("TRACE_PATH", "") # JSONL file of finished spans, empty disables
+METRICS_PATH = os.getenv("METRICS_PATH", "") # Prometheus text file, empty disables
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5")) # seconds between metrics file rewrites
+# TRACING=1 keeps metrics in memory (e.g. for the server's /metrics) without writing files
+ENABLED = bool(TRACE_PATH or METRICS_PATH or os.getenv("TRACING", "") not in ("", "0"))
+
+METRIC_PREFIX = "judgebot_"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Span attributes that become metric labels; everything else only goes to the trace
+LABEL_KEYS = ("source", "tool", "backend", "namespace", "mode")
+
+_current = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_export_lock = threading.Lock() # one metrics file rewrite at a time
+_histograms = {}
+_counters = {}
+_trace_file = None
+_metrics_written = 0.0
+
+
+class _NoopSpan:
+    """
+    Stand-in returned while tracing is disabled; every method does nothing.
+    """
+
+    def set(self, **attributes):
+        return self
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    A timed operation. Used as a context manager it becomes the parent of
+    spans opened inside it (in this thread or a copied context); started
+    with start_span() it must be end()ed explicitly.
+    """
+
+    def __init__(self, name, attributes, parent=None):
+        parent = parent or _current.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = None
+        self._ended = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def end(self):
+        if not self._ended:
+            self._ended = True
+            _record(self, time.perf_counter() - self._started)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        self.end()
+        return False
+
+
+def span(name, **attributes):
+    """
+    Context manager timing a block, e.g. `with span("vector_search", k=4) as s: ...; s.set(hits=3)`.
+    Returns a shared no-op when tracing is disabled.
+    """
+    if not ENABLED:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    Start a span that is ended explicitly, e.g. from callbacks.
+    """
+    if not ENABLED:
+        return NOOP_SPAN
+    return Span(name, attributes, parent=parent)
+
+
+def current_span():
+    """
+    Return the innermost open span, so callees can add attributes to it.
+    """
+    return (_current.get() if ENABLED else None) or NOOP_SPAN
+
+
+def propagate(fn, parent=None):
+    """
+    Wrap fn to run in the caller's tracing context (or under parent) when
+    called from another thread, e.g. an executor worker. Each wrapper must
+    not run on two threads at once.
+    """
+    if not ENABLED:
+        return fn
+    context = contextvars.copy_context()
+    if parent is not None:
+        context.run(_current.set, parent)
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def count(name, value=1, **labels):
+    """
+    Add value to a counter, e.g. count("answer_cache_lookups_total", result="hit").
+    """
+    if not ENABLED or not value:
+        return
+    key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def message_usage(message):
+    """
+    Return {"prompt_tokens": ..., "completion_tokens": ...} from a LangChain chat
+    message or an LLMResult's llm_output, or {} when the provider sent none.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return {"prompt_tokens": usage.get("input_tokens", 0), "completion_tokens": usage.get("output_tokens", 0)}
+    metadata = getattr(message, "response_metadata", None) or (message if isinstance(message, dict) else {})
+    usage = metadata.get("token_usage") or {}
+    if not usage:
+        return {}
+    return {"prompt_tokens": usage.get("prompt_tokens", 0), "completion_tokens": usage.get("completion_tokens", 0)}
+
+
+def record_tokens(span, message, **labels):
+    """
+    Attach the token counts of an LLM response to span and to the token counters.
+    """
+    if not ENABLED:
+        return
+    usage = message_usage(message)
+    span.set(**usage)
+    for kind, tokens in usage.items():
+        count("llm_tokens_total", tokens, kind=kind.split("_")[0], **labels)
+
+
+def _record(span, seconds):
+    global _trace_file
+    labels = (("span", span.name),) + tuple(
+        (key, str(span.attributes[key])) for key in LABEL_KEYS if key in span.attributes)
+    line = None
+    if TRACE_PATH:
+        line = json.dumps({
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "start": round(span.start, 6),
+            "duration_ms": round(1000 * seconds, 3),
+            "attributes": span.attributes,
+        }, default=str)
+    with _lock:
+        histogram = _histograms.get(labels)
+        if histogram is None:
+            histogram = _histograms[labels] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                histogram[0][index] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+        if "error" in span.attributes:
+            key = ("span_errors_total", labels)
+            _counters[key] = _counters.get(key, 0) + 1
+        if line is not None:
+            try:
+                if _trace_file is None:
+                    _trace_file = open(TRACE_PATH, "a", buffering=1)
+                _trace_file.write(line + "\n")
+            except OSError as e:
+                # Exporting must never fail the traced operation
+                print(f"Could not write trace to {TRACE_PATH}: {e}")
+    if METRICS_PATH and time.monotonic() - _metrics_written >= METRICS_INTERVAL:
+        write_metrics()
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def metrics_text():
+    """
+    Render span durations and counters in the Prometheus text exposition format.
+    """
+    with _lock:
+        histograms = {labels: (list(buckets), total, number) for labels, (buckets, total, number) in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    name = METRIC_PREFIX + "span_duration_seconds"
+    if histograms:
+        lines += [f"# HELP {name} Duration of traced operations.", f"# TYPE {name} histogram"]
+    for labels, (buckets, total, number) in sorted(histograms.items()):
+        for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {bucket_count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {number}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {number}")
+
+    typed = set()
+    for (counter, labels), value in sorted(counters.items()):
+        name = METRIC_PREFIX + counter
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def write_metrics(path=None):
+    """
+    Atomically rewrite the metrics file (METRICS_PATH by default).
+    I/O errors are printed, never raised, since this runs as spans end.
+    """
+    global _metrics_written
+    path = path or METRICS_PATH
+    if not path:
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    with _export_lock:
+        _metrics_written = time.monotonic()
+        temp_path = None
+        try:
+            # A unique temp file, so another process exporting to path never renames ours away
+            with tempfile.NamedTemporaryFile("w", dir=directory, prefix=os.path.basename(path) + ".",
+                                             suffix=".tmp", delete=False) as file:
+                temp_path = file.name
+                file.write(metrics_text())
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {e}")
+            if temp_path is not None and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+
+def flush():
+    """
+    Write the metrics file and close the trace file; called at exit.
+    """
+    global _trace_file
+    if METRICS_PATH:
+        write_metrics()
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+
+
+atexit.register(flush)
+
+
+_callback_handler_class = None
+
+
+def langchain_callbacks(**labels):
+    """
+    Callback handlers that trace a LangChain agent run: one span per agent
+    step (from the chosen action to its tool's result), per tool call and
+    per LLM call, with token counts. [] when tracing is disabled.
+    Pass as config={"callbacks": langchain_callbacks(source="google")}.
+    """
+    global _callback_handler_class
+    if not ENABLED:
+        return []
+    if _callback_handler_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class TracingCallbackHandler(BaseCallbackHandler):
+            def __init__(self, labels):
+                self.labels = labels
+                self.parent = _current.get()
+                self.spans = {}
+
+            def _start(self, key, name, parent=None, **attributes):
+                self.spans[key] = start_span(name, parent=parent or self.parent, **self.labels, **attributes)
+
+            def _end(self, key, error=None):
+                span = self.spans.pop(key, None)
+                if span is not None:
+                    if error is not None:
+                        span.set(error=str(error))
+                    span.end()
+
+            def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+                self._start(run_id, "llm_call")
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                self._start(run_id, "llm_call")
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                span = self.spans.get(run_id)
+                if span is not None:
+                    record_tokens(span, response.llm_output or {}, **self.labels)
+                self._end(run_id)
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._end(run_id, error)
+
+            def on_agent_action(self, action, *, run_id, **kwargs):
+                count("agent_steps_total", **self.labels)
+                self._start(("step", run_id), "agent_step", tool=action.tool)
+
+            def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+                step = self.spans.get(("step", parent_run_id))
+                self._start(run_id, "tool_call", parent=step, tool=(serialized or {}).get("name", ""))
+
+            def on_tool_end(self, output, *, run_id, parent_run_id=None, **kwargs):
+                self._end(run_id)
+                self._end(("step", parent_run_id))
+
+            def on_tool_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+                self._end(run_id, error)
+                self._end(("step", parent_run_id), error)
+
+        _callback_handler_class = TracingCallbackHandler
+    return [_callback_handler_class(labels)]